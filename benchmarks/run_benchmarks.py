@@ -0,0 +1,152 @@
+import argparse
+import json
+import platform
+import subprocess
+from datetime import datetime
+from os import makedirs, path
+from tempfile import TemporaryDirectory
+
+from benchmarks.synthetic_data import SyntheticDataGenerator
+from libs.data_model import COLUMN_LEVEL_SEPARATOR, AnchorDataframe, NorthStarDataframe, SalesForceDataframe, \
+    AnchorNorthstarDataframe, AnchorSalesforceAccountsDataframe, AnchorSalesforceContactsDataframe
+from libs.metrics import metrics
+from libs.utils import save_dataframes_to_excel
+
+# metrics spans making up benchmark stages
+STAGE_SPANS = {
+    'load': ['load_anchor', 'load_northstar', 'load_salesforce', 'salesforce_tables'],
+    'anchor_northstar_join': ['anchor_northstar_join'],
+    'salesforce_id_join': ['salesforce_id_join'],
+    'license_key_join': ['license_key_join'],
+    'normalized_name_join': ['normalized_name_join'],
+    'fuzzy_join': ['fuzzy_join'],
+    'accounts_finalize': ['accounts_finalize'],
+    'contacts_join': ['contacts_join', 'contacts_name_fuzzy_join'],
+    'excel_export': ['export'],
+}
+
+
+def run_benchmark(filepaths, threshold, workers):
+    """
+    Run reconciliation stage by stage in the current process
+
+    :param filepaths: paths to workbooks, see `SyntheticDataGenerator.generate`
+    :param threshold: account name match ratio threshold
+    :param workers: number of worker processes for name fuzzy matching
+    :return: dictionary of stage durations in seconds and dictionary of row counts
+    """
+    metrics.pop_spans()
+    anchor = AnchorDataframe(filepaths['anchor'])
+    northstar = NorthStarDataframe(filepaths['northstar'])
+    salesforce = SalesForceDataframe(filepaths['salesforce'])
+    anchor_ns = AnchorNorthstarDataframe(anchor, northstar)
+    accounts = AnchorSalesforceAccountsDataframe(anchor_ns, salesforce, threshold, workers)
+    contacts = AnchorSalesforceContactsDataframe(anchor_ns, salesforce)
+    with metrics.span('export'), TemporaryDirectory() as tmp_dirpath:
+        save_dataframes_to_excel(path.join(tmp_dirpath, 'result.xlsx'),
+                                 {'Accounts': accounts.df, 'Contacts': contacts.df}, wrap_text=False,
+                                 column_separator=COLUMN_LEVEL_SEPARATOR)
+    durations = {}
+    for span in metrics.pop_spans():
+        durations[span.name] = durations.get(span.name, 0) + span.duration
+    rows = {'anchor': len(anchor.df), 'northstar': len(northstar.df), 'salesforce': len(salesforce.df),
+            'anchor_northstar': len(anchor_ns.df), 'accounts': len(accounts.df), 'contacts': len(contacts.df)}
+    # optional stages (e.g. contacts name fuzzy join) may not run
+    return {stage: sum(durations.get(s, 0) for s in spans) for stage, spans in STAGE_SPANS.items()}, rows
+
+
+def get_git_commit():
+    """
+    :return: commit of the working tree or None if it is unknown
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=path.dirname(path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(results, baseline, tolerance, min_difference=0.05):
+    """
+    Compare stage durations with baseline ones
+
+    :param results: benchmark results
+    :param baseline: benchmark results to compare with
+    :param tolerance: allowed relative slowdown, e.g. 0.1 - 10%
+    :param min_difference: slowdowns less than this number of seconds are ignored
+    :return: list of report lines and list of regressions
+    """
+    baseline_runs = {r['rows']: r for r in baseline['runs']}
+    lines, regressions = [], []
+    for run in results['runs']:
+        baseline_run = baseline_runs.get(run['rows'])
+        if baseline_run is None:
+            continue
+        for stage in STAGE_SPANS:
+            duration, baseline_duration = run['stages'].get(stage), baseline_run['stages'].get(stage)
+            if duration is None or baseline_duration is None:
+                continue
+            change = (duration - baseline_duration) / baseline_duration if baseline_duration else 0
+            regression = change > tolerance and duration - baseline_duration > min_difference
+            line = f'{run["rows"]:>9} {stage:<22} {baseline_duration:10.3f} {duration:10.3f} {change:+8.1%}' \
+                   f'{"  REGRESSION" if regression else ""}'
+            lines.append(line)
+            if regression:
+                regressions.append(line)
+    return lines, regressions
+
+
+parser = argparse.ArgumentParser(description='Benchmark reconciliation pipeline on synthetic data')
+parser.add_argument('-s', '--sizes', type=lambda s: [int(v) for v in s.split(',')],
+                    help='Comma separated numbers of rows of every generated workbook',
+                    default=[1000, 10000, 100000, 1000000])
+parser.add_argument('--duplicate-rate', type=float, help='Share of duplicated rows of every workbook', default=0.05)
+parser.add_argument('--name-noise', type=float,
+                    help='Share of Anchor company names distorted by typos, case and legal suffix changes', default=0.3)
+parser.add_argument('--license-overlap', type=float, help='Share of Anchor license keys present in Salesforce',
+                    default=0.5)
+parser.add_argument('--salesforce-id-rate', type=float, help='Share of Anchor rows having Salesforce ID',
+                    default=0.3)
+parser.add_argument('--seed', type=int, help='Random seed of data generator', default=0)
+parser.add_argument('-t', '--account-name-match-ratio-threshold', type=int,
+                    help='Account name similarity ratio threshold', default=75)
+parser.add_argument('-w', '--workers', type=int, help='Number of worker processes used for name fuzzy matching',
+                    default=1)
+parser.add_argument('-d', '--data-dir', help='Directory keeping generated workbooks between runs',
+                    default=path.join('benchmarks', 'data'))
+parser.add_argument('-o', '--output', help='Path to JSON file to save results to; by default, '
+                                           'benchmarks/results/<timestamp>.json')
+parser.add_argument('-c', '--compare', help='Path to JSON file with results of a previous run to compare with')
+parser.add_argument('--tolerance', type=float,
+                    help='Relative slowdown of a stage reported as regression, e.g. 0.1 - 10%%', default=0.1)
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    results = {'created': datetime.now().isoformat(), 'git_commit': get_git_commit(),
+               'python': platform.python_version(), 'platform': platform.platform(),
+               'threshold': args.account_name_match_ratio_threshold, 'workers': args.workers, 'runs': []}
+    for size in args.sizes:
+        generator = SyntheticDataGenerator(size, duplicate_rate=args.duplicate_rate, name_noise=args.name_noise,
+                                           license_overlap=args.license_overlap,
+                                           salesforce_id_rate=args.salesforce_id_rate, seed=args.seed)
+        print(f'Generating data set of {size} rows...')
+        filepaths = generator.generate(path.join(args.data_dir, generator.get_name()))
+        stages, rows = run_benchmark(filepaths, args.account_name_match_ratio_threshold, args.workers)
+        results['runs'].append({'rows': size, 'data': generator.get_params(), 'row_counts': rows, 'stages': stages})
+        print(f'{size} rows: ' + ', '.join(f'{stage} {duration:.3f}s' for stage, duration in stages.items()))
+
+    output = args.output or path.join('benchmarks', 'results', f'{datetime.now():%Y%m%d-%H%M%S}.json')
+    makedirs(path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results saved to {output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            lines, regressions = compare_results(results, json.load(f), args.tolerance)
+        print(f'{"rows":>9} {"stage":<22} {"baseline":>10} {"current":>10} {"change":>8}')
+        print('\n'.join(lines))
+        if regressions:
+            print(f'{len(regressions)} stage(s) regressed by more than {args.tolerance:.0%}')
+            raise SystemExit(1)
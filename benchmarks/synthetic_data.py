@@ -0,0 +1,193 @@
+import random
+import string
+from os import makedirs, path, replace
+
+from openpyxl import Workbook
+
+from libs.data_model import AnchorDataframe, NorthStarDataframe, SalesForceDataframe
+
+COMPANY_WORDS = ['Acme', 'Global', 'Tech', 'Systems', 'Data', 'Cloud', 'Net', 'Soft', 'Blue', 'Red', 'Alpha', 'Omega',
+                 'North', 'South', 'Star', 'Line', 'Works', 'Labs', 'Group', 'Partners', 'Bright', 'River', 'Stone',
+                 'Peak', 'Vision', 'Logic', 'Micro', 'Digital', 'Secure', 'Smart', 'United', 'Pacific', 'Atlantic',
+                 'Summit', 'Core', 'Prime', 'Nova', 'Vertex', 'Orbit', 'Quantum']
+LEGAL_SUFFIXES = ['Inc', 'Inc.', 'LLC', 'Ltd', 'GmbH', 'Corp', 'S.A.', '']
+FIRST_NAMES = ['John', 'Ann', 'Bob', 'Eve', 'Kim', 'Maria', 'Peter', 'Olga', 'Li', 'Omar', 'Sara', 'Tom']
+LAST_NAMES = ['Smith', 'Doe', 'Lee', 'Ng', 'Brown', 'Garcia', 'Ivanov', 'Muller', 'Kowalski', 'Rossi']
+COUNTRIES = ['United States', 'Germany', 'United Kingdom', 'France', 'Canada', None]
+PRODUCTS = [SalesForceDataframe.PRODUCT_ANCHOR, SalesForceDataframe.PRODUCT_X360SYNC,
+            f'{SalesForceDataframe.PRODUCT_ANCHOR}; {SalesForceDataframe.PRODUCT_X360SYNC}']
+STATUSES = ['Active', 'Suspended', 'Trial']
+USER_ROLES = [NorthStarDataframe.USER_ROLE_REGULAR_USER, NorthStarDataframe.USER_ROLE_REGULAR_USER, 'Administrator',
+              'Owner', None]
+
+
+class SyntheticDataGenerator:
+    """
+    Generates Anchor, Northstar and Salesforce workbooks resembling real exports.
+
+    Salesforce workbook has one row per contact of an account. Anchor rows refer to Salesforce accounts either by
+    Salesforce ID, by license key or by (possibly distorted) account name only, so every join strategy gets its share
+    of rows. Northstar rows refer to Anchor license keys. Column names are the ones declared by dataframe classes.
+    """
+
+    def __init__(self, rows, duplicate_rate=0.05, name_noise=0.3, license_overlap=0.5, salesforce_id_rate=0.3,
+                 seed=0):
+        """
+        :param rows: number of rows of every workbook
+        :param duplicate_rate: share of rows which duplicate another row of the same workbook
+        :param name_noise: share of Anchor company names distorted by typos, case and legal suffix changes
+        :param license_overlap: share of Anchor license keys present in Salesforce
+        :param salesforce_id_rate: share of Anchor rows having Salesforce ID of the account
+        :param seed: random seed; the same parameters and seed give the same workbooks
+        """
+        self.rows = rows
+        self.duplicate_rate = duplicate_rate
+        self.name_noise = name_noise
+        self.license_overlap = license_overlap
+        self.salesforce_id_rate = salesforce_id_rate
+        self.seed = seed
+
+    def get_params(self):
+        """
+        :return: dictionary of generator parameters
+        """
+        return {'rows': self.rows, 'duplicate_rate': self.duplicate_rate, 'name_noise': self.name_noise,
+                'license_overlap': self.license_overlap, 'salesforce_id_rate': self.salesforce_id_rate,
+                'seed': self.seed}
+
+    def get_name(self):
+        """
+        :return: name of the data set, unique for generator parameters
+        """
+        return '-'.join(f'{k}_{v}' for k, v in self.get_params().items())
+
+    def generate(self, dirpath):
+        """
+        Write anchor.xlsx, northstar.xlsx and salesforce.xlsx workbooks to directory.
+        Already generated workbooks are kept.
+
+        :param dirpath: target directory
+        :return: dictionary of paths to workbooks by keys 'anchor', 'northstar', 'salesforce'
+        """
+        filepaths = {name: path.join(dirpath, f'{name}.xlsx') for name in ('anchor', 'northstar', 'salesforce')}
+        if all(path.exists(p) for p in filepaths.values()):
+            return filepaths
+        makedirs(dirpath, exist_ok=True)
+        rnd = random.Random(self.seed)
+        accounts = self._generate_accounts(rnd)
+        salesforce_rows = self._generate_salesforce_rows(rnd, accounts)
+        anchor_rows = self._generate_anchor_rows(rnd, accounts, salesforce_rows)
+        northstar_rows = self._generate_northstar_rows(rnd, anchor_rows)
+        self._save_workbook(filepaths['salesforce'], SalesForceDataframe, salesforce_rows)
+        self._save_workbook(filepaths['anchor'], AnchorDataframe, anchor_rows)
+        self._save_workbook(filepaths['northstar'], NorthStarDataframe, northstar_rows)
+        return filepaths
+
+    def _generate_accounts(self, rnd):
+        accounts = []
+        for idx in range(max(1, self.rows // 3)):
+            name = ' '.join(rnd.sample(COMPANY_WORDS, rnd.randint(1, 3)) + [rnd.choice(LEGAL_SUFFIXES)]).strip()
+            accounts.append({
+                'id': '001' + ''.join(rnd.choices(string.ascii_letters + string.digits, k=15)),
+                'name': name,
+                'license_keys': [f'LK-{idx:07d}-{n}' for n in range(rnd.randint(1, 2))],
+                'country': rnd.choice(COUNTRIES),
+                'brand_id': rnd.randint(1, 500),
+                'products': rnd.choice(PRODUCTS),
+            })
+        return accounts
+
+    def _distort_name(self, rnd, name):
+        chars = list(name)
+        for _ in range(rnd.randint(1, 3)):
+            pos = rnd.randrange(len(chars))
+            op = rnd.random()
+            if op < 0.3:
+                chars[pos] = rnd.choice(string.ascii_lowercase)
+            elif op < 0.6 and len(chars) > 1:
+                del chars[pos]
+            else:
+                chars.insert(pos, rnd.choice(string.ascii_lowercase))
+        name = ''.join(chars)
+        op = rnd.random()
+        if op < 0.2:
+            name = name.upper()
+        elif op < 0.4:
+            name = f'{name} {rnd.choice(LEGAL_SUFFIXES)}'.strip()
+        return name
+
+    def _add_duplicates(self, rnd, rows):
+        for idx in range(len(rows)):
+            if idx and rnd.random() < self.duplicate_rate:
+                rows[idx] = rows[rnd.randrange(idx)]
+        return rows
+
+    def _generate_salesforce_rows(self, rnd, accounts):
+        rows = []
+        for idx in range(self.rows):
+            account = accounts[idx % len(accounts)]
+            first_name, last_name = rnd.choice(FIRST_NAMES), rnd.choice(LAST_NAMES)
+            rows.append({
+                SalesForceDataframe.salesforce_id.src_name: account['id'],
+                SalesForceDataframe.company_name.src_name: account['name'],
+                SalesForceDataframe.country.src_name: account['country'],
+                SalesForceDataframe.brand_id.src_name: account['brand_id'],
+                SalesForceDataframe.products.src_name: account['products'],
+                SalesForceDataframe.contact_first_name.src_name: first_name,
+                SalesForceDataframe.contact_last_name.src_name: last_name,
+                SalesForceDataframe.contact_email.src_name: f'{first_name}.{last_name}{idx}@example.com'.lower(),
+                SalesForceDataframe.license_key.src_name: rnd.choice(account['license_keys']),
+            })
+        return self._add_duplicates(rnd, rows)
+
+    def _generate_anchor_rows(self, rnd, accounts, salesforce_rows):
+        contacts = {}
+        for row in salesforce_rows:
+            contacts.setdefault(row[SalesForceDataframe.salesforce_id.src_name], []).append(
+                (row[SalesForceDataframe.contact_first_name.src_name],
+                 row[SalesForceDataframe.contact_last_name.src_name],
+                 row[SalesForceDataframe.contact_email.src_name]))
+        rows = []
+        for idx in range(self.rows):
+            account = rnd.choice(accounts)
+            if account['id'] in contacts and rnd.random() < 0.6:
+                # known Salesforce contact, sometimes with e-mail in another case
+                first_name, last_name, email = rnd.choice(contacts[account['id']])
+                email = email.title() if rnd.random() < 0.1 else email
+            else:
+                first_name, last_name = rnd.choice(FIRST_NAMES), rnd.choice(LAST_NAMES)
+                email = f'{first_name}.{last_name}.a{idx}@example.com'.lower()
+            rows.append({
+                AnchorDataframe.salesforce_id.src_name:
+                    account['id'] if rnd.random() < self.salesforce_id_rate else None,
+                AnchorDataframe.company_name.src_name:
+                    self._distort_name(rnd, account['name']) if rnd.random() < self.name_noise else account['name'],
+                AnchorDataframe.contact_name.src_name: f'{first_name} {last_name}',
+                AnchorDataframe.contact_email.src_name: email,
+                AnchorDataframe.license_key.src_name:
+                    rnd.choice(account['license_keys']) if rnd.random() < self.license_overlap else f'LK-A{idx:07d}',
+                AnchorDataframe.status.src_name: rnd.choice(STATUSES),
+            })
+        return self._add_duplicates(rnd, rows)
+
+    def _generate_northstar_rows(self, rnd, anchor_rows):
+        rows = []
+        for _ in range(self.rows):
+            rows.append({
+                NorthStarDataframe.license_key.src_name:
+                    rnd.choice(anchor_rows)[AnchorDataframe.license_key.src_name],
+                NorthStarDataframe.user_role.src_name: rnd.choice(USER_ROLES),
+            })
+        return self._add_duplicates(rnd, rows)
+
+    @staticmethod
+    def _save_workbook(filepath, dataframe_class, rows):
+        columns = [c.src_name for c in dataframe_class._get_columns().values() if c.src_name is not None]
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet()
+        ws.append(columns)
+        for row in rows:
+            ws.append([row[c] for c in columns])
+        tmp_filepath = f'{filepath}.tmp'
+        wb.save(tmp_filepath)
+        replace(tmp_filepath, filepath)
@@ -1,30 +1,221 @@
 from abc import abstractproperty
 from datetime import datetime
-from numpy import nan
-from pandas import concat, isnull, notnull, read_excel, DataFrame, MultiIndex, Series
-from typing import Union, List, Dict
-from fuzzywuzzy import fuzz, process
-
-from libs.utils import save_dataframes_to_excel
+from glob import glob
+from hashlib import blake2b
+from numpy import flatnonzero, isin, nan
+from os import makedirs, path, remove, replace
+from sys import intern
+from threading import Lock
+from pandas import concat, isnull, notnull, read_excel, read_pickle, DataFrame, Series, \
+    __version__ as pandas_version
+from typing import Union, List, Dict, Tuple
+from fuzzywuzzy import fuzz
+from fuzzywuzzy.utils import full_process
+
+from libs.join_index import JoinIndex
+from libs.metrics import metrics
+from libs.name_matching import extract_many, get_name_scorer, normalize_name, MatchSet, NameMatchIndex, SCORERS
+from libs.schema import ANCHOR_COLUMNS, NORTHSTAR_COLUMNS, SALESFORCE_COLUMNS, get_missing_columns
+from libs.score_cache import ScoreCache
+from libs.utils import filter_dataframe_rows, get_file_hash, read_excel_columns, save_dataframes_to_excel
+
+_log_lock = Lock()
+# separator of column group and column name in names of reconciliation result columns, e.g. Anchor.Company Name
+COLUMN_LEVEL_SEPARATOR = '.'
+# version of the way workbooks are read into dataframes, part of snapshot key; changed along with the way, so that
+# snapshots read the old way are not used
+SNAPSHOT_VERSION = 2
 
 
 class DataframeColumn:
-    def __init__(self, name, order=0, src_name=None):
+    STORAGE_CATEGORY = 'category'
+    STORAGE_INTERNED = 'interned'
+
+    def __init__(self, name, order=0, src_name=None, storage=None):
+        """
+        :param name: column name
+        :param order: position of column among dataframe columns
+        :param src_name: column name in source workbook
+        :param storage: compact storage of column values applied when column is read from source workbook:
+            STORAGE_CATEGORY - categorical, suits columns with few distinct values (e.g. statuses) or values repeated
+            across rows (e.g. account fields of contact rows); STORAGE_INTERNED - interned strings, repeated values
+            share the same object; by default, values are kept as read
+        """
         self.name = name
         self.src_name = src_name
         self.order = order
+        self.storage = storage
+
+
+class RowFilter:
+    """
+    Condition which values of a column of source workbook have to meet. Rows not meeting it are skipped while the
+    workbook is read, so they are neither parsed nor deduplicated.
+    """
+
+    def __init__(self, column: DataframeColumn, keep_nulls=True, exclude_values=()):
+        """
+        :param column: column read from source workbook
+        :param keep_nulls: keep rows with empty value, i.e. the one read as null
+        :param exclude_values: skip rows with these values, as they are stored in the workbook
+        """
+        self.column = column
+        self.keep_nulls = keep_nulls
+        self.exclude_values = frozenset(exclude_values)
+
+    def __call__(self, value) -> bool:
+        """
+        :param value: column value; None if it is empty
+        :return: True if row is kept
+        """
+        if value is None:
+            return self.keep_nulls
+        return value not in self.exclude_values
+
+    def __repr__(self):
+        return f'RowFilter({self.column.src_name!r}, keep_nulls={self.keep_nulls}, ' \
+               f'exclude_values={sorted(repr(v) for v in self.exclude_values)})'
+
+
+def _result_column(top_level_name: str, src_column: Union[DataframeColumn, str], order: int) -> DataframeColumn:
+    """
+    Define column of reconciliation result named <column group><COLUMN_LEVEL_SEPARATOR><column name>. Result
+    dataframes have flat columns; column groups become the top level of the header only when result is exported to
+    Excel (see `libs.utils.save_dataframes_to_excel`)
+
+    :param top_level_name: column group, e.g. Anchor
+    :param src_column: column of the table which values are taken from or name of computed column
+    :param order: position of column among dataframe columns
+    :return: column, its `src_name` is the name of the source table column
+    """
+    if isinstance(src_column, DataframeColumn):
+        return DataframeColumn(f'{top_level_name}{COLUMN_LEVEL_SEPARATOR}{src_column.name}', order,
+                               src_name=src_column.name)
+    return DataframeColumn(f'{top_level_name}{COLUMN_LEVEL_SEPARATOR}{src_column}', order)
 
 
 class BaseDataframe:
-    def __init__(self, src_filepath):
-        src_cols = [c.src_name for c in self._get_columns().values() if c.src_name is not None]
-        dest_cols = {c.src_name: c.name for c in self._get_columns().values() if c.src_name is not None}
-        self.df = read_excel(src_filepath, usecols=src_cols).rename(dest_cols, axis='columns'). \
-            drop_duplicates(ignore_index=True)
+    # filters of rows read from source workbook
+    row_filters = []
+
+    def __init__(self, src_filepath, snapshot_dir=None):
+        """
+        Read dataframe from source Excel workbook
+
+        :param src_filepath: path to source Excel workbook
+        :param snapshot_dir: directory keeping snapshots of already read dataframes; snapshot is used instead of
+            reading the workbook if neither the workbook content nor the dataframe columns have changed since
+            the snapshot was saved. By default, snapshots are not used.
+        """
+        snapshot_path = self._get_snapshot_path(src_filepath, snapshot_dir) if snapshot_dir is not None else None
+        if snapshot_path is not None and path.exists(snapshot_path):
+            self.log(f'Reading snapshot {snapshot_path}...')
+            self.df = read_pickle(snapshot_path)
+        else:
+            src_cols = [c.src_name for c in self._get_columns().values() if c.src_name is not None]
+            dest_cols = {c.src_name: c.name for c in self._get_columns().values() if c.src_name is not None}
+            self.df = self._read_excel(src_filepath, src_cols, self.get_row_filters())
+            self.df = self.df.rename(dest_cols, axis='columns')
+            self._apply_storage()
+            self.df = self.df.drop_duplicates(ignore_index=True)
+            if snapshot_path is not None:
+                self._save_snapshot(snapshot_path)
         self.orderize_columns()
 
-    def orderize_columns(self):
-        sorted_cols = sorted(self._get_columns().values(), key=lambda c: c.order)
+    @staticmethod
+    def _read_excel(src_filepath, src_cols, row_filters=None):
+        """
+        Read columns from source Excel workbook
+
+        :param src_filepath: path to source Excel workbook
+        :param src_cols: names of columns to read
+        :param row_filters: row filters by source column names, see `get_row_filters`
+        :return: dataframe
+        """
+        # legacy .xls workbooks cannot be streamed by openpyxl
+        if path.splitext(src_filepath)[1].lower() == '.xls':
+            return filter_dataframe_rows(read_excel(src_filepath, usecols=src_cols), row_filters)
+        return read_excel_columns(src_filepath, src_cols, row_filters=row_filters)
+
+    @classmethod
+    def get_row_filters(cls) -> Dict[str, RowFilter]:
+        """
+        :return: row filters of source workbook by source column names
+        """
+        return {f.column.src_name: f for f in cls.row_filters}
+
+    @classmethod
+    def get_missing_columns(cls, src_filepath):
+        """
+        Check header row of source Excel workbook without reading the rest of it
+
+        :param src_filepath: path to source Excel workbook
+        :return: list of source columns missing in the workbook
+        """
+        return get_missing_columns(src_filepath, [c.src_name for c in cls._get_columns().values()
+                                                  if c.src_name is not None])
+
+    def _apply_storage(self):
+        """
+        Convert columns read from source workbook to their declared storage
+
+        :return: None
+        """
+        for col in self._get_columns().values():
+            if col.src_name is None or col.storage is None:
+                continue
+            if col.storage == DataframeColumn.STORAGE_CATEGORY:
+                self.df[col.name] = self.df[col.name].astype('category')
+            elif col.storage == DataframeColumn.STORAGE_INTERNED:
+                self.df[col.name] = self.df[col.name].map(lambda v: intern(v) if isinstance(v, str) else v)
+            else:
+                raise ValueError(f'Unknown storage {col.storage} of column {col.name}')
+
+    @classmethod
+    def _get_snapshot_path(cls, src_filepath, snapshot_dir):
+        """
+        Get path to snapshot of dataframe read from source workbook.
+
+        Snapshot file name consists of dataframe class name, hash of the workbook path and hash of the workbook
+        content, dataframe source columns (including their storage), row filters, pandas version and
+        `SNAPSHOT_VERSION`
+
+        :param src_filepath: path to source Excel workbook
+        :param snapshot_dir: directory keeping snapshots
+        :return: path to snapshot file
+        """
+        src_path_hash = blake2b(path.abspath(src_filepath).encode(), digest_size=8).hexdigest()
+        columns = sorted((c.src_name, c.name, str(c.storage)) for c in cls._get_columns().values()
+                         if c.src_name is not None)
+        row_filters = sorted(repr(f) for f in cls.row_filters)
+        key = repr((get_file_hash(src_filepath), columns, row_filters, pandas_version, SNAPSHOT_VERSION))
+        key = blake2b(key.encode(), digest_size=16)
+        return path.join(snapshot_dir, f'{cls.__name__}-{src_path_hash}-{key.hexdigest()}.pkl')
+
+    def _save_snapshot(self, snapshot_path):
+        """
+        Save dataframe snapshot and remove outdated snapshots of the same workbook
+
+        :param snapshot_path: path to snapshot file
+        :return: None
+        """
+        makedirs(path.dirname(snapshot_path) or '.', exist_ok=True)
+        tmp_path = f'{snapshot_path}.tmp'
+        self.df.to_pickle(tmp_path)
+        replace(tmp_path, snapshot_path)
+        # the workbook key is followed by the content key in snapshot file name
+        for outdated_path in glob(f'{snapshot_path.rsplit("-", 1)[0]}-*.pkl'):
+            if outdated_path != snapshot_path:
+                remove(outdated_path)
+
+    def orderize_columns(self, columns: Dict[str, DataframeColumn] = None):
+        """
+        Keep columns in their order
+
+        :param columns: columns to keep; by default, all the columns of the class
+        :return: None
+        """
+        sorted_cols = sorted((self._get_columns() if columns is None else columns).values(), key=lambda c: c.order)
         col_names = [c.name for c in sorted_cols]
         self.df = self.df[col_names]
 
@@ -33,61 +224,164 @@ class BaseDataframe:
         return {name: col for name, col in cls.__dict__.items() if isinstance(col, DataframeColumn)}
 
     def save_to_excel(self, filepath):
-        save_dataframes_to_excel(filepath, sheets_dataframes={'Result': self.df}, wrap_text=False)
+        save_dataframes_to_excel(filepath, sheets_dataframes={'Result': self.df}, wrap_text=False,
+                                 column_separator=COLUMN_LEVEL_SEPARATOR)
+
+    def stage(self, name, msg, rows_in=None):
+        """
+        Log stage start and measure the stage, see `libs.metrics.Metrics.span`
+
+        :param name: stage name
+        :param msg: message logged at the stage start
+        :param rows_in: number of input rows
+        :return: context manager yielding `libs.metrics.Span`
+        """
+        self.log(msg)
+        return metrics.span(name, rows_in=rows_in)
 
     @staticmethod
     def log(msg):
-        dt_now = datetime.now()
-        print(f'{str(dt_now)}: {msg}')
+        # lines logged by concurrent stages are written whole and in order of their timestamps
+        with _log_lock:
+            dt_now = datetime.now()
+            print(f'{str(dt_now)}: {msg}\n', end='', flush=True)
 
 
 class NorthStarDataframe(BaseDataframe):
-    license_key = DataframeColumn('License Key', src_name='license key')
+    license_key = DataframeColumn('License Key', src_name=NORTHSTAR_COLUMNS['license_key'],
+                                  storage=DataframeColumn.STORAGE_INTERNED)
     # company_id = DataframeColumn('Company ID', 'company id')
-    user_role = DataframeColumn('User Role', src_name='user role')
+    user_role = DataframeColumn('User Role', src_name=NORTHSTAR_COLUMNS['user_role'],
+                                storage=DataframeColumn.STORAGE_CATEGORY)
 
     USER_ROLE_REGULAR_USER = 'Regular User'
 
-    def __init__(self, src_filepath):
-        self.log('Reading Northstar data...')
-        super().__init__(src_filepath)
-        self.df = self.df[self.df[self.user_role.name].notnull() &
-                          (self.df[self.user_role.name] != self.USER_ROLE_REGULAR_USER)]
+    # only users having a role other than regular user are reconciled
+    row_filters = [RowFilter(user_role, keep_nulls=False, exclude_values=[USER_ROLE_REGULAR_USER])]
 
+    def __init__(self, src_filepath, snapshot_dir=None):
+        with self.stage('load_northstar', 'Reading Northstar data...') as span:
+            super().__init__(src_filepath, snapshot_dir)
+            span.rows_out = len(self.df)
 
-class AnchorDataframe(BaseDataframe):
-    salesforce_id = DataframeColumn('Salesforce ID', src_name='Salesforce ID')
-    company_name = DataframeColumn('Company Name', src_name='Company')
-    contact_name = DataframeColumn('Contact Name', src_name='Name')
-    contact_email = DataframeColumn('Contact Email', src_name='Email')
-    license_key = DataframeColumn('License Key', src_name='License Key')
-    status = DataframeColumn('Status', src_name='Status')
 
-    def __init__(self, src_filepath):
-        self.log('Reading Anchor data...')
-        super().__init__(src_filepath)
+class AnchorDataframe(BaseDataframe):
+    salesforce_id = DataframeColumn('Salesforce ID', src_name=ANCHOR_COLUMNS['salesforce_id'],
+                                    storage=DataframeColumn.STORAGE_INTERNED)
+    company_name = DataframeColumn('Company Name', src_name=ANCHOR_COLUMNS['company_name'],
+                                   storage=DataframeColumn.STORAGE_INTERNED)
+    contact_name = DataframeColumn('Contact Name', src_name=ANCHOR_COLUMNS['contact_name'])
+    contact_email = DataframeColumn('Contact Email', src_name=ANCHOR_COLUMNS['contact_email'])
+    license_key = DataframeColumn('License Key', src_name=ANCHOR_COLUMNS['license_key'],
+                                  storage=DataframeColumn.STORAGE_INTERNED)
+    status = DataframeColumn('Status', src_name=ANCHOR_COLUMNS['status'], storage=DataframeColumn.STORAGE_CATEGORY)
+
+    def __init__(self, src_filepath, snapshot_dir=None):
+        with self.stage('load_anchor', 'Reading Anchor data...') as span:
+            super().__init__(src_filepath, snapshot_dir)
+            span.rows_out = len(self.df)
 
 
 class SalesForceDataframe(BaseDataframe):
-    salesforce_id = DataframeColumn('Salesforce ID', src_name='Account 18 digit Id')
-    company_name = DataframeColumn('Company Name', src_name='Account Name')
-    country = DataframeColumn('Billing Country', src_name='Billing Country')
-    brand_id = DataframeColumn('Brand ID', src_name='Brand ID')
-    products = DataframeColumn('Products', src_name='Current Products')
-    contact_first_name = DataframeColumn('Contact First Name', src_name='First Name')
-    contact_last_name = DataframeColumn('Contact Last Name', src_name='Last Name')
-    contact_email = DataframeColumn('Contact Email', src_name='Email')
-    license_key = DataframeColumn('License Key', src_name='TPS License Information')
+    # account fields repeat for every contact of the account
+    salesforce_id = DataframeColumn('Salesforce ID', src_name=SALESFORCE_COLUMNS['salesforce_id'],
+                                    storage=DataframeColumn.STORAGE_CATEGORY)
+    company_name = DataframeColumn('Company Name', src_name=SALESFORCE_COLUMNS['company_name'],
+                                   storage=DataframeColumn.STORAGE_CATEGORY)
+    country = DataframeColumn('Billing Country', src_name=SALESFORCE_COLUMNS['country'],
+                              storage=DataframeColumn.STORAGE_CATEGORY)
+    brand_id = DataframeColumn('Brand ID', src_name=SALESFORCE_COLUMNS['brand_id'],
+                               storage=DataframeColumn.STORAGE_CATEGORY)
+    products = DataframeColumn('Products', src_name=SALESFORCE_COLUMNS['products'],
+                               storage=DataframeColumn.STORAGE_CATEGORY)
+    contact_first_name = DataframeColumn('Contact First Name', src_name=SALESFORCE_COLUMNS['contact_first_name'],
+                                         storage=DataframeColumn.STORAGE_INTERNED)
+    contact_last_name = DataframeColumn('Contact Last Name', src_name=SALESFORCE_COLUMNS['contact_last_name'],
+                                        storage=DataframeColumn.STORAGE_INTERNED)
+    contact_email = DataframeColumn('Contact Email', src_name=SALESFORCE_COLUMNS['contact_email'])
+    license_key = DataframeColumn('License Key', src_name=SALESFORCE_COLUMNS['license_key'],
+                                  storage=DataframeColumn.STORAGE_CATEGORY)
+
+    # columns of deduplicated account and contact tables shared by reconcilers
+    account_columns = [salesforce_id, company_name, products, license_key]
+    contact_columns = [salesforce_id, company_name, contact_first_name, contact_last_name, contact_email]
 
     PRODUCT_ANCHOR = 'Anchor'
     PRODUCT_X360SYNC = 'x360Sync'
 
-    def __init__(self, src_filepath):
-        self.log('Reading Salesforce data...')
-        super().__init__(src_filepath)
-        # self.df[self.products.name] = self.df[self.products.name].apply(
-        #     lambda x: x.split('; ') if isinstance(x, str) else [x]
-        # )
+    def __init__(self, src_filepath, snapshot_dir=None):
+        with self.stage('load_salesforce', 'Reading Salesforce data...') as span:
+            super().__init__(src_filepath, snapshot_dir)
+            # self.df[self.products.name] = self.df[self.products.name].apply(
+            #     lambda x: x.split('; ') if isinstance(x, str) else [x]
+            # )
+            span.rows_out = len(self.df)
+        with self.stage('salesforce_tables', 'Building Salesforce account and contact tables...',
+                        rows_in=len(self.df)) as span:
+            self.accounts = self.df[[c.name for c in self.account_columns]].drop_duplicates(ignore_index=True)
+            self.contacts = self.df[[c.name for c in self.contact_columns]].drop_duplicates(ignore_index=True)
+            self.accounts_by_id = JoinIndex(self.accounts, self.salesforce_id.name)
+            self.accounts_by_license_key = JoinIndex(self.accounts, self.license_key.name)
+            # fuzzy matches are joined by name; empty names are never matched
+            self.accounts_by_name = JoinIndex(self.accounts, self.company_name.name, match_nulls=False)
+            self.accounts_by_normalized_name = JoinIndex(self.accounts, self.company_name.name, match_nulls=False,
+                                                         normalize=self.normalize_company_names)
+            self.contacts_by_email = JoinIndex(self.contacts, self.contact_email.name, normalize=self.normalize_email)
+            self.contacts_by_id = JoinIndex(self.contacts, self.salesforce_id.name, match_nulls=False)
+            span.rows_out = len(self.accounts) + len(self.contacts)
+        self._contact_names = {}
+        self._name_indexes = {}
+
+    @staticmethod
+    def normalize_email(emails):
+        """
+        Normalize e-mails for case-insensitive matching
+
+        :param emails: e-mails
+        :type emails: pandas.Series
+        :return: e-mails without surrounding whitespace in lower case
+        """
+        return Series([e.strip().lower() if isinstance(e, str) else e for e in emails], index=emails.index,
+                      dtype=object)
+
+    @staticmethod
+    def normalize_company_names(names):
+        """
+        Normalize company names for matching names differing only by case, punctuation and legal form suffixes
+
+        :param names: company names
+        :type names: pandas.Series
+        :return: name keys, see `libs.name_matching.normalize_name`
+        """
+        return Series([normalize_name(n) for n in names], index=names.index, dtype=object)
+
+    def get_name_index(self, scorer: str) -> NameMatchIndex:
+        """
+        Get index of account names, it is built once per scorer
+
+        :param scorer: name of scorer, see `SCORERS`
+        :return: index of names of accounts table
+        """
+        index = self._name_indexes.get(scorer)
+        if index is None:
+            index = self._name_indexes[scorer] = \
+                NameMatchIndex(self.accounts[self.company_name.name].to_list(), SCORERS[scorer])
+        return index
+
+    def get_contact_name(self, position):
+        """
+        Get processed full name of contact
+
+        :param position: position of contact in contacts table
+        :return: first and last names processed the same way `fuzzywuzzy.process` processes them
+        """
+        name = self._contact_names.get(position)
+        if name is None:
+            first_name = self.contacts[self.contact_first_name.name].iat[position]
+            last_name = self.contacts[self.contact_last_name.name].iat[position]
+            name = self._contact_names[position] = \
+                full_process(' '.join(str(n) for n in (first_name, last_name) if notnull(n)))
+        return name
 
 
 class AnchorNorthstarDataframe(BaseDataframe):
@@ -99,163 +393,383 @@ class AnchorNorthstarDataframe(BaseDataframe):
     status = DataframeColumn(AnchorDataframe.status.name)
     user_role = DataframeColumn(NorthStarDataframe.user_role.name)
 
-    def __init__(self, src_anchor_filepath, src_northstar_filepath):
-        anchor = AnchorDataframe(src_anchor_filepath)
-        northstar = NorthStarDataframe(src_northstar_filepath)
+    def __init__(self, src_anchor: Union[str, AnchorDataframe], src_northstar: Union[str, NorthStarDataframe],
+                 snapshot_dir=None):
+        """
+        Join Anchor and Northstar data by license key
 
-        self.log('Joining Anchor/Northstar data by license key...')
-        self.df = anchor.df.merge(right=northstar.df, how="inner", left_on=anchor.license_key.name,
-                                  right_on=northstar.license_key.name, suffixes=(None, '_ns'))
-        self.df.drop_duplicates(inplace=True)
-        self.orderize_columns()
+        :param src_anchor: path to Anchor Excel workbook or already read Anchor dataframe object
+        :param src_northstar: path to Northstar Excel workbook or already read Northstar dataframe object
+        :param snapshot_dir: directory keeping snapshots of already read dataframes, see `BaseDataframe`
+        """
+        anchor = src_anchor if isinstance(src_anchor, AnchorDataframe) else AnchorDataframe(src_anchor, snapshot_dir)
+        northstar = src_northstar if isinstance(src_northstar, NorthStarDataframe) else \
+            NorthStarDataframe(src_northstar, snapshot_dir)
+
+        with self.stage('anchor_northstar_join', 'Joining Anchor/Northstar data by license key...',
+                        rows_in=len(anchor.df)) as span:
+            self.df = anchor.df.merge(right=northstar.df, how="inner", left_on=anchor.license_key.name,
+                                      right_on=northstar.license_key.name, suffixes=(None, '_ns'))
+            self.df.drop_duplicates(inplace=True)
+            self.orderize_columns()
+            span.rows_out = len(self.df)
 
 
 class AnchorSalesforceMixin:
     @classmethod
-    def rebuild_dataframe(cls, dataframe: DataFrame, columns: Dict[str, DataframeColumn], top_level_name: str,
+    def rebuild_dataframe(cls, dataframe: DataFrame, columns: Dict[str, DataframeColumn],
                           columns_key_prefix: str) -> DataFrame:
         """
-        Rebuild dataframe by restricting it to columns with specified key prefix and
-        adding one level to column structure
+        Rebuild dataframe by restricting it to source columns of the columns with specified key prefix and
+        renaming them to result column names
 
         :param dataframe: dataframe to rebuild
         :param columns: dictionary containing dataframe column and its key
-        :param top_level_name: column level name to add to the top
         :param columns_key_prefix: columns key prefix
-        :return:
+        :return: deduplicated dataframe
         """
-        df = dataframe[[v.name[1] for k, v in columns.items() if k.startswith(columns_key_prefix)]]
-        df = df.drop_duplicates()
-        df.columns = MultiIndex.from_product(iterables=([top_level_name], df.columns))
+        prefixed_columns = [v for k, v in columns.items() if k.startswith(columns_key_prefix)]
+        df = dataframe[[c.src_name for c in prefixed_columns]].drop_duplicates()
+        df.columns = [c.name for c in prefixed_columns]
         return df
 
+    @classmethod
+    def get_column_names(cls, columns_key_prefix: str) -> List[str]:
+        """
+        :param columns_key_prefix: columns key prefix, e.g. anchor_
+        :return: names of result columns with specified key prefix
+        """
+        return [v.name for k, v in cls._get_columns().items() if k.startswith(columns_key_prefix)]
+
+    @classmethod
+    def get_salesforce_columns(cls) -> Dict[str, str]:
+        """
+        Get Salesforce columns of result dataframe
+
+        :return: dictionary of Salesforce table column names and result column names
+        """
+        return {v.src_name: v.name for k, v in cls._get_columns().items() if k.startswith('sf_')}
+
 
 class AnchorSalesforceAccountsDataframe(BaseDataframe, AnchorSalesforceMixin):
     top_anchor = 'Anchor'
-    anchor_salesforce_id = DataframeColumn(name=(top_anchor, AnchorNorthstarDataframe.salesforce_id.name), order=0)
-    anchor_company_name = DataframeColumn(name=(top_anchor, AnchorNorthstarDataframe.company_name.name), order=10)
-    anchor_license_key = DataframeColumn(name=(top_anchor, AnchorNorthstarDataframe.license_key.name), order=30)
-    anchor_status = DataframeColumn(name=(top_anchor, AnchorNorthstarDataframe.status.name), order=40)
-    anchor_user_role = DataframeColumn(name=(top_anchor, AnchorNorthstarDataframe.user_role.name), order=50)
+    anchor_salesforce_id = _result_column(top_anchor, AnchorNorthstarDataframe.salesforce_id, order=0)
+    anchor_company_name = _result_column(top_anchor, AnchorNorthstarDataframe.company_name, order=10)
+    anchor_license_key = _result_column(top_anchor, AnchorNorthstarDataframe.license_key, order=30)
+    anchor_status = _result_column(top_anchor, AnchorNorthstarDataframe.status, order=40)
+    anchor_user_role = _result_column(top_anchor, AnchorNorthstarDataframe.user_role, order=50)
 
     top_salesforce = 'Salesforce'
-    sf_salesforce_id = DataframeColumn(name=(top_salesforce, SalesForceDataframe.salesforce_id.name), order=60)
-    sf_company_name = DataframeColumn(name=(top_salesforce, SalesForceDataframe.company_name.name), order=70)
-    sf_products = DataframeColumn(name=(top_salesforce, SalesForceDataframe.products.name), order=80)
-    sf_license_key = DataframeColumn(name=(top_salesforce, SalesForceDataframe.license_key.name), order=90)
+    sf_salesforce_id = _result_column(top_salesforce, SalesForceDataframe.salesforce_id, order=60)
+    sf_company_name = _result_column(top_salesforce, SalesForceDataframe.company_name, order=70)
+    sf_products = _result_column(top_salesforce, SalesForceDataframe.products, order=80)
+    sf_license_key = _result_column(top_salesforce, SalesForceDataframe.license_key, order=90)
 
     top_match = 'Matches'
-    match_sf_id = DataframeColumn(name=(top_match, 'Salesforce ID'), order=90)
-    match_license_key = DataframeColumn(name=(top_match, 'License Key'), order=100)
-    match_fuzzy_ratio = DataframeColumn(name=(top_match, 'Fuzzy ratio'), order=110)
+    match_sf_id = _result_column(top_match, 'Salesforce ID', order=90)
+    match_license_key = _result_column(top_match, 'License Key', order=100)
+    match_fuzzy_ratio = _result_column(top_match, 'Fuzzy ratio', order=110)
     # match_fuzzy_ratio_1st_chars = DataframeColumn(name=(top_match, 'Fuzzy ratio/n(1st 10 chars)'), order=120)
+    match_stage = _result_column(top_match, 'Stage', order=130)
+
+    # values of match stage column, the join stage which matched the row; unmatched rows have none
+    MATCH_STAGE_SALESFORCE_ID = 'Salesforce ID'
+    MATCH_STAGE_LICENSE_KEY = 'License key'
+    MATCH_STAGE_NORMALIZED_NAME = 'Normalized name'
+    MATCH_STAGE_FUZZY_NAME = 'Name fuzzy match'
 
     def __init__(self, anchor_ns: AnchorNorthstarDataframe, salesforce: SalesForceDataframe,
-                 name_fuzzy_match_ratio_threshold: int = 75):
+                 name_fuzzy_match_ratio_threshold: int = 75, workers: int = 1, score_cache: ScoreCache = None,
+                 previous_fuzzy_matches: MatchSet = None, name_scorer: str = 'ratio'):
         """
-        Join accounts in Anchor and Salesforce by salesforce id, license key and name fuzzy matching
+        Join accounts in Anchor and Salesforce by salesforce id, license key, normalized name and name fuzzy matching.
+        Every stage joins only accounts left unmatched by the previous ones.
 
         :param anchor_ns: Anchor/Northstar dataframe object
         :param salesforce: Salesforce dataframe object
         :param name_fuzzy_match_ratio_threshold: account names with specified (or above) similarity ratio will be used
             for joining Anchor and Salesforce account data. Number between 0 and 100; by default, 75.
+        :param workers: number of worker processes used for name fuzzy matching; by default, 1.
+        :param score_cache: persistent cache of name similarity ratios; by default, ratios are not cached.
+        :param previous_fuzzy_matches: name fuzzy matches of the previous run (see `fuzzy_matches`); only new account
+            names get matched against all Salesforce account names, the rest - against added ones.
+        :param name_scorer: name similarity scorer, one of `SCORERS`: ratio, token_sort or token_set; by default,
+            ratio. Score cache has to be opened for the same scorer.
         """
         self.name_fuzzy_match_ratio_threshold = name_fuzzy_match_ratio_threshold
-        df = self.rebuild_dataframe(dataframe=anchor_ns.df, columns=self._get_columns(), top_level_name=self.top_anchor,
-                                    columns_key_prefix='anchor_')
+        self.name_scorer = name_scorer
+        self.workers = workers
+        self.score_cache = score_cache
+        self.previous_fuzzy_matches = previous_fuzzy_matches
+        self.fuzzy_matches = None
+        # numbers of rows joined by exact keys, followed by rows of the fuzzy join
+        self.exact_matches = {}
+        # positions of Anchor accounts of the rows of the fuzzy join
+        self._fuzzy_positions = None
+        df = self.rebuild_dataframe(dataframe=anchor_ns.df, columns=self._get_columns(), columns_key_prefix='anchor_')
 
         df[self.match_sf_id.name] = nan
         df[self.match_license_key.name] = nan
         df[self.match_fuzzy_ratio.name] = nan
         # df[self.match_fuzzy_ratio_1st_chars.name] = nan
 
-        df_sf = self.rebuild_dataframe(dataframe=salesforce.df, columns=self._get_columns(),
-                                       top_level_name=self.top_salesforce, columns_key_prefix='sf_')
-
-        self.log('Joining Anchor/Salesforce accounts by Salesforce ID...')
-        df = df.merge(right=df_sf, how="left", left_on=[self.anchor_salesforce_id.name],
-                      right_on=[self.sf_salesforce_id.name], suffixes=(None, '_sf'))
-        sf_id_nulls = df[self.sf_salesforce_id.name].isnull()
-        self.df = df[~sf_id_nulls]
-        df = df[sf_id_nulls]
-
-        self.log('Joining Anchor/Salesforce accounts by license key...')
-        df = df[[self.top_anchor]]
-        df = df.merge(right=df_sf, how="left", left_on=[self.anchor_license_key.name],
-                      right_on=[self.sf_license_key.name])
-        license_key_nulls = df[self.sf_license_key.name].isnull()
-        self.df = concat([self.df, df[~license_key_nulls]], ignore_index=True)
-        df = df[license_key_nulls]
-
-        self.log('Joining Anchor/Salesforce accounts by name fuzzy match...')
-        df = df[[self.top_anchor]]
-        df = self._merge_by_fuzzy_match(df, df_sf,
-                                        self.anchor_company_name.name, self.sf_company_name.name)
-        self.df = concat([self.df, df], ignore_index=True)
-
-        self.log('Finalizing result Anchor/Salesforce accounts...')
-        self.df[self.match_sf_id.name] = \
-            self.df[self.anchor_salesforce_id.name] == self.df[self.sf_salesforce_id.name]
-        self.df[self.match_license_key.name] = \
-            self.df[self.anchor_license_key.name] == self.df[self.sf_license_key.name]
-        self.df[self.match_fuzzy_ratio.name] = self.df.apply(
-            lambda x: fuzz.ratio(str(x[self.anchor_company_name.name]), str(x[self.sf_company_name.name]))
-            if notnull(x[self.anchor_company_name.name]) and notnull(x[self.sf_company_name.name]) and
-            isnull(x[self.match_fuzzy_ratio.name]) else x[self.match_fuzzy_ratio.name],
-            axis="columns"
-        )
-        self.orderize_columns()
+        sf_columns = self.get_salesforce_columns()
+
+        with self.stage('salesforce_id_join', 'Joining Anchor/Salesforce accounts by Salesforce ID...',
+                        rows_in=len(df)) as span:
+            df = salesforce.accounts_by_id.left_join(df, self.anchor_salesforce_id.name, sf_columns)
+            df[self.match_stage.name] = self.MATCH_STAGE_SALESFORCE_ID
+            sf_id_nulls = df[self.sf_salesforce_id.name].isnull()
+            self.df = df[~sf_id_nulls]
+            df = df[sf_id_nulls]
+            span.rows_out = span.matches = len(self.df)
+            self.exact_matches['salesforce_id'] = span.matches
+
+        with self.stage('license_key_join', 'Joining Anchor/Salesforce accounts by license key...',
+                        rows_in=len(df)) as span:
+            df = df[self.get_column_names('anchor_')]
+            df = salesforce.accounts_by_license_key.left_join(df, self.anchor_license_key.name, sf_columns)
+            df[self.match_stage.name] = self.MATCH_STAGE_LICENSE_KEY
+            license_key_nulls = df[self.sf_license_key.name].isnull()
+            self.df = concat([self.df, df[~license_key_nulls]], ignore_index=True)
+            df = df[license_key_nulls]
+            span.rows_out = span.matches = int((~license_key_nulls).sum())
+            self.exact_matches['license_key'] = span.matches
+
+        with self.stage('normalized_name_join', 'Joining Anchor/Salesforce accounts by normalized name...',
+                        rows_in=len(df)) as span:
+            df = df[self.get_column_names('anchor_')]
+            # names differing only by case, punctuation and legal form suffixes need no fuzzy matching
+            df = salesforce.accounts_by_normalized_name.left_join(df, self.anchor_company_name.name, sf_columns)
+            df[self.match_stage.name] = self.MATCH_STAGE_NORMALIZED_NAME
+            name_nulls = df[self.sf_company_name.name].isnull()
+            self.df = concat([self.df, df[~name_nulls]], ignore_index=True)
+            df = df[name_nulls]
+            span.rows_out = span.matches = int((~name_nulls).sum())
+            self.exact_matches['normalized_name'] = span.matches
+
+        with self.stage('fuzzy_join', 'Joining Anchor/Salesforce accounts by name fuzzy match...',
+                        rows_in=len(df)) as span:
+            df = df[self.get_column_names('anchor_')]
+            df = self._merge_by_fuzzy_match(df, salesforce.accounts_by_name,
+                                            salesforce.get_name_index(self.name_scorer),
+                                            self.anchor_company_name.name, sf_columns)
+            df[self.match_stage.name] = Series(self.MATCH_STAGE_FUZZY_NAME, index=df.index) \
+                .where(df[self.sf_company_name.name].notnull())
+            self.df = concat([self.df, df], ignore_index=True)
+            span.rows_out = len(df)
+            span.matches = int(df[self.sf_company_name.name].notnull().sum())
+
+        with self.stage('accounts_finalize', 'Finalizing result Anchor/Salesforce accounts...',
+                        rows_in=len(self.df)) as span:
+            self.df[self.match_sf_id.name] = \
+                self.df[self.anchor_salesforce_id.name] == self.df[self.sf_salesforce_id.name]
+            self.df[self.match_license_key.name] = \
+                self.df[self.anchor_license_key.name] == self.df[self.sf_license_key.name]
+            ratio = self._get_scorer(str(n) for n in self.df[self.anchor_company_name.name].dropna())
+            preprocess = get_name_scorer(ratio).preprocess
+            self.df[self.match_fuzzy_ratio.name] = Series([
+                ratio(preprocess(str(anchor_name)), preprocess(str(sf_name)))
+                if notnull(anchor_name) and notnull(sf_name) and isnull(fuzzy_ratio) else fuzzy_ratio
+                for anchor_name, sf_name, fuzzy_ratio in zip(self.df[self.anchor_company_name.name],
+                                                             self.df[self.sf_company_name.name],
+                                                             self.df[self.match_fuzzy_ratio.name])
+            ], index=self.df.index)
+            self.orderize_columns()
+            span.rows_out = len(self.df)
+
+    def get_threshold_result(self, threshold: int) -> Tuple[DataFrame, Dict]:
+        """
+        Get result of reconciliation with a higher name match ratio threshold without matching names again.
+
+        Name fuzzy matches below the threshold are dropped and Anchor accounts left without matches get a single
+        unmatched row, so the result is the same as the one of reconciliation with the threshold: the best matches
+        reaching a higher threshold are the first ones of the best matches reaching the lower one.
+
+        :param threshold: account name match ratio threshold, not lower than the one of reconciliation
+        :return: result dataframe and dictionary of numbers of its rows by the way they were matched
+        """
+        if threshold < self.name_fuzzy_match_ratio_threshold:
+            raise ValueError(f'Threshold {threshold} is lower than {self.name_fuzzy_match_ratio_threshold} names were '
+                             f'matched with')
+        exact_rows = sum(self.exact_matches.values())
+        df = self.df.iloc[exact_rows:]
+        matched = (df[self.sf_company_name.name].notnull() & (df[self.match_fuzzy_ratio.name] >= threshold)).to_numpy()
+        first_rows = ~Series(self._fuzzy_positions).duplicated().to_numpy()
+        unmatched = first_rows & ~isin(self._fuzzy_positions, self._fuzzy_positions[matched])
+        df = df[matched | unmatched].copy()
+        unmatched_index = df.index[unmatched[matched | unmatched]]
+        df.loc[unmatched_index, list(self.get_salesforce_columns().values()) +
+               [self.match_fuzzy_ratio.name, self.match_stage.name]] = nan
+        df.loc[unmatched_index, [self.match_sf_id.name, self.match_license_key.name]] = False
+        df = concat([self.df.iloc[:exact_rows], df], ignore_index=True)
+        return df, dict(**self.exact_matches, name=int(matched.sum()), unmatched=len(unmatched_index))
+
+    def _get_scorer(self, names):
+        """
+        Get name scorer or its equivalent backed by the score cache (if it is set)
+
+        :param names: first names of string pairs going to be scored; their cached scores get loaded
+        :return: scorer
+        """
+        if self.score_cache is None:
+            return SCORERS[self.name_scorer]
+        self.score_cache.load(names)
+        return self.score_cache.scorer
 
-    def _merge_by_fuzzy_match(self, left_df, right_df, left_on, right_on):
-        tmp_col_match = ('tmp', 'fuzzy match')
-        df = DataFrame()
-        for _, left_row in left_df.iterrows():
-            row = left_row.copy(deep=True)
-            matches = process.extract(str(row[left_on]), right_df[right_on].to_list(), scorer=fuzz.ratio, limit=10)
-            row[tmp_col_match] = list(filter(lambda x: x[1] >= self.name_fuzzy_match_ratio_threshold, matches))
-            df_exploded = DataFrame([row]).explode(tmp_col_match)
-            df_exploded[[tmp_col_match, self.match_fuzzy_ratio.name]] = df_exploded[tmp_col_match].apply(
-                lambda x: Series(x) if isinstance(x, tuple) else Series([nan, nan])
-            )
-            df = concat([df, df_exploded])
-        df = df.merge(right_df, how='left', left_on=[tmp_col_match], right_on=[right_on])
-        df.drop(columns=[tmp_col_match], inplace=True)
+    def _merge_by_fuzzy_match(self, left_df, right_index: JoinIndex, name_index: NameMatchIndex, left_on,
+                              right_columns):
+        """
+        Join rows of right table whose names are best fuzzy matches of left names
+
+        :param left_df: left dataframe
+        :param right_index: index of right table by name
+        :param name_index: name match index of the names of right table
+        :param left_on: name column of the left dataframe
+        :param right_columns: right table columns to join and their names in the result
+        :return: joined dataframe
+        """
+        tmp_col_match = 'tmp.fuzzy match'
+        tmp_col_position = 'tmp.position'
+        queries = [str(v) for v in left_df[left_on]]
+        # names are processed before matching, so processed names are the first names of scored pairs
+        scorer = self._get_scorer(SCORERS[self.name_scorer].process(q) for q in queries)
+        matches, self.fuzzy_matches = extract_many(right_index.table[right_index.key].to_list(), queries,
+                                                   self.name_fuzzy_match_ratio_threshold, limit=10,
+                                                   workers=self.workers, scorer=scorer,
+                                                   previous_matches=self.previous_fuzzy_matches, index=name_index)
+        # flatten matches into (left row position, matching name, ratio) triples; left row without matches gets
+        # a single triple with empty name and ratio
+        positions, names, ratios = [], [], []
+        for pos, row_matches in enumerate(matches):
+            for name, ratio in row_matches or [(nan, nan)]:
+                positions.append(pos)
+                names.append(name)
+                ratios.append(ratio)
+        df = left_df.take(positions)
+        df[tmp_col_position] = positions
+        df[tmp_col_match] = names
+        df[self.match_fuzzy_ratio.name] = ratios
+        # empty names are never matched, so the index doesn't join them with empty names of the right table either
+        df = right_index.left_join(df, tmp_col_match, right_columns)
+        self._fuzzy_positions = df[tmp_col_position].to_numpy()
+        df.drop(columns=[tmp_col_match, tmp_col_position], inplace=True)
         return df
 
 
 class AnchorSalesforceContactsDataframe(BaseDataframe, AnchorSalesforceMixin):
     top_anchor = 'Anchor'
-    anchor_salesforce_id = DataframeColumn(name=(top_anchor, AnchorNorthstarDataframe.salesforce_id.name), order=0)
-    anchor_company_name = DataframeColumn(name=(top_anchor, AnchorNorthstarDataframe.company_name.name), order=10)
-    anchor_contact_name = DataframeColumn(name=(top_anchor, AnchorNorthstarDataframe.contact_name.name), order=20)
-    anchor_contact_email = DataframeColumn(name=(top_anchor, AnchorNorthstarDataframe.contact_email.name), order=30)
-    anchor_status = DataframeColumn(name=(top_anchor, AnchorNorthstarDataframe.status.name), order=40)
-    anchor_user_role = DataframeColumn(name=(top_anchor, AnchorNorthstarDataframe.user_role.name), order=50)
+    anchor_salesforce_id = _result_column(top_anchor, AnchorNorthstarDataframe.salesforce_id, order=0)
+    anchor_company_name = _result_column(top_anchor, AnchorNorthstarDataframe.company_name, order=10)
+    anchor_contact_name = _result_column(top_anchor, AnchorNorthstarDataframe.contact_name, order=20)
+    anchor_contact_email = _result_column(top_anchor, AnchorNorthstarDataframe.contact_email, order=30)
+    anchor_status = _result_column(top_anchor, AnchorNorthstarDataframe.status, order=40)
+    anchor_user_role = _result_column(top_anchor, AnchorNorthstarDataframe.user_role, order=50)
 
     top_salesforce = 'Salesforce'
-    sf_salesforce_id = DataframeColumn(name=(top_salesforce, SalesForceDataframe.salesforce_id.name), order=60)
-    sf_company_name = DataframeColumn(name=(top_salesforce, SalesForceDataframe.company_name.name), order=70)
-    sf_contact_first_name = DataframeColumn(name=(top_salesforce, SalesForceDataframe.contact_first_name.name),
-                                            order=80)
-    sf_contact_last_name = DataframeColumn(name=(top_salesforce, SalesForceDataframe.contact_last_name.name),
-                                           order=90)
-    sf_contact_email = DataframeColumn(name=(top_salesforce, SalesForceDataframe.contact_email.name),
-                                       order=100)
+    sf_salesforce_id = _result_column(top_salesforce, SalesForceDataframe.salesforce_id, order=60)
+    sf_company_name = _result_column(top_salesforce, SalesForceDataframe.company_name, order=70)
+    sf_contact_first_name = _result_column(top_salesforce, SalesForceDataframe.contact_first_name, order=80)
+    sf_contact_last_name = _result_column(top_salesforce, SalesForceDataframe.contact_last_name, order=90)
+    sf_contact_email = _result_column(top_salesforce, SalesForceDataframe.contact_email, order=100)
 
-    def __init__(self, anchor_ns: AnchorNorthstarDataframe, salesforce: SalesForceDataframe):
+    top_match = 'Matches'
+    match_name_fuzzy_ratio = _result_column(top_match, 'Name fuzzy ratio', order=110)
+
+    def __init__(self, anchor_ns: AnchorNorthstarDataframe, salesforce: SalesForceDataframe,
+                 accounts: AnchorSalesforceAccountsDataframe = None, name_fuzzy_match_ratio_threshold: int = None):
         """
-        Join contacts in Anchor and Salesforce by e-mail
+        Join contacts in Anchor and Salesforce by e-mail (case-insensitively). Contacts left unmatched may be joined by
+        name fuzzy match with contacts of Salesforce accounts matched to the same Anchor account.
 
         :param anchor_ns: Anchor/Northstar dataframe object
         :param salesforce: Salesforce dataframe object
+        :param accounts: Anchor/Salesforce accounts dataframe object; required for matching by name
+        :param name_fuzzy_match_ratio_threshold: unmatched contacts are joined with the contact having the best
+            similarity ratio of names, if it is at or above this threshold. Number between 0 and 100; by default,
+            contacts are not matched by name.
         """
-        df = self.rebuild_dataframe(dataframe=anchor_ns.df, columns=self._get_columns(), top_level_name=self.top_anchor,
-                                    columns_key_prefix='anchor_')
+        df = self.rebuild_dataframe(dataframe=anchor_ns.df, columns=self._get_columns(), columns_key_prefix='anchor_')
+
+        with self.stage('contacts_join', 'Joining Anchor/Salesforce contacts by e-mail...', rows_in=len(df)) as span:
+            self.df = salesforce.contacts_by_email.left_join(df, self.anchor_contact_email.name,
+                                                             self.get_salesforce_columns())
+            span.rows_out = len(self.df)
+            span.matches = int(self.df[self.sf_contact_email.name].notnull().sum())
+
+        name_matched = accounts is not None and name_fuzzy_match_ratio_threshold is not None
+        if name_matched:
+            self.df[self.match_name_fuzzy_ratio.name] = nan
+            with self.stage('contacts_name_fuzzy_join', 'Joining unmatched Anchor/Salesforce contacts by name fuzzy '
+                                                        'match within matched accounts...') as span:
+                span.rows_in, span.matches = self._merge_by_name_fuzzy_match(salesforce, accounts,
+                                                                             name_fuzzy_match_ratio_threshold)
+                span.rows_out = len(self.df)
+        self.orderize_columns(self.get_result_columns(name_matched))
 
-        df_sf = self.rebuild_dataframe(dataframe=salesforce.df, columns=self._get_columns(),
-                                       top_level_name=self.top_salesforce, columns_key_prefix='sf_')
+    @classmethod
+    def get_result_columns(cls, name_matched: bool = False) -> Dict[str, DataframeColumn]:
+        """
+        Get result columns
 
-        self.log('Joining Anchor/Salesforce contacts by e-mail...')
-        self.df = df.merge(right=df_sf, how="left", left_on=[self.anchor_contact_email.name],
-                           right_on=[self.sf_contact_email.name], suffixes=(None, '_sf'))
-        self.orderize_columns()
+        :param name_matched: contacts are matched by name as well, so that the result has their similarity ratios
+        :return: dictionary of attribute names and columns
+        """
+        columns = cls._get_columns()
+        if not name_matched:
+            del columns['match_name_fuzzy_ratio']
+        return columns
+
+    @staticmethod
+    def _get_account_key(salesforce_id, company_name):
+        # nulls are not equal to each other, so they are replaced to be usable in keys
+        return None if isnull(salesforce_id) else salesforce_id, None if isnull(company_name) else company_name
+
+    def _merge_by_name_fuzzy_match(self, salesforce: SalesForceDataframe, accounts: AnchorSalesforceAccountsDataframe,
+                                   threshold: int):
+        """
+        Join contacts not matched by e-mail with the best matching by name contact of Salesforce accounts matched to
+        the same Anchor account (Salesforce ID and company name). Names are compared only within these accounts.
+
+        :param salesforce: Salesforce dataframe object
+        :param accounts: Anchor/Salesforce accounts dataframe object
+        :param threshold: minimum similarity ratio of names
+        :return: number of unmatched contacts and number of contacts matched by name
+        """
+        sf_ids_by_account = {}
+        matched_accounts = accounts.df[accounts.df[accounts.sf_salesforce_id.name].notnull()]
+        for anchor_sf_id, company_name, sf_id in zip(matched_accounts[accounts.anchor_salesforce_id.name],
+                                                     matched_accounts[accounts.anchor_company_name.name],
+                                                     matched_accounts[accounts.sf_salesforce_id.name]):
+            # dictionary keeps Salesforce IDs unique and in order of account matches
+            sf_ids_by_account.setdefault(self._get_account_key(anchor_sf_id, company_name), {})[sf_id] = None
+
+        unmatched_rows = flatnonzero(self.df[self.sf_contact_email.name].isnull().to_numpy())
+        rows, positions, ratios = [], [], []
+        for row in unmatched_rows:
+            contact_name = self.df[self.anchor_contact_name.name].iat[row]
+            sf_ids = sf_ids_by_account.get(self._get_account_key(self.df[self.anchor_salesforce_id.name].iat[row],
+                                                                 self.df[self.anchor_company_name.name].iat[row]))
+            if not sf_ids or isnull(contact_name):
+                continue
+            query = full_process(str(contact_name))
+            if not query:
+                continue
+            best_position, best_ratio = None, -1
+            for position in salesforce.contacts_by_id.get_positions(list(sf_ids))[1]:
+                if position < 0:
+                    continue
+                ratio = fuzz.ratio(query, salesforce.get_contact_name(position))
+                if ratio > best_ratio:
+                    best_position, best_ratio = position, ratio
+            if best_ratio >= threshold:
+                rows.append(row)
+                positions.append(best_position)
+                ratios.append(best_ratio)
+
+        if rows:
+            for src_name, name in self.get_salesforce_columns().items():
+                self.df.iloc[rows, self.df.columns.get_loc(name)] = \
+                    salesforce.contacts[src_name].take(positions).to_numpy()
+            self.df.iloc[rows, self.df.columns.get_loc(self.match_name_fuzzy_ratio.name)] = ratios
+        return len(unmatched_rows), len(rows)
@@ -0,0 +1,88 @@
+from typing import Callable, Dict, Hashable, Tuple
+
+from numpy import arange, argsort, array, bincount, cumsum, flatnonzero, full, maximum, nan, repeat, where, int64
+from pandas import concat, isnull, unique, DataFrame, Index, RangeIndex, Series
+
+
+class JoinIndex:
+    """
+    Hash index over key column of a table, built once and used for any number of left joins with the table.
+
+    Rows are joined the same way `pandas.DataFrame.merge(how='left')` joins them: left rows keep their order, every
+    left row is repeated for each matching table row (in table order) and gets empty table values if there is no
+    match. Null keys match null keys, unless `match_nulls` is False.
+
+    Keys of both the table and left rows may be normalized before matching, e.g. to match them case-insensitively.
+    """
+
+    def __init__(self, table: DataFrame, key: Hashable, match_nulls: bool = True, normalize: Callable = None):
+        """
+        Build index
+
+        :param table: table to index; its index is ignored
+        :param key: key column of the table
+        :param match_nulls: null keys of left rows match null keys of the table
+        :param normalize: function normalizing key column (`pandas.Series`) values
+        """
+        self.table = table.reset_index(drop=True)
+        self.key = key
+        self.normalize = normalize
+        keys = self._get_keys(self.table[key])
+        null_keys = isnull(keys)
+        self._keys = Index(unique(keys[~null_keys]).tolist() + ([nan] if match_nulls and null_keys.any() else []),
+                           dtype=object)
+        codes = self._keys.get_indexer(keys)
+        valid = flatnonzero(codes >= 0)
+        # positions of table rows grouped by key, in table order within a group
+        self._positions = valid[argsort(codes[valid], kind='stable')]
+        self._counts = bincount(codes[valid], minlength=len(self._keys))
+        self._starts = cumsum(self._counts) - self._counts
+
+    def get_positions(self, keys) -> Tuple:
+        """
+        Get positions of joined rows
+
+        :param keys: keys of left rows
+        :return: array of left row positions and array of table row positions (-1 if there is no match)
+        """
+        codes = self._keys.get_indexer(self._get_keys(Series(keys)))
+        if not len(self._keys):
+            return arange(len(codes), dtype=int64), full(len(codes), -1, dtype=int64)
+        counts = where(codes >= 0, self._counts[codes], 0)
+        reps = maximum(counts, 1)
+        left_positions = repeat(arange(len(codes), dtype=int64), reps)
+        offsets = arange(reps.sum(), dtype=int64) - repeat(cumsum(reps) - reps, reps)
+        right_positions = where(repeat(counts, reps) > 0,
+                                self._positions[repeat(self._starts[codes], reps) + offsets], -1)
+        return left_positions, right_positions
+
+    def left_join(self, left: DataFrame, left_on: Hashable, right_columns: Dict[Hashable, Hashable]) -> DataFrame:
+        """
+        Join table rows to left dataframe
+
+        :param left: left dataframe
+        :param left_on: key column of the left dataframe
+        :param right_columns: table columns to join and their names in the result
+        :return: dataframe of left columns followed by table columns, with new range index
+        """
+        left_positions, right_positions = self.get_positions(left[left_on])
+        left_df = left.take(left_positions)
+        left_df.index = RangeIndex(len(left_df))
+        # missing positions are not in the table's range index, so they get empty values
+        right_df = self.table[list(right_columns)].reindex(right_positions)
+        right_df.index = left_df.index
+        right_df.columns = list(right_columns.values())
+        return concat([left_df, right_df], axis='columns')
+
+    def _get_keys(self, values: Series):
+        """
+        Get join keys of values; all kinds of nulls (None, NaN) are the same key, as they are for `DataFrame.merge`
+
+        :param values: values of key column
+        :return: object array of keys
+        """
+        if self.normalize is not None:
+            values = self.normalize(values)
+        keys = array(values, dtype=object)
+        keys[isnull(keys)] = nan
+        return keys
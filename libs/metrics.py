@@ -0,0 +1,156 @@
+import json
+import sys
+from contextlib import contextmanager
+from cProfile import Profile
+from datetime import datetime
+from os import getpid, makedirs, path
+from threading import Lock
+from time import perf_counter
+from typing import Dict, List
+
+try:
+    from resource import getpagesize, getrusage, RUSAGE_SELF
+except ImportError:
+    # not available on Windows
+    getrusage = None
+
+
+def get_rss_mb():
+    """
+    Get current resident set size of the current process
+
+    :return: RSS in megabytes or None if it cannot be measured on this platform
+    """
+    if getrusage is None:
+        return None
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        # /proc is available on Linux only
+        return None
+    return round(pages * getpagesize() / 1024 ** 2, 1)
+
+
+def get_peak_rss_mb(rss_mb: float = None):
+    """
+    Get peak resident set size of the current process over its whole lifetime, not of a stage
+
+    :param rss_mb: current RSS in megabytes, if it is measured already; by default, it is measured
+    :return: lifetime peak RSS in megabytes or None if it cannot be measured on this platform
+    """
+    if getrusage is None:
+        return None
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux and other Unix systems
+    divisor = 1024 ** 2 if sys.platform == 'darwin' else 1024
+    peak_rss_mb = round(getrusage(RUSAGE_SELF).ru_maxrss / divisor, 1)
+    if rss_mb is None:
+        rss_mb = get_rss_mb()
+    # ru_maxrss and current RSS are read separately and kernel updates them lazily, so the peak could be below the
+    # current RSS; the current RSS is the lower bound of the peak
+    return peak_rss_mb if rss_mb is None else max(peak_rss_mb, rss_mb)
+
+
+class Span:
+    def __init__(self, name: str, rows_in: int = None):
+        """
+        Metrics of a pipeline stage run
+
+        :param name: stage name
+        :param rows_in: number of input rows
+        """
+        self.name = name
+        self.started = datetime.now()
+        self.duration = None
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.matches = None
+        self.rss_start_mb = None
+        self.rss_end_mb = None
+        self.lifetime_peak_rss_mb = None
+        self.pid = getpid()
+
+    def to_dict(self) -> Dict:
+        return {'name': self.name, 'started': self.started.isoformat(), 'duration': self.duration,
+                'rows_in': self.rows_in, 'rows_out': self.rows_out, 'matches': self.matches,
+                'rss_start_mb': self.rss_start_mb, 'rss_end_mb': self.rss_end_mb,
+                'lifetime_peak_rss_mb': self.lifetime_peak_rss_mb, 'pid': self.pid}
+
+
+class Metrics:
+    """
+    Collects spans of pipeline stages: duration, input/output row counts, number of matched rows (for joins), RSS of
+    the process at the start and at the end of the stage and its lifetime peak RSS at the end of the stage.
+
+    Stages listed in `profiled_stages` are profiled with cProfile; the stats are dumped to the given files.
+    """
+
+    def __init__(self):
+        self.spans = []
+        self.profiled_stages = {}
+        self._lock = Lock()
+
+    @contextmanager
+    def span(self, name: str, rows_in: int = None):
+        """
+        Measure stage run. Row counts and matches may be set on the span within the context
+
+        :param name: stage name
+        :param rows_in: number of input rows
+        :return: context manager yielding `Span`
+        """
+        span = Span(name, rows_in)
+        span.rss_start_mb = get_rss_mb()
+        profile_filepath = self.profiled_stages.get(name)
+        profile = Profile() if profile_filepath else None
+        started = perf_counter()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield span
+        finally:
+            if profile is not None:
+                profile.disable()
+                makedirs(path.dirname(profile_filepath) or '.', exist_ok=True)
+                profile.dump_stats(profile_filepath)
+            span.duration = round(perf_counter() - started, 6)
+            span.rss_end_mb = get_rss_mb()
+            span.lifetime_peak_rss_mb = get_peak_rss_mb(span.rss_end_mb)
+            self.add_spans([span])
+
+    def add_spans(self, spans: List[Span]):
+        """
+        Add spans measured elsewhere, e.g. in worker process
+
+        :param spans: list of spans
+        :return: None
+        """
+        with self._lock:
+            self.spans += spans
+
+    def pop_spans(self) -> List[Span]:
+        """
+        Get spans and start collecting them from scratch
+
+        :return: spans collected since the previous call
+        """
+        with self._lock:
+            spans, self.spans = self.spans, []
+        return spans
+
+    def save(self, filepath: str):
+        """
+        Save spans to JSON file
+
+        :param filepath: path to JSON file
+        :return: None
+        """
+        makedirs(path.dirname(filepath) or '.', exist_ok=True)
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.started)
+        with open(filepath, 'w') as f:
+            json.dump({'spans': [s.to_dict() for s in spans]}, f, indent=2)
+
+
+# metrics of the current process
+metrics = Metrics()
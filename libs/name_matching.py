@@ -0,0 +1,493 @@
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from os import makedirs, path, replace
+from pickle import dump, load
+from itertools import repeat
+from math import ceil
+from multiprocessing import get_context
+from typing import Callable, Dict, List, Set, Tuple
+
+from numpy import array, flatnonzero, minimum, searchsorted, union1d, zeros, int32, int64
+from pandas import isnull
+from fuzzywuzzy import __version__ as fuzzywuzzy_version, fuzz
+from fuzzywuzzy.utils import full_process
+
+
+class RatioScorer:
+    """
+    `fuzz.ratio` of names processed the same way `fuzzywuzzy.process.extract` processes them.
+
+    `fuzz.ratio` never exceeds 2 * C / (L1 + L2), where C is the number of characters the compared strings have in
+    common (as multisets) and L1, L2 are their lengths. Scorers derived from `fuzz.ratio` compare strings prepared
+    from processed names (`prepare`), so the bound holds for prepared strings.
+    """
+    name = 'ratio'
+    # the bound does not hold for names sharing a token
+    unbounded_shared_tokens = False
+
+    @property
+    def version(self) -> str:
+        # scores depend on fuzzywuzzy version and on its sequence matcher implementation (python-Levenshtein or
+        # difflib)
+        return f'fuzz.{self.name}/{fuzzywuzzy_version}/{fuzz.SequenceMatcher.__module__}'
+
+    def process(self, name: str) -> str:
+        """
+        Process name the way `fuzzywuzzy.process.extract` processes query and choices for this scorer
+
+        :param name: name
+        :return: processed name
+        """
+        return full_process(name)
+
+    def preprocess(self, name: str) -> str:
+        """
+        Process name the way the scoring function processes strings passed to it directly
+
+        :param name: name
+        :return: string to score
+        """
+        return name
+
+    def prepare(self, processed_name: str) -> str:
+        """
+        Get string which `fuzz.ratio` is computed for
+
+        :param processed_name: processed name
+        :return: string whose characters bound the score
+        """
+        return processed_name
+
+    def __call__(self, s1: str, s2: str) -> int:
+        return fuzz.ratio(s1, s2)
+
+
+class TokenSortScorer(RatioScorer):
+    """
+    `fuzz.token_sort_ratio`: `fuzz.ratio` of names with sorted tokens
+    """
+    name = 'token_sort'
+
+    def process(self, name: str) -> str:
+        return full_process(name, force_ascii=True)
+
+    def preprocess(self, name: str) -> str:
+        return self.process(name)
+
+    def prepare(self, processed_name: str) -> str:
+        return ' '.join(sorted(processed_name.split()))
+
+    def __call__(self, s1: str, s2: str) -> int:
+        return fuzz.token_sort_ratio(s1, s2, full_process=False)
+
+
+class TokenSetScorer(TokenSortScorer):
+    """
+    `fuzz.token_set_ratio`: maximum `fuzz.ratio` of common tokens and common tokens followed by the rest of either
+    name. Names without common tokens get `fuzz.ratio` of their sorted unique tokens.
+    """
+    name = 'token_set'
+    unbounded_shared_tokens = True
+
+    def prepare(self, processed_name: str) -> str:
+        return ' '.join(sorted(set(processed_name.split())))
+
+    def __call__(self, s1: str, s2: str) -> int:
+        return fuzz.token_set_ratio(s1, s2, full_process=False)
+
+
+SCORERS = {scorer.name: scorer for scorer in (RatioScorer(), TokenSortScorer(), TokenSetScorer())}
+
+# legal form suffixes of company names ignored by `normalize_name`, without dots and in lower case
+LEGAL_SUFFIXES = frozenset(['inc', 'incorporated', 'llc', 'llp', 'lp', 'ltd', 'limited', 'gmbh', 'corp',
+                            'corporation', 'co', 'company', 'plc', 'ag', 'sa', 'bv', 'srl', 'pty'])
+
+
+class CachedScorer:
+    """
+    Scorer remembering scores of already scored string pairs.
+
+    Known scores may be preloaded, e.g. from a persistent cache; scores computed afterwards are collected separately,
+    so that only they have to be stored back.
+    """
+
+    def __init__(self, scorer: RatioScorer = SCORERS['ratio'], scores: Dict[Tuple[str, str], int] = None):
+        """
+        :param scorer: scorer computing unknown scores, see `SCORERS`
+        :param scores: known scores of string pairs
+        """
+        self.scorer = scorer
+        self.scores = dict(scores or {})
+        self.new_scores = {}
+
+    def __call__(self, s1: str, s2: str) -> int:
+        key = (s1, s2)
+        score = self.scores.get(key)
+        if score is None:
+            score = self.scores[key] = self.new_scores[key] = self.scorer(s1, s2)
+        return score
+
+    def update(self, scores: Dict[Tuple[str, str], int]):
+        """
+        Add scores computed elsewhere (e.g. in worker process) to new scores
+
+        :param scores: scores of string pairs
+        :return: None
+        """
+        self.scores.update(scores)
+        self.new_scores.update(scores)
+
+    def pop_new_scores(self) -> Dict[Tuple[str, str], int]:
+        """
+        Get new scores and start collecting them from scratch
+
+        :return: scores computed since the previous call
+        """
+        new_scores, self.new_scores = self.new_scores, {}
+        return new_scores
+
+
+def normalize_name(name) -> str:
+    """
+    Get key of company name which is the same for names differing only by case, punctuation, whitespace and trailing
+    legal form suffixes (Inc, LLC, Ltd, GmbH etc.), e.g. `Acme, Inc.` and `ACME LLC`
+
+    :param name: company name
+    :return: lower case alphanumeric characters of the name without legal form suffixes; None for empty name
+    """
+    if isnull(name):
+        return None
+    # dots are dropped rather than separate tokens, so that abbreviations (S.A., A.B.C.) stay single tokens
+    tokens = full_process(str(name).replace('.', '')).split()
+    # a name consisting of suffixes only keeps them
+    while len(tokens) > 1 and tokens[-1] in LEGAL_SUFFIXES:
+        tokens.pop()
+    return ''.join(tokens) or None
+
+
+def get_name_scorer(scorer: Callable) -> RatioScorer:
+    """
+    Get scorer computing scores
+
+    :param scorer: one of `SCORERS` or `CachedScorer`
+    :return: one of `SCORERS`
+    """
+    return scorer.scorer if isinstance(scorer, CachedScorer) else scorer
+
+
+class MatchSet:
+    """
+    Complete fuzzy matches of processed queries, i.e. all processed names having ratio at or above threshold.
+
+    Matches stay complete for names which the matches were computed against, so when names change only added names
+    have to be matched again.
+    """
+
+    def __init__(self, threshold: int, names: Set[str], matches: Dict[str, Dict[str, int]],
+                 scorer_version: str = SCORERS['ratio'].version):
+        """
+        :param threshold: minimum similarity ratio of matching names
+        :param names: processed names which the queries were matched against
+        :param matches: matching processed names and their ratios per processed query
+        :param scorer_version: version of scorer which computed the ratios
+        """
+        self.threshold = threshold
+        self.names = names
+        self.matches = matches
+        self.scorer_version = scorer_version
+
+    @classmethod
+    def load(cls, filepath: str, scorer_version: str = SCORERS['ratio'].version):
+        """
+        Load match set saved with `save`
+
+        :param filepath: path to match set file
+        :param scorer_version: version of scorer the match set has to be computed by
+        :return: match set or None if the file does not exist or has been saved by another scorer version
+        """
+        if not path.exists(filepath):
+            return None
+        with open(filepath, 'rb') as f:
+            saved_scorer_version, match_set = load(f)
+        if saved_scorer_version != scorer_version:
+            return None
+        # match sets saved before scorers became selectable lack the attribute
+        match_set.scorer_version = saved_scorer_version
+        return match_set
+
+    def save(self, filepath: str):
+        """
+        Save match set
+
+        :param filepath: path to match set file
+        :return: None
+        """
+        makedirs(path.dirname(filepath) or '.', exist_ok=True)
+        tmp_filepath = f'{filepath}.tmp'
+        with open(tmp_filepath, 'wb') as f:
+            dump((self.scorer_version, self), f)
+        replace(tmp_filepath, filepath)
+
+
+class NameMatchIndex:
+    """
+    Index of names which shortlists fuzzy match candidates, so that hopeless pairs are never scored.
+
+    Names are processed the same way `fuzzywuzzy.process.extract` processes them for the scorer. Ratio of prepared
+    strings (see `RatioScorer`) never exceeds 2 * C / (L1 + L2), so for a query:
+
+    * names are sorted by prepared length and only the range of lengths which may reach the threshold is looked at
+      (it is found by binary search);
+    * common character counts of names within the range are accumulated from per-character posting lists, and only
+      names whose upper bound reaches the threshold are scored.
+
+    The bound does not hold for token set ratio of names sharing a token, so such names are always scored.
+    """
+
+    def __init__(self, names: List, scorer: RatioScorer = SCORERS['ratio']):
+        """
+        Build index over names
+
+        :param names: list of names (choices); duplicates and nulls are allowed, nulls are never matched
+        :param scorer: scorer names are going to be scored with, see `SCORERS`
+        """
+        self.names = list(names)
+        self.scorer = scorer
+        # unique processed names and positions of source names having the same processed value
+        processed_names = {}
+        for pos, name in enumerate(self.names):
+            if isnull(name):
+                continue
+            processed_names.setdefault(scorer.process(str(name)), []).append(pos)
+        prepared = {processed: scorer.prepare(processed) for processed in processed_names}
+        # names are ordered by prepared length, so names of a length range have consecutive ids
+        self._processed = sorted(processed_names, key=lambda p: len(prepared[p]))
+        self._positions = [processed_names[processed] for processed in self._processed]
+        self._processed_ids = {processed: idx for idx, processed in enumerate(self._processed)}
+        self._lengths = array([len(prepared[p]) for p in self._processed], dtype=int64)
+
+        # ids of posting lists are ascending
+        postings = {}
+        tokens = {}
+        for idx, processed in enumerate(self._processed):
+            for char, count in Counter(prepared[processed]).items():
+                postings.setdefault(char, ([], []))
+                postings[char][0].append(idx)
+                postings[char][1].append(count)
+            if scorer.unbounded_shared_tokens:
+                for token in set(processed.split()):
+                    tokens.setdefault(token, []).append(idx)
+        self._postings = {char: (array(ids, dtype=int64), array(counts, dtype=int32))
+                          for char, (ids, counts) in postings.items()}
+        self._tokens = {token: array(ids, dtype=int64) for token, ids in tokens.items()}
+
+    def _get_length_range(self, length: int, threshold: int) -> Tuple[int, int]:
+        """
+        Get range of ids of names whose prepared length allows ratio at or above threshold
+
+        :param length: prepared query length
+        :param threshold: minimum similarity ratio, between 1 and 100
+        :return: first id and id following the last one
+        """
+        # ratio is rounded to integer, so 100 * 2 * min(L1, L2) / (L1 + L2) >= threshold - 0.5 is required
+        min_length = -(-(2 * threshold - 1) * length // (401 - 2 * threshold))
+        max_length = (401 - 2 * threshold) * length // (2 * threshold - 1)
+        return (int(searchsorted(self._lengths, min_length, side='left')),
+                int(searchsorted(self._lengths, max_length, side='right')))
+
+    def _get_candidates(self, processed_query: str, threshold: int):
+        """
+        Get ids of processed names which may have ratio with processed query at or above threshold
+
+        :param processed_query: processed query
+        :param threshold: minimum similarity ratio
+        :return: array of processed name ids
+        """
+        if threshold <= 0:
+            return range(len(self._processed))
+        if threshold > 100:
+            return range(0)
+        prepared_query = self.scorer.prepare(processed_query)
+        start, stop = self._get_length_range(len(prepared_query), threshold)
+        common = zeros(stop - start, dtype=int64)
+        for char, count in Counter(prepared_query).items():
+            if char in self._postings:
+                ids, counts = self._postings[char]
+                first, last = searchsorted(ids, start), searchsorted(ids, stop)
+                common[ids[first:last] - start] += minimum(counts[first:last], count)
+        candidates = start + flatnonzero(
+            400 * common >= (2 * threshold - 1) * (len(prepared_query) + self._lengths[start:stop]))
+        if self.scorer.unbounded_shared_tokens:
+            for token in set(processed_query.split()):
+                if token in self._tokens:
+                    candidates = union1d(candidates, self._tokens[token])
+        return candidates
+
+    @property
+    def processed_names(self) -> Set[str]:
+        """
+        Processed names of the index
+        """
+        return set(self._processed_ids)
+
+    def get_names(self, processed_names: Set[str]) -> List:
+        """
+        Get one source name per processed name
+
+        :param processed_names: processed names
+        :return: list of source names in order of the names list
+        """
+        return [self.names[pos] for pos in sorted(self._positions[self._processed_ids[processed]][0]
+                                                  for processed in processed_names
+                                                  if processed in self._processed_ids)]
+
+    def match(self, processed_query: str, threshold: int, scorer: Callable = None) -> Dict[str, int]:
+        """
+        Find all processed names having ratio with processed query at or above threshold
+
+        :param processed_query: processed query
+        :param threshold: minimum similarity ratio of names to return
+        :param scorer: scorer of the index or its equivalent, e.g. `CachedScorer`
+        :return: dictionary of matching processed names and their ratios
+        """
+        scorer = scorer or self.scorer
+        matches = {}
+        for idx in self._get_candidates(processed_query, threshold):
+            score = scorer(processed_query, self._processed[idx])
+            if score >= threshold:
+                matches[self._processed[idx]] = score
+        return matches
+
+    def select(self, matches: Dict[str, int], limit: int = 10) -> List[Tuple]:
+        """
+        Select best matching names.
+
+        :param matches: dictionary of matching processed names and their ratios; processed names absent in the index
+            are ignored
+        :param limit: maximum number of names to return
+        :return: list of (name, ratio) tuples ordered by ratio descending, then by position in names list
+        """
+        positions = []
+        for processed, score in matches.items():
+            idx = self._processed_ids.get(processed)
+            if idx is not None:
+                positions += [(score, pos) for pos in self._positions[idx]]
+        positions.sort(key=lambda x: (-x[0], x[1]))
+        return [(self.names[pos], score) for score, pos in positions[:limit]]
+
+    def extract(self, query, threshold: int, limit: int = 10, scorer: Callable = None) -> List[Tuple]:
+        """
+        Find best matching names for query.
+
+        Result is the same as `process.extract(query, names, scorer=<fuzz function of the scorer>, limit=limit)`
+        filtered by threshold
+
+        :param query: query string
+        :param threshold: minimum similarity ratio of names to return
+        :param limit: maximum number of names to return
+        :param scorer: scorer of the index or its equivalent, e.g. `CachedScorer`
+        :return: list of (name, ratio) tuples ordered by ratio descending, then by position in names list
+        """
+        return self.select(self.match(self.scorer.process(query), threshold, scorer), limit)
+
+
+# name index and scorer of the current worker process, see `_init_worker`
+_worker_index = None
+_worker_scorer = None
+
+
+def _init_worker(names: List, scorer: Callable):
+    """
+    Build name index once per worker process
+
+    :param names: list of names (choices)
+    :param scorer: one of `SCORERS` or `CachedScorer`
+    :return: None
+    """
+    global _worker_index, _worker_scorer
+    _worker_index = NameMatchIndex(names, get_name_scorer(scorer))
+    _worker_scorer = scorer
+
+
+def _match_chunk(processed_queries: List[str], threshold: int) -> Tuple[List[Dict[str, int]], Dict]:
+    """
+    Find all matching names for a chunk of processed queries using index of the current worker process
+
+    :param processed_queries: list of processed queries
+    :param threshold: minimum similarity ratio of names to return
+    :return: list of matches per query and scores newly computed by `CachedScorer` (if it is used)
+    """
+    matches = [_worker_index.match(query, threshold, _worker_scorer) for query in processed_queries]
+    new_scores = _worker_scorer.pop_new_scores() if isinstance(_worker_scorer, CachedScorer) else {}
+    return matches, new_scores
+
+
+def _match_many(index: NameMatchIndex, processed_queries: List[str], threshold: int, workers: int,
+                scorer: Callable) -> List[Dict[str, int]]:
+    """
+    Find all matching names for every processed query, optionally in parallel worker processes
+
+    :param index: index of names
+    :param processed_queries: list of processed queries
+    :param threshold: minimum similarity ratio of names to return
+    :param workers: number of worker processes; 1 - match in the current process
+    :param scorer: scorer of the index or its equivalent; `CachedScorer` gets scores computed by workers as new scores
+    :return: list of matches per query, see `NameMatchIndex.match`
+    """
+    if workers <= 1 or len(processed_queries) <= 1:
+        return [index.match(query, threshold, scorer) for query in processed_queries]
+    # several chunks per worker even out differences in chunk scoring time
+    chunk_size = ceil(len(processed_queries) / (workers * 4))
+    chunks = [processed_queries[i:i + chunk_size] for i in range(0, len(processed_queries), chunk_size)]
+    result = []
+    # matching runs in pipeline stage threads, and forking a multi-threaded process may deadlock the workers
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'), initializer=_init_worker,
+                             initargs=(index.names, scorer)) as executor:
+        for chunk_matches, new_scores in executor.map(_match_chunk, chunks, repeat(threshold)):
+            result += chunk_matches
+            if new_scores:
+                scorer.update(new_scores)
+    return result
+
+
+def extract_many(names: List, queries: List[str], threshold: int, limit: int = 10, workers: int = 1,
+                 scorer: Callable = SCORERS['ratio'], previous_matches: MatchSet = None,
+                 index: NameMatchIndex = None) -> Tuple[List[List[Tuple]], MatchSet]:
+    """
+    Find best matching names for every query, optionally in parallel worker processes.
+
+    Every distinct processed query is matched once. Queries are split into chunks which are scored in a process pool;
+    every worker builds the name index once. Matches are returned in the order of queries, so the result does not
+    depend on the number of workers.
+
+    Queries found in previous matches are matched only against names added since then, provided that previous
+    matches were computed by the same scorer with the same or lower threshold.
+
+    :param names: list of names (choices)
+    :param queries: list of query strings
+    :param threshold: minimum similarity ratio of names to return
+    :param limit: maximum number of names to return per query
+    :param workers: number of worker processes; 1 - match in the current process
+    :param scorer: one of `SCORERS` or `CachedScorer`, which gets scores computed by workers as new scores
+    :param previous_matches: complete matches of the previous run
+    :param index: index of the names built for the scorer beforehand, e.g. kept between calls; by default, the index
+        is built from scratch
+    :return: list of matches per query (see `NameMatchIndex.extract`) and complete matches of the queries
+    """
+    name_scorer = get_name_scorer(scorer)
+    if index is None:
+        index = NameMatchIndex(names, name_scorer)
+    processed_queries = [name_scorer.process(query) for query in queries]
+    matches = {}
+    if previous_matches is not None and previous_matches.scorer_version == name_scorer.version and \
+            previous_matches.threshold <= threshold:
+        added_index = NameMatchIndex(index.get_names(index.processed_names - previous_matches.names), name_scorer)
+        for query in dict.fromkeys(processed_queries):
+            query_matches = previous_matches.matches.get(query)
+            if query_matches is not None:
+                matches[query] = {name: score for name, score in query_matches.items() if score >= threshold}
+                matches[query].update(added_index.match(query, threshold, scorer))
+    unmatched_queries = [query for query in dict.fromkeys(processed_queries) if query not in matches]
+    matches.update(zip(unmatched_queries, _match_many(index, unmatched_queries, threshold, workers, scorer)))
+    result = [index.select(matches[query], limit) for query in processed_queries]
+    return result, MatchSet(threshold, index.processed_names, matches, name_scorer.version)
@@ -0,0 +1,98 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+from multiprocessing import get_context
+from typing import Any, Callable, Dict, Iterable
+
+from libs.metrics import metrics
+
+
+class PipelineStage:
+    def __init__(self, name: str, func: Callable, dependencies: Iterable[str] = (), in_subprocess: bool = False):
+        """
+        :param name: stage name
+        :param func: function computing stage result; it gets results of dependencies as positional arguments
+        :param dependencies: names of stages whose results the stage depends on
+        :param in_subprocess: run the function in a worker process; the function, its arguments and result must be
+            picklable
+        """
+        self.name = name
+        self.func = func
+        self.dependencies = list(dependencies)
+        self.in_subprocess = in_subprocess
+
+
+class Pipeline:
+    """
+    Runs stages concurrently, every stage starts as soon as the stages it depends on are done.
+
+    Stages run in threads of the current process, except stages marked to run in subprocess, which are passed to
+    a pool of worker processes (e.g. CPU-bound parsing). Worker processes are spawned rather than forked, because
+    forking a process running several threads is unsafe. Metrics spans of stages run in subprocess are passed to
+    metrics of the current process. Without worker processes, all the stages run in threads of the current process.
+    """
+
+    def __init__(self, process_workers: int = 1):
+        """
+        :param process_workers: maximum number of worker processes running stages marked to run in subprocess; 0 to
+            run them in the current process, e.g. when spawning workers takes longer than the stages
+        """
+        self.process_workers = process_workers
+        self._stages = {}
+
+    def add_stage(self, name: str, func: Callable, dependencies: Iterable[str] = (), in_subprocess: bool = False):
+        """
+        Add stage to pipeline. Stages it depends on have to be added beforehand
+
+        :param name: stage name
+        :param func: function computing stage result; it gets results of dependencies as positional arguments
+        :param dependencies: names of stages whose results the stage depends on
+        :param in_subprocess: run the function in a worker process
+        :return: None
+        """
+        if name in self._stages:
+            raise ValueError(f'Stage {name} already exists')
+        stage = PipelineStage(name, func, dependencies, in_subprocess)
+        unknown = [d for d in stage.dependencies if d not in self._stages]
+        if unknown:
+            raise ValueError(f'Stage {name} depends on unknown stages: {", ".join(unknown)}')
+        self._stages[name] = stage
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Run all the stages and wait for them to finish
+
+        :return: dictionary of stage names and their results
+        :raise: exception of the first failed stage (in order of adding)
+        """
+        futures = {}
+        process_context = get_context('spawn')
+        process_pool = ProcessPoolExecutor(max_workers=self.process_workers, mp_context=process_context) \
+            if self.process_workers > 0 else nullcontext()
+        # every stage gets its own thread, so stages waiting for dependencies never block ready ones
+        with process_pool as process_executor, \
+                ThreadPoolExecutor(max_workers=max(len(self._stages), 1)) as thread_executor:
+            for name, stage in self._stages.items():
+                futures[name] = thread_executor.submit(self._run_stage, stage, [futures[d] for d in stage.dependencies],
+                                                       process_executor)
+            return {name: future.result() for name, future in futures.items()}
+
+    @staticmethod
+    def _run_stage(stage: PipelineStage, dependency_futures: list, process_executor: ProcessPoolExecutor):
+        args = [future.result() for future in dependency_futures]
+        if stage.in_subprocess and process_executor is not None:
+            result, spans = process_executor.submit(_run_in_subprocess, stage.func, *args).result()
+            metrics.add_spans(spans)
+            return result
+        return stage.func(*args)
+
+
+def _run_in_subprocess(func: Callable, *args):
+    """
+    Run stage function in worker process
+
+    :param func: stage function
+    :param args: stage function arguments
+    :return: stage result and metrics spans collected while computing it
+    """
+    metrics.pop_spans()
+    return func(*args), metrics.pop_spans()
@@ -0,0 +1,180 @@
+from os import path
+from posixpath import basename, dirname, join, normpath
+from typing import Dict, Iterable, List
+from xml.etree.ElementTree import iterparse
+from zipfile import ZipFile
+
+# mandatory columns of source workbooks by attribute names of dataframe columns read from them (see
+# `libs.data_model`); the module imports neither pandas nor openpyxl, so that workbooks are checked in a fraction of
+# a second
+NORTHSTAR_COLUMNS = {'license_key': 'license key', 'user_role': 'user role'}
+ANCHOR_COLUMNS = {'salesforce_id': 'Salesforce ID', 'company_name': 'Company', 'contact_name': 'Name',
+                  'contact_email': 'Email', 'license_key': 'License Key', 'status': 'Status'}
+SALESFORCE_COLUMNS = {'salesforce_id': 'Account 18 digit Id', 'company_name': 'Account Name',
+                      'country': 'Billing Country', 'brand_id': 'Brand ID', 'products': 'Current Products',
+                      'contact_first_name': 'First Name', 'contact_last_name': 'Last Name', 'contact_email': 'Email',
+                      'license_key': 'TPS License Information'}
+
+_WORKSHEET_RELATIONSHIP = '/worksheet'
+_SHARED_STRINGS_RELATIONSHIP = '/sharedStrings'
+
+
+def _get_local_name(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+
+def _get_relationships(archive: ZipFile, part: str) -> Dict[str, tuple]:
+    """
+    Read relationships of workbook part
+
+    :param archive: workbook archive
+    :param part: path of the part in the archive, e.g. xl/workbook.xml
+    :return: dictionary of relationship IDs and pairs of relationship type and target part path
+    """
+    relationships = {}
+    with archive.open(join(dirname(part), '_rels', f'{basename(part)}.rels')) as f:
+        for _, element in iterparse(f):
+            if _get_local_name(element.tag) == 'Relationship':
+                target = element.get('Target')
+                # targets are relative to the folder of the part, unless they are absolute
+                target = target.lstrip('/') if target.startswith('/') else normpath(join(dirname(part), target))
+                relationships[element.get('Id')] = (element.get('Type'), target)
+    return relationships
+
+
+def _get_text(element) -> str:
+    """
+    :param element: shared string (`si`) or inline string (`is`) element
+    :return: text of plain string or of rich text runs, without phonetic runs
+    """
+    texts = []
+    for child in element:
+        if _get_local_name(child.tag) == 't':
+            texts.append(child.text or '')
+        elif _get_local_name(child.tag) == 'r':
+            texts += [t.text or '' for t in child if _get_local_name(t.tag) == 't']
+    return ''.join(texts)
+
+
+def _get_column_index(coordinate: str) -> int:
+    """
+    :param coordinate: cell coordinate, e.g. AB1
+    :return: zero-based column index
+    """
+    index = 0
+    for char in coordinate:
+        if not char.isalpha():
+            break
+        index = index * 26 + ord(char.upper()) - ord('A') + 1
+    return index - 1
+
+
+def _read_xlsx_header(filepath: str) -> List:
+    """
+    Read the first row of the first worksheet in Excel workbook straight from its XML parts.
+
+    Unlike openpyxl read-only mode, the worksheet is parsed only up to the end of its first row, even if it has no
+    dimension element, and only the shared strings used by the row are looked up.
+
+    :param filepath: path to Excel workbook
+    :return: list of cell values: strings, numbers, booleans or None for empty cells
+    """
+    with ZipFile(filepath) as archive:
+        relationships = _get_relationships(archive, 'xl/workbook.xml')
+        sheet_part = None
+        with archive.open('xl/workbook.xml') as f:
+            for _, element in iterparse(f):
+                if _get_local_name(element.tag) != 'sheet':
+                    continue
+                # the relationship ID attribute is namespaced, the namespace differs between Excel dialects
+                rel_id = next(v for k, v in element.attrib.items() if k.startswith('{') and _get_local_name(k) == 'id')
+                rel_type, target = relationships[rel_id]
+                if rel_type.endswith(_WORKSHEET_RELATIONSHIP):
+                    sheet_part = target
+                    break
+        if sheet_part is None:
+            return []
+
+        cells = {}
+        with archive.open(sheet_part) as f:
+            for event, element in iterparse(f, events=('start', 'end')):
+                name = _get_local_name(element.tag)
+                if event == 'start':
+                    if name == 'row' and element.get('r', '1') != '1':
+                        # the first row is empty
+                        return []
+                    continue
+                if name == 'row':
+                    break
+                if name != 'c':
+                    continue
+                coordinate = element.get('r')
+                column = _get_column_index(coordinate) if coordinate else max(cells, default=-1) + 1
+                data_type = element.get('t', 'n')
+                if data_type == 'inlineStr':
+                    inline = next((child for child in element if _get_local_name(child.tag) == 'is'), None)
+                    cells[column] = (data_type, _get_text(inline) if inline is not None else None)
+                else:
+                    value = next((child.text for child in element if _get_local_name(child.tag) == 'v'), None)
+                    cells[column] = (data_type, value or None)
+
+        shared_indexes = {int(value) for data_type, value in cells.values() if data_type == 's' and value is not None}
+        shared_strings = {}
+        if shared_indexes:
+            shared_strings_part = next(target for rel_type, target in relationships.values()
+                                       if rel_type.endswith(_SHARED_STRINGS_RELATIONSHIP))
+            with archive.open(shared_strings_part) as f:
+                index = 0
+                for _, element in iterparse(f):
+                    if _get_local_name(element.tag) != 'si':
+                        continue
+                    if index in shared_indexes:
+                        shared_strings[index] = _get_text(element).replace('x005F_', '')
+                    element.clear()
+                    index += 1
+                    if index > max(shared_indexes):
+                        break
+
+    header = [None] * (max(cells) + 1 if cells else 0)
+    for column, (data_type, value) in cells.items():
+        if value is None:
+            continue
+        if data_type == 's':
+            value = shared_strings[int(value)]
+        elif data_type == 'b':
+            value = bool(int(value))
+        elif data_type == 'n':
+            value = float(value) if any(char in value for char in '.Ee') else int(value)
+        header[column] = value
+    return header
+
+
+def read_excel_header(filepath: str) -> List:
+    """
+    Read column names of the first worksheet in Excel workbook; only the first row is read
+
+    :param filepath: path to Excel workbook (.xlsx) or legacy Excel workbook (.xls)
+    :return: list of column names
+    """
+    if path.splitext(filepath)[1].lower() == '.xls':
+        from xlrd import open_workbook
+
+        workbook = open_workbook(filepath, on_demand=True)
+        try:
+            sheet = workbook.sheet_by_index(0)
+            return sheet.row_values(0) if sheet.nrows else []
+        finally:
+            workbook.release_resources()
+    return _read_xlsx_header(filepath)
+
+
+def get_missing_columns(src_filepath: str, columns: Iterable[str]) -> List[str]:
+    """
+    Check header row of source Excel workbook without reading the rest of it
+
+    :param src_filepath: path to source Excel workbook
+    :param columns: names of mandatory columns, e.g. values of `ANCHOR_COLUMNS`
+    :return: list of mandatory columns missing in the workbook
+    """
+    header = read_excel_header(src_filepath)
+    return [column for column in columns if column not in header]
@@ -0,0 +1,81 @@
+import sqlite3
+from time import time
+from typing import Iterable
+
+from libs.name_matching import CachedScorer, SCORERS
+
+
+class ScoreCache:
+    """
+    Persistent cache of name pair similarity ratios stored in SQLite database.
+
+    Only scores of pairs whose first name is loaded with `load` are read from the database. Scores computed during
+    the run are written back by `save`; once the cache exceeds the maximum number of entries, least recently used
+    entries get evicted.
+    """
+    DEFAULT_MAX_ENTRIES = 1000000
+
+    def __init__(self, filepath: str, max_entries: int = DEFAULT_MAX_ENTRIES, scorer: str = 'ratio'):
+        """
+        Open cache database, create it if it does not exist
+
+        :param filepath: path to SQLite database file
+        :param max_entries: maximum number of scores to keep in the cache
+        :param scorer: name of scorer whose scores are cached, see `SCORERS`; scores of every scorer (and its version)
+            are kept apart
+        """
+        self.max_entries = max_entries
+        self.scorer = CachedScorer(SCORERS[scorer])
+        self._loaded_names = set()
+        self._connection = sqlite3.connect(filepath)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS scores (scorer TEXT NOT NULL, name1 TEXT NOT NULL, '
+                                 'name2 TEXT NOT NULL, score INTEGER NOT NULL, used REAL NOT NULL, '
+                                 'PRIMARY KEY (scorer, name1, name2))')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS scores_used ON scores (used)')
+        self._connection.execute('CREATE TEMP TABLE loaded_names (name TEXT PRIMARY KEY)')
+
+    def load(self, names: Iterable[str]):
+        """
+        Load cached scores of pairs whose first name is one of given names into `scorer` and mark them as used
+
+        :param names: first names of pairs
+        :return: None
+        """
+        names = set(names) - self._loaded_names
+        if not names:
+            return
+        self._loaded_names |= names
+        with self._connection:
+            self._connection.execute('DELETE FROM loaded_names')
+            self._connection.executemany('INSERT INTO loaded_names VALUES (?)', ((n,) for n in names))
+            rows = self._connection.execute('SELECT name1, name2, score FROM scores JOIN loaded_names ON name1 = name '
+                                            'WHERE scorer = ?', (self.scorer.scorer.version,))
+            self.scorer.scores.update(((name1, name2), score) for name1, name2, score in rows)
+            self._connection.execute('UPDATE scores SET used = ? WHERE scorer = ? AND '
+                                     'name1 IN (SELECT name FROM loaded_names)', (time(), self.scorer.scorer.version))
+
+    def save(self):
+        """
+        Store newly computed scores and evict least recently used entries exceeding the maximum number of entries
+
+        :return: None
+        """
+        used = time()
+        with self._connection:
+            self._connection.executemany('INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?)',
+                                         ((self.scorer.scorer.version, name1, name2, score, used)
+                                          for (name1, name2), score in self.scorer.pop_new_scores().items()))
+            count = self._connection.execute('SELECT COUNT(*) FROM scores').fetchone()[0]
+            if count > self.max_entries:
+                self._connection.execute('DELETE FROM scores WHERE rowid IN '
+                                         '(SELECT rowid FROM scores ORDER BY used LIMIT ?)',
+                                         (count - self.max_entries,))
+
+    def close(self):
+        """
+        Save cache and close database
+
+        :return: None
+        """
+        self.save()
+        self._connection.close()
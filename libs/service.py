@@ -0,0 +1,233 @@
+import json
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from os import close, path, remove, stat
+from tempfile import mkstemp
+from threading import Lock
+from time import perf_counter
+from typing import Dict
+
+from libs.data_model import COLUMN_LEVEL_SEPARATOR, AnchorDataframe, AnchorNorthstarDataframe, BaseDataframe, \
+    NorthStarDataframe, SalesForceDataframe, AnchorSalesforceAccountsDataframe, AnchorSalesforceContactsDataframe
+from libs.metrics import metrics
+from libs.name_matching import SCORERS
+from libs.score_cache import ScoreCache
+from libs.utils import save_dataframes_to_excel
+
+EXCEL_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def get_reconcile_params(params) -> Dict:
+    """
+    Validate parameters of reconciliation request before reconciling, so that errors of invalid requests are told
+    apart from reconciliation failures
+
+    :param params: JSON object of the request
+    :return: dictionary of `ReconciliationService.reconcile` arguments except result file path
+    :raise ValueError: if parameters are invalid
+    """
+    if not isinstance(params, dict):
+        raise ValueError('Expected JSON object of anchor_file and northstar_file paths')
+    filepaths = {}
+    for name, dataframe_class in (('anchor_file', AnchorDataframe), ('northstar_file', NorthStarDataframe)):
+        filepath = params.get(name)
+        if not isinstance(filepath, str):
+            raise ValueError(f'{name} must be a path string')
+        if not path.isfile(filepath):
+            raise ValueError(f'File {filepath} does not exist')
+        missing_columns = dataframe_class.get_missing_columns(filepath)
+        if missing_columns:
+            raise ValueError(f'Columns expected but not found in {filepath}: {missing_columns}')
+        filepaths[name] = filepath
+    for name in ('threshold', 'contact_threshold'):
+        value = params.get(name)
+        # booleans are integers in Python, but not ratios
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool) or not 0 <= value <= 100):
+            raise ValueError(f'{name} must be an integer between 0 and 100')
+    name_scorer = params.get('name_scorer')
+    if name_scorer is not None and name_scorer not in SCORERS:
+        raise ValueError(f'Unknown account name scorer {name_scorer!r}, expected one of {list(SCORERS)}')
+    return {'anchor_filepath': filepaths['anchor_file'], 'northstar_filepath': filepaths['northstar_file'],
+            'threshold': params.get('threshold'), 'name_scorer': name_scorer,
+            'contact_threshold': params.get('contact_threshold')}
+
+
+class ReconciliationService:
+    """
+    Reconciles Anchor/Northstar workbooks against Salesforce data kept loaded between requests.
+
+    Salesforce workbook is read and indexed (account and contact tables, join indexes, name match indexes) once; it is
+    read again only when its modification time or size changes. Requests are reconciled one at a time.
+    """
+
+    def __init__(self, salesforce_filepath: str, threshold: int = 75, name_scorer: str = 'ratio',
+                 contact_threshold: int = None, workers: int = 1, score_cache_filepath: str = None,
+                 score_cache_max_entries: int = ScoreCache.DEFAULT_MAX_ENTRIES, snapshot_dir: str = None):
+        """
+        :param salesforce_filepath: path to Salesforce Excel workbook
+        :param threshold: default account name match ratio threshold, see `AnchorSalesforceAccountsDataframe`
+        :param name_scorer: default account name scorer, see `SCORERS`
+        :param contact_threshold: default contact name match ratio threshold, see
+            `AnchorSalesforceContactsDataframe`; by default, contacts are matched by e-mail only
+        :param workers: number of worker processes used for account name fuzzy matching
+        :param score_cache_filepath: path to SQLite file caching name similarity ratios; by default, ratios are not
+            cached
+        :param score_cache_max_entries: maximum number of cached ratios
+        :param snapshot_dir: directory keeping snapshots of read workbooks, see `BaseDataframe`
+        """
+        self.salesforce_filepath = salesforce_filepath
+        self.defaults = {'threshold': threshold, 'name_scorer': name_scorer, 'contact_threshold': contact_threshold}
+        self.workers = workers
+        self.score_cache_filepath = score_cache_filepath
+        self.score_cache_max_entries = score_cache_max_entries
+        self.snapshot_dir = snapshot_dir
+        self._salesforce = None
+        self._salesforce_stat = None
+        self._lock = Lock()
+
+    def get_salesforce(self) -> SalesForceDataframe:
+        """
+        Get Salesforce dataframe object, read the workbook if it has changed since it was read last time
+
+        :return: Salesforce dataframe object
+        """
+        src_stat = stat(self.salesforce_filepath)
+        src_stat = (src_stat.st_mtime_ns, src_stat.st_size)
+        if self._salesforce is None or src_stat != self._salesforce_stat:
+            self._salesforce = None
+            self._salesforce = SalesForceDataframe(self.salesforce_filepath, self.snapshot_dir)
+            self._salesforce_stat = src_stat
+        return self._salesforce
+
+    def get_status(self) -> dict:
+        """
+        :return: dictionary describing Salesforce data and default reconciliation parameters
+        """
+        salesforce = self._salesforce
+        return {'salesforce_file': self.salesforce_filepath,
+                'salesforce_rows': len(salesforce.df) if salesforce is not None else None,
+                'defaults': self.defaults}
+
+    def reconcile(self, anchor_filepath: str, northstar_filepath: str, result_filepath: str, threshold: int = None,
+                  name_scorer: str = None, contact_threshold: int = None):
+        """
+        Reconcile Anchor/Northstar workbooks against Salesforce data and save result Excel workbook
+
+        :param anchor_filepath: path to Anchor Excel workbook
+        :param northstar_filepath: path to Northstar Excel workbook
+        :param result_filepath: path to result Excel workbook
+        :param threshold: account name match ratio threshold; by default, the service default
+        :param name_scorer: account name scorer; by default, the service default
+        :param contact_threshold: contact name match ratio threshold; by default, the service default
+        :return: metrics spans of the request
+        """
+        threshold = self.defaults['threshold'] if threshold is None else threshold
+        name_scorer = name_scorer or self.defaults['name_scorer']
+        contact_threshold = self.defaults['contact_threshold'] if contact_threshold is None else contact_threshold
+        if name_scorer not in SCORERS:
+            raise ValueError(f'Unknown account name scorer {name_scorer}')
+        with self._lock:
+            metrics.pop_spans()
+            salesforce = self.get_salesforce()
+            anchor_ns = AnchorNorthstarDataframe(anchor_filepath, northstar_filepath, self.snapshot_dir)
+            score_cache = ScoreCache(self.score_cache_filepath, self.score_cache_max_entries, name_scorer) \
+                if self.score_cache_filepath else None
+            try:
+                accounts = AnchorSalesforceAccountsDataframe(anchor_ns, salesforce, threshold, self.workers,
+                                                             score_cache, name_scorer=name_scorer)
+            finally:
+                if score_cache is not None:
+                    score_cache.close()
+            contacts = AnchorSalesforceContactsDataframe(anchor_ns, salesforce, accounts, contact_threshold)
+            with metrics.span('export') as span:
+                span.rows_in = len(accounts.df) + len(contacts.df)
+                save_dataframes_to_excel(result_filepath, {'Accounts': accounts.df, 'Contacts': contacts.df},
+                                         wrap_text=False, column_separator=COLUMN_LEVEL_SEPARATOR)
+            return metrics.pop_spans()
+
+
+class ReconciliationRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP interface of `ReconciliationService` (`server.service`):
+
+    * `POST /reconcile` with JSON object of `anchor_file` and `northstar_file` paths (and optionally `threshold`,
+      `name_scorer`, `contact_threshold`) responds with result Excel workbook;
+    * `GET /status` responds with JSON object describing loaded Salesforce data.
+    """
+
+    def do_GET(self):
+        if self.path != '/status':
+            return self._send_error(HTTPStatus.NOT_FOUND, f'Unknown path {self.path}')
+        self._send_json(HTTPStatus.OK, self.server.service.get_status())
+
+    def do_POST(self):
+        if self.path != '/reconcile':
+            return self._send_error(HTTPStatus.NOT_FOUND, f'Unknown path {self.path}')
+        try:
+            params = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        except ValueError as e:
+            return self._send_error(HTTPStatus.BAD_REQUEST, f'Expected JSON object of anchor_file and northstar_file '
+                                                            f'paths: {e!r}')
+        try:
+            params = get_reconcile_params(params)
+        except ValueError as e:
+            return self._send_error(HTTPStatus.BAD_REQUEST, str(e))
+
+        anchor_filepath = params['anchor_filepath']
+        fd, result_filepath = mkstemp(prefix='reconciliation-', suffix='.xlsx')
+        close(fd)
+        try:
+            started = perf_counter()
+            spans = self.server.service.reconcile(result_filepath=result_filepath, **params)
+            with open(result_filepath, 'rb') as f:
+                content = f.read()
+        except Exception as e:
+            BaseDataframe.log(f'Reconciliation of {anchor_filepath} failed: {e!r}')
+            return self._send_error(HTTPStatus.INTERNAL_SERVER_ERROR, repr(e))
+        finally:
+            remove(result_filepath)
+        duration = perf_counter() - started
+        BaseDataframe.log(f'Reconciled {anchor_filepath} in {duration:.3f}s')
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', EXCEL_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('X-Reconciliation-Seconds', f'{duration:.3f}')
+        self.send_header('X-Reconciliation-Stages',
+                         json.dumps({s.name: s.duration for s in sorted(spans, key=lambda s: s.started)}))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _send_json(self, status: HTTPStatus, data):
+        content = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _send_error(self, status: HTTPStatus, message: str):
+        self._send_json(status, {'error': message})
+
+    def log_message(self, format, *args):
+        BaseDataframe.log(f'{self.address_string()} {format % args}')
+
+
+def serve(service: ReconciliationService, host: str = '127.0.0.1', port: int = 8765):
+    """
+    Load Salesforce data and serve reconciliation requests until interrupted
+
+    :param service: reconciliation service
+    :param host: host name or address to listen on; by default, local connections only
+    :param port: port to listen on
+    :return: None
+    """
+    service.get_salesforce()
+    server = HTTPServer((host, port), ReconciliationRequestHandler)
+    server.service = service
+    BaseDataframe.log(f'Serving reconciliation requests on http://{host}:{server.server_port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,429 @@
+import sqlite3
+from os import close, path, remove
+from tempfile import mkstemp
+from typing import Dict, List
+
+from pandas import read_excel, read_sql_query
+
+from libs.data_model import BaseDataframe, AnchorDataframe, NorthStarDataframe, SalesForceDataframe, \
+    AnchorNorthstarDataframe, AnchorSalesforceAccountsDataframe, AnchorSalesforceContactsDataframe, DataframeColumn
+from libs.metrics import metrics
+from libs.name_matching import extract_many, get_name_scorer, normalize_name, MatchSet, SCORERS
+from libs.score_cache import ScoreCache
+from libs.utils import filter_dataframe_rows, read_excel_column_chunks
+
+
+def _get_row_key(columns: List[str]) -> str:
+    """
+    Get SQL expression identifying row by its values; unlike unique constraints, nulls are equal to each other
+
+    :param columns: column names
+    :return: SQL expression
+    """
+    return " || ',' || ".join(f'quote({c})' for c in columns)
+
+
+def _normalize_email(email):
+    # the same normalization as `SalesForceDataframe.normalize_email`
+    return email.strip().lower() if isinstance(email, str) else email
+
+
+class SqliteReconciler:
+    """
+    Out-of-core reconciliation engine backed by SQLite working database.
+
+    Workbooks are streamed into indexed tables of the working database in chunks, skipping rows filtered out by
+    dataframe classes; Anchor/Northstar, Salesforce ID, license key, normalized name and e-mail joins run as SQL, and
+    the result is read back in chunks, so memory usage does not depend on the size of the data. Only Salesforce
+    account names and fuzzy matches of distinct unmatched Anchor company names are kept in memory for name fuzzy
+    matching.
+
+    The result is the same as the one of `AnchorSalesforceAccountsDataframe` and `AnchorSalesforceContactsDataframe`,
+    except that column types of workbooks are inferred per chunk rather than per whole column. Contacts are not
+    matched by name.
+
+    Tables and columns of the working database are named after dataframe classes attributes, e.g. table `anchor` has
+    columns `salesforce_id`, `company_name` etc.
+    """
+    CHUNK_SIZE = 100000
+    CACHE_SIZE_MB = 256
+
+    def __init__(self, work_db_filepath: str = None, chunk_size: int = CHUNK_SIZE):
+        """
+        Open working database
+
+        :param work_db_filepath: path to working database; tables of the previous run are replaced. By default,
+            temporary database is created and removed on `close`.
+        :param chunk_size: number of rows read from workbooks and returned as result at once
+        """
+        self.is_temporary = work_db_filepath is None
+        if self.is_temporary:
+            fd, work_db_filepath = mkstemp(suffix='.db', prefix='reconciliation-')
+            close(fd)
+        self.work_db_filepath = work_db_filepath
+        self.chunk_size = chunk_size
+        self.fuzzy_matches = None
+        self._connection = sqlite3.connect(work_db_filepath)
+        # the database is rebuilt from workbooks in case of failure, so it does not need to survive one
+        self._connection.execute('PRAGMA journal_mode = OFF')
+        self._connection.execute('PRAGMA synchronous = OFF')
+        self._connection.execute(f'PRAGMA cache_size = {-self.CACHE_SIZE_MB * 1024}')
+        self._connection.create_function('normalize_email', 1, _normalize_email)
+        self._connection.create_function('normalize_name', 1, normalize_name)
+
+    @staticmethod
+    def stage(name, msg, rows_in=None):
+        """
+        Log stage start and measure the stage, see `BaseDataframe.stage`
+        """
+        BaseDataframe.log(msg)
+        return metrics.span(name, rows_in=rows_in)
+
+    def _execute(self, sql: str, parameters=()):
+        return self._connection.execute(sql, parameters)
+
+    def _count(self, table: str, where: str = '1') -> int:
+        return self._execute(f'SELECT COUNT(*) FROM {table} WHERE {where}').fetchone()[0]
+
+    def _create_table(self, table: str, columns: List[str], distinct: bool = False):
+        """
+        Create table replacing existing one. Values are stored as read, columns have no type affinity.
+
+        :param table: table name
+        :param columns: column names
+        :param distinct: ignore duplicate rows inserted with `INSERT OR IGNORE`; the first one is kept
+        :return: None
+        """
+        self._execute(f'DROP TABLE IF EXISTS {table}')
+        self._execute(f'CREATE TABLE {table} ({", ".join(columns)})')
+        if distinct:
+            self._execute(f'CREATE UNIQUE INDEX {table}_rows ON {table} ({_get_row_key(columns)})')
+
+    def _load_workbook(self, table: str, dataframe_class, filepath: str) -> int:
+        """
+        Stream workbook into table in chunks of rows; duplicate rows and rows filtered out by dataframe class are
+        skipped
+
+        :param table: table name
+        :param dataframe_class: dataframe class defining source columns
+        :param filepath: path to Excel workbook
+        :return: number of distinct rows
+        """
+        columns = {attr: col for attr, col in dataframe_class._get_columns().items() if col.src_name is not None}
+        self._create_table(table, list(columns), distinct=True)
+        src_cols = [col.src_name for col in columns.values()]
+        row_filters = dataframe_class.get_row_filters()
+        # legacy .xls workbooks cannot be streamed by openpyxl
+        chunks = [filter_dataframe_rows(read_excel(filepath, usecols=src_cols), row_filters)] \
+            if path.splitext(filepath)[1].lower() == '.xls' else \
+            read_excel_column_chunks(filepath, src_cols, self.chunk_size, row_filters)
+        sql = f'INSERT OR IGNORE INTO {table} VALUES ({", ".join("?" * len(columns))})'
+        for chunk in chunks:
+            chunk = chunk[src_cols].astype(object)
+            self._connection.executemany(sql, chunk.where(chunk.notnull(), None).itertuples(index=False, name=None))
+        self._connection.commit()
+        return self._count(table)
+
+    def load(self, anchor_filepath: str, northstar_filepath: str, salesforce_filepath: str):
+        """
+        Load workbooks, join Anchor and Northstar data by license key and build Salesforce account and contact tables
+
+        :param anchor_filepath: path to Anchor Excel workbook
+        :param northstar_filepath: path to Northstar Excel workbook
+        :param salesforce_filepath: path to Salesforce Excel workbook
+        :return: None
+        """
+        with self.stage('load_anchor', 'Reading Anchor data...') as span:
+            span.rows_out = self._load_workbook('anchor', AnchorDataframe, anchor_filepath)
+
+        with self.stage('load_northstar', 'Reading Northstar data...') as span:
+            span.rows_out = self._load_workbook('northstar', NorthStarDataframe, northstar_filepath)
+            self._execute('CREATE INDEX northstar_license_key ON northstar (license_key)')
+            self._connection.commit()
+
+        with self.stage('anchor_northstar_join', 'Joining Anchor/Northstar data by license key...',
+                        rows_in=self._count('anchor')) as span:
+            columns = list(AnchorNorthstarDataframe._get_columns())
+            self._create_table('anchor_ns', columns, distinct=True)
+            self._execute('CREATE INDEX anchor_license_key ON anchor (license_key)')
+            # rows are ordered the same way as by inner `DataFrame.merge`: by key in order of its first appearance in
+            # Anchor data, then by Anchor row, then by Northstar row
+            self._execute(f'''
+                INSERT OR IGNORE INTO anchor_ns
+                SELECT {", ".join(f"n.{c}" if c == "user_role" else f"a.{c}" for c in columns)}
+                FROM anchor a
+                JOIN (SELECT license_key, MIN(rowid) AS first_row FROM anchor GROUP BY license_key) k
+                    ON k.license_key IS a.license_key
+                JOIN northstar n ON n.license_key IS a.license_key
+                ORDER BY k.first_row, a.rowid, n.rowid''')
+            self._connection.commit()
+            span.rows_out = self._count('anchor_ns')
+
+        with self.stage('load_salesforce', 'Reading Salesforce data...') as span:
+            span.rows_out = self._load_workbook('salesforce', SalesForceDataframe, salesforce_filepath)
+
+        with self.stage('salesforce_tables', 'Building Salesforce account and contact tables...',
+                        rows_in=span.rows_out) as span:
+            account_columns = self._get_attr_names(SalesForceDataframe, SalesForceDataframe.account_columns)
+            self._create_table('sf_accounts', account_columns + ['name_key'])
+            self._execute(f'CREATE UNIQUE INDEX sf_accounts_rows ON sf_accounts ({_get_row_key(account_columns)})')
+            self._execute(f'INSERT OR IGNORE INTO sf_accounts SELECT {", ".join(account_columns)}, '
+                          f'normalize_name(company_name) FROM salesforce ORDER BY rowid')
+            for column in ('salesforce_id', 'license_key', 'company_name', 'name_key'):
+                self._execute(f'CREATE INDEX sf_accounts_{column} ON sf_accounts ({column})')
+            contact_columns = self._get_attr_names(SalesForceDataframe, SalesForceDataframe.contact_columns)
+            self._create_table('sf_contacts', contact_columns + ['email_key'])
+            self._execute(f'CREATE UNIQUE INDEX sf_contacts_rows ON sf_contacts ({_get_row_key(contact_columns)})')
+            self._execute(f'INSERT OR IGNORE INTO sf_contacts SELECT {", ".join(contact_columns)}, '
+                          f'normalize_email(contact_email) FROM salesforce ORDER BY rowid')
+            self._execute('CREATE INDEX sf_contacts_email_key ON sf_contacts (email_key)')
+            self._connection.commit()
+            span.rows_out = self._count('sf_accounts') + self._count('sf_contacts')
+
+    @staticmethod
+    def _get_attr_names(dataframe_class, dataframe_columns) -> List[str]:
+        """
+        Get attribute names of dataframe columns, which name table columns
+
+        :param dataframe_class: dataframe class
+        :param dataframe_columns: list of `DataframeColumn` of the class
+        :return: list of attribute names
+        """
+        attrs = {id(col): attr for attr, col in dataframe_class._get_columns().items()}
+        return [attrs[id(col)] for col in dataframe_columns]
+
+    @staticmethod
+    def _get_result_columns(dataframe_class, prefix: str) -> Dict[str, str]:
+        """
+        Get result columns of reconciler class having prefix
+
+        :param dataframe_class: reconciler dataframe class
+        :param prefix: attribute name prefix, e.g. anchor_
+        :return: dictionary of attribute names and names of source table columns
+        """
+        return {attr: attr[len(prefix):] for attr in dataframe_class._get_columns() if attr.startswith(prefix)}
+
+    def _insert_joined(self, table: str, left: str, right: str, left_columns: Dict[str, str],
+                       right_columns: Dict[str, str], on: str, where: str = '1', extra_columns: Dict[str, str] = None,
+                       extra_join: str = '', order: str = 'l.rowid, r.rowid'):
+        """
+        Left join rows of right table to rows of left table and insert them into result table. Rows are ordered the
+        same way as by left `DataFrame.merge`: by left row, then by right row.
+
+        :param table: result table
+        :param left: left table, aliased as `l`
+        :param right: right table, aliased as `r`
+        :param left_columns: result columns and left table columns
+        :param right_columns: result columns and right table columns
+        :param on: join condition
+        :param where: condition of inserted rows
+        :param extra_columns: result columns and SQL expressions of their values
+        :param extra_join: join clause of tables joined before the right table
+        :param order: order of inserted rows
+        :return: None
+        """
+        extra_columns = extra_columns or {}
+        columns = list(left_columns) + list(right_columns) + list(extra_columns)
+        values = [f'l.{c}' for c in left_columns.values()] + [f'r.{c}' for c in right_columns.values()] + \
+            list(extra_columns.values())
+        self._execute(f'INSERT INTO {table} ({", ".join(columns)}) SELECT {", ".join(values)} '
+                      f'FROM {left} l {extra_join} LEFT JOIN {right} r ON {on} WHERE {where} ORDER BY {order}')
+
+    def _insert_unmatched(self, table: str, left: str, right: str, columns: List[str], on: str, right_key: str):
+        """
+        Insert left table rows which stay unmatched after left join with right table. Left row is repeated for every
+        joined right row having empty key, the same way as for `DataFrame.merge`.
+
+        :param table: target table
+        :param left: left table, aliased as `l`
+        :param right: right table, aliased as `r`
+        :param columns: columns of left and target table
+        :param on: join condition
+        :param right_key: key column of right table
+        :return: None
+        """
+        self._create_table(table, columns)
+        self._execute(f'INSERT INTO {table} SELECT {", ".join(f"l.{c}" for c in columns)} FROM {left} l '
+                      f'LEFT JOIN {right} r ON {on} WHERE r.{right_key} IS NULL ORDER BY l.rowid, r.rowid')
+
+    def reconcile_accounts(self, name_fuzzy_match_ratio_threshold: int = 75, workers: int = 1,
+                           score_cache: ScoreCache = None, previous_fuzzy_matches: MatchSet = None,
+                           name_scorer: str = 'ratio'):
+        """
+        Join accounts in Anchor and Salesforce by salesforce id, license key, normalized name and name fuzzy matching
+        into `accounts` table, see `AnchorSalesforceAccountsDataframe` for parameters
+        """
+        cls = AnchorSalesforceAccountsDataframe
+        anchor_columns = self._get_result_columns(cls, 'anchor_')
+        sf_columns = self._get_result_columns(cls, 'sf_')
+        scorer = SCORERS[name_scorer] if score_cache is None else score_cache.scorer
+        self._create_table('accounts', list(cls._get_columns()))
+        self._create_table('accounts_anchor', list(anchor_columns.values()), distinct=True)
+        self._execute(f'INSERT OR IGNORE INTO accounts_anchor SELECT {", ".join(anchor_columns.values())} '
+                      f'FROM anchor_ns ORDER BY rowid')
+
+        with self.stage('salesforce_id_join', 'Joining Anchor/Salesforce accounts by Salesforce ID...',
+                        rows_in=self._count('accounts_anchor')) as span:
+            # null IDs match null IDs the same way they do for `DataFrame.merge`; such rows stay unmatched
+            on = 'r.salesforce_id IS l.salesforce_id'
+            self._insert_joined('accounts', 'accounts_anchor', 'sf_accounts', anchor_columns, sf_columns, on,
+                                'r.salesforce_id IS NOT NULL',
+                                extra_columns={'match_stage': repr(cls.MATCH_STAGE_SALESFORCE_ID)})
+            self._insert_unmatched('accounts_unmatched_id', 'accounts_anchor', 'sf_accounts',
+                                   list(anchor_columns.values()), on, 'salesforce_id')
+            span.rows_out = span.matches = self._count('accounts')
+
+        with self.stage('license_key_join', 'Joining Anchor/Salesforce accounts by license key...',
+                        rows_in=self._count('accounts_unmatched_id')) as span:
+            rows_before = self._count('accounts')
+            on = 'r.license_key IS l.license_key'
+            self._insert_joined('accounts', 'accounts_unmatched_id', 'sf_accounts', anchor_columns, sf_columns, on,
+                                'r.license_key IS NOT NULL',
+                                extra_columns={'match_stage': repr(cls.MATCH_STAGE_LICENSE_KEY)})
+            self._insert_unmatched('accounts_unmatched_key', 'accounts_unmatched_id', 'sf_accounts',
+                                   list(anchor_columns.values()), on, 'license_key')
+            span.rows_out = span.matches = self._count('accounts') - rows_before
+
+        with self.stage('normalized_name_join', 'Joining Anchor/Salesforce accounts by normalized name...',
+                        rows_in=self._count('accounts_unmatched_key')) as span:
+            rows_before = self._count('accounts')
+            # empty names have no key, so they are never matched
+            on = 'r.name_key = normalize_name(l.company_name)'
+            self._insert_joined('accounts', 'accounts_unmatched_key', 'sf_accounts', anchor_columns, sf_columns, on,
+                                'r.name_key IS NOT NULL',
+                                extra_columns={'match_stage': repr(cls.MATCH_STAGE_NORMALIZED_NAME)})
+            self._insert_unmatched('accounts_unmatched', 'accounts_unmatched_key', 'sf_accounts',
+                                   list(anchor_columns.values()), on, 'name_key')
+            span.rows_out = span.matches = self._count('accounts') - rows_before
+
+        with self.stage('fuzzy_join', 'Joining Anchor/Salesforce accounts by name fuzzy match...',
+                        rows_in=self._count('accounts_unmatched')) as span:
+            rows_before = self._count('accounts')
+            self._match_names(name_fuzzy_match_ratio_threshold, workers, scorer, score_cache, previous_fuzzy_matches)
+            self._insert_joined('accounts', 'accounts_unmatched', 'sf_accounts', anchor_columns, sf_columns,
+                                'r.company_name = f.name', '1',
+                                extra_columns={'match_fuzzy_ratio': 'f.ratio',
+                                               'match_stage': f'CASE WHEN r.company_name IS NOT NULL '
+                                                              f'THEN {cls.MATCH_STAGE_FUZZY_NAME!r} END'},
+                                extra_join='LEFT JOIN fuzzy_matches f ON f.company_name IS l.company_name',
+                                order='l.rowid, f.rank, r.rowid')
+            span.rows_out = self._count('accounts') - rows_before
+            span.matches = self._count('accounts', f'rowid > {rows_before} AND sf_company_name IS NOT NULL')
+
+        with self.stage('accounts_finalize', 'Finalizing result Anchor/Salesforce accounts...',
+                        rows_in=self._count('accounts')) as span:
+            if score_cache is not None:
+                score_cache.load(str(name) for name, in self._execute(
+                    'SELECT DISTINCT anchor_company_name FROM accounts WHERE anchor_company_name IS NOT NULL'))
+            preprocess = get_name_scorer(scorer).preprocess
+            self._connection.create_function('name_ratio', 2,
+                                             lambda n1, n2: scorer(preprocess(str(n1)), preprocess(str(n2))))
+            # comparison with null is null, which is not a match
+            self._execute('''
+                UPDATE accounts SET
+                    match_sf_id = COALESCE(anchor_salesforce_id = sf_salesforce_id, 0),
+                    match_license_key = COALESCE(anchor_license_key = sf_license_key, 0),
+                    match_fuzzy_ratio = CASE
+                        WHEN match_fuzzy_ratio IS NULL AND anchor_company_name IS NOT NULL AND
+                            sf_company_name IS NOT NULL THEN name_ratio(anchor_company_name, sf_company_name)
+                        ELSE match_fuzzy_ratio END''')
+            for table in ('accounts_anchor', 'accounts_unmatched_id', 'accounts_unmatched_key', 'accounts_unmatched'):
+                self._execute(f'DROP TABLE {table}')
+            self._connection.commit()
+            span.rows_out = self._count('accounts')
+
+    def _match_names(self, threshold: int, workers: int, scorer, score_cache: ScoreCache,
+                     previous_matches: MatchSet):
+        """
+        Fuzzy match distinct company names of unmatched accounts with Salesforce account names into `fuzzy_matches`
+        table, see `AnchorSalesforceAccountsDataframe._merge_by_fuzzy_match`
+
+        :return: None
+        """
+        names = [name for name, in self._execute('SELECT company_name FROM sf_accounts ORDER BY rowid')]
+        company_names = [name for name, in self._execute('SELECT DISTINCT company_name FROM accounts_unmatched')]
+        # empty names are matched as 'nan', the same way they are matched in dataframe
+        queries = ['nan' if name is None else str(name) for name in company_names]
+        if score_cache is not None:
+            # names are processed before matching, so processed names are the first names of scored pairs
+            score_cache.load(get_name_scorer(scorer).process(q) for q in queries)
+        matches, self.fuzzy_matches = extract_many(names, queries, threshold, limit=10, workers=workers,
+                                                   scorer=scorer, previous_matches=previous_matches)
+        self._create_table('fuzzy_matches', ['company_name', 'rank', 'name', 'ratio'])
+        self._connection.executemany('INSERT INTO fuzzy_matches VALUES (?, ?, ?, ?)',
+                                     ((company_name, rank, name, ratio)
+                                      for company_name, query_matches in zip(company_names, matches)
+                                      for rank, (name, ratio) in enumerate(query_matches)))
+        self._execute('CREATE INDEX fuzzy_matches_company_name ON fuzzy_matches (company_name)')
+
+    def reconcile_contacts(self):
+        """
+        Join contacts in Anchor and Salesforce by e-mail (case-insensitively) into `contacts` table, see
+        `AnchorSalesforceContactsDataframe`
+
+        :return: None
+        """
+        cls = AnchorSalesforceContactsDataframe
+        anchor_columns = self._get_result_columns(cls, 'anchor_')
+        sf_columns = self._get_result_columns(cls, 'sf_')
+        # contacts are not matched by name, so the result has no name similarity ratios
+        self._create_table('contacts', list(cls.get_result_columns()))
+        self._create_table('contacts_anchor', list(anchor_columns.values()) + ['email_key'])
+        self._execute(f'CREATE UNIQUE INDEX contacts_anchor_rows ON contacts_anchor '
+                      f'({_get_row_key(list(anchor_columns.values()))})')
+        self._execute(f'INSERT OR IGNORE INTO contacts_anchor SELECT {", ".join(anchor_columns.values())}, '
+                      f'normalize_email(contact_email) FROM anchor_ns ORDER BY rowid')
+
+        with self.stage('contacts_join', 'Joining Anchor/Salesforce contacts by e-mail...',
+                        rows_in=self._count('contacts_anchor')) as span:
+            # null e-mails match null e-mails the same way they do for `JoinIndex`
+            self._insert_joined('contacts', 'contacts_anchor', 'sf_contacts', anchor_columns, sf_columns,
+                                'r.email_key IS l.email_key', '1')
+            self._execute('DROP TABLE contacts_anchor')
+            self._connection.commit()
+            span.rows_out = self._count('contacts')
+            span.matches = self._count('contacts', 'sf_contact_email IS NOT NULL')
+
+    def get_row_count(self) -> int:
+        """
+        :return: number of result rows
+        """
+        return self._count('accounts') + self._count('contacts')
+
+    def _read_result(self, table: str, columns: Dict[str, DataframeColumn]):
+        """
+        Read result table in chunks
+
+        :param table: table name
+        :param columns: result columns of reconciler dataframe class by attribute names
+        :return: generator yielding dataframes with the same columns as reconciler dataframe
+        """
+        columns = sorted(columns.items(), key=lambda c: c[1].order)
+        for chunk in read_sql_query(f'SELECT {", ".join(attr for attr, _ in columns)} FROM {table} ORDER BY rowid',
+                                    self._connection, chunksize=self.chunk_size):
+            for attr, _ in columns:
+                if attr in ('match_sf_id', 'match_license_key'):
+                    chunk[attr] = chunk[attr].astype(bool)
+                elif attr.endswith('_ratio'):
+                    chunk[attr] = chunk[attr].astype(float)
+            chunk.columns = [col.name for _, col in columns]
+            yield chunk
+
+    def get_results(self) -> Dict:
+        """
+        Get result sheets; rows are read from the working database while sheets are being written
+
+        :return: dictionary of sheet names and generators of dataframe chunks
+        """
+        return {'Accounts': self._read_result('accounts', AnchorSalesforceAccountsDataframe._get_columns()),
+                'Contacts': self._read_result('contacts', AnchorSalesforceContactsDataframe.get_result_columns())}
+
+    def close(self):
+        """
+        Close working database; temporary database is removed
+
+        :return: None
+        """
+        self._connection.close()
+        if self.is_temporary:
+            remove(self.work_db_filepath)
@@ -1,11 +1,17 @@
+import sqlite3
 from collections.abc import Iterable
-from itertools import groupby
-from numpy import ndarray, nan
-from pandas import isnull
+from hashlib import blake2b
+from itertools import groupby, islice
+from numpy import array, dtype as numpy_dtype, float64, ndarray, nan, ones
+from pandas import concat, isnull, DataFrame, MultiIndex, Series
+from pandas._libs.parsers import STR_NA_VALUES
+from pandas.io.parsers import TextParser
 from openpyxl import Workbook, load_workbook
 from openpyxl.cell import WriteOnlyCell
-from openpyxl.styles import Border, Side, Font, Alignment
+from openpyxl.cell.cell import ERROR_CODES
+from openpyxl.styles import Border, Side, Font, Alignment, NamedStyle
 from openpyxl.utils.cell import get_column_letter, range_boundaries
+from openpyxl.worksheet.cell_range import CellRange
 from os import path, makedirs
 from six import string_types
 
@@ -59,6 +65,21 @@ def capitalize_string_words(src_string):
     return ' '.join([s.capitalize() for s in src_string.split(' ')])
 
 
+def get_file_hash(filepath, chunk_size=1024 * 1024):
+    """Get hash of file content
+
+    :param filepath: path to file
+    :param chunk_size: size of chunks the file is read by
+    :return: hex digest of file content
+    :rtype: str
+    """
+    file_hash = blake2b(digest_size=16)
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
 def get_dataframe_column_index(dataframe, column_name):
     """Get the list of column indexes matching specified column name.
 
@@ -87,31 +108,286 @@ def get_dataframe_column_index(dataframe, column_name):
         return []
 
 
-def _merge_cells_auto(worksheet, min_row=1, min_col=1, max_row=None, max_col=None):
-    """Merge worksheet cells automatically.
+def _convert_excel_value(value):
+    """Convert Excel cell value the same way `pandas.read_excel` does before parsing it.
+
+    :param value: cell value read by openpyxl
+    :return: converted value
+    """
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value in ERROR_CODES:
+        return nan
+    return value
+
+
+def _is_excel_null(value):
+    """Check whether converted Excel cell value is parsed as null by `pandas.read_excel`.
+
+    :param value: value converted with `_convert_excel_value`
+    :return: True if the value is empty, NA string (e.g. NA, null, #N/A) or error code
+    """
+    if isinstance(value, str):
+        return value in STR_NA_VALUES
+    return isinstance(value, float) and value != value
+
+
+def _iter_excel_column_rows(filepath, columns, row_filters=None, with_skipped=False):
+    """Stream values of specified columns of the first worksheet in Excel workbook row by row.
+
+    Values are converted the same way `pandas.read_excel` converts them; blank rows between data rows are yielded as
+    rows of empty strings, trailing blank rows are skipped. Rows not meeting row filters are skipped.
+
+    :param filepath: path to Excel workbook
+    :param columns: names of columns to read; the first worksheet row contains column names
+    :type columns: list of str
+    :param row_filters: functions of column values deciding whether rows are kept, by column names; a function gets
+        None for empty (null) value. Filtered columns need not be among the read ones.
+    :type row_filters: dict
+    :param with_skipped: yield skipped rows as well, every row as a pair of flag whether the row is kept and the row
+    :type with_skipped: boolean
+    :return: generator yielding tuple of column names first, then tuples of row values
+    """
+    wb = load_workbook(filepath, read_only=True, data_only=True, keep_links=False)
+    try:
+        ws = wb.worksheets[0]
+        ws.reset_dimensions()
+        rows = ws.iter_rows(values_only=True)
+        header = next(rows, ())
+        col_indexes = {}
+        row_filters = row_filters or {}
+        for idx, name in enumerate(header):
+            if name in columns or name in row_filters:
+                col_indexes.setdefault(name, idx)
+        missing_columns = [c for c in list(columns) + list(row_filters) if c not in col_indexes]
+        if missing_columns:
+            raise ValueError(f'Columns expected but not found in {filepath}: {missing_columns}')
+        filters = [(col_indexes[name], row_filter) for name, row_filter in row_filters.items()]
+        col_indexes = sorted(col_indexes[name] for name in set(columns))
+        yield tuple(header[i] for i in col_indexes)
+
+        # blank rows are either all kept or all skipped
+        keep_blank_rows = all(row_filter(None) for _, row_filter in filters)
+        blank_rows = 0
+        for row in rows:
+            if all(v is None for v in row):
+                # blank rows are kept only if they are followed by a non-blank row
+                blank_rows += 1
+                continue
+            if keep_blank_rows or with_skipped:
+                for _ in range(blank_rows):
+                    yield (keep_blank_rows, ('',) * len(col_indexes)) if with_skipped else ('',) * len(col_indexes)
+            blank_rows = 0
+            keep = True
+            if filters:
+                filter_values = (_convert_excel_value(row[i] if i < len(row) else None) for i, _ in filters)
+                keep = all(row_filter(None if _is_excel_null(v) else v)
+                           for (_, row_filter), v in zip(filters, filter_values))
+                if not keep and not with_skipped:
+                    continue
+            values = tuple(_convert_excel_value(row[i] if i < len(row) else None) for i in col_indexes)
+            yield (keep, values) if with_skipped else values
+    finally:
+        wb.close()
+
+
+def filter_dataframe_rows(dataframe, row_filters):
+    """Keep rows of already read dataframe meeting row filters, the same rows `read_excel_columns` keeps.
+
+    :param dataframe: dataframe
+    :type dataframe: pandas.DataFrame
+    :param row_filters: functions of column values deciding whether rows are kept, by column names; a function gets
+        None for empty (null) value
+    :type row_filters: dict
+    :return: dataframe of kept rows
+    :rtype: pandas.DataFrame
+    """
+    if not row_filters:
+        return dataframe
+    keep = ones(len(dataframe), dtype=bool)
+    for name, row_filter in row_filters.items():
+        keep &= array([row_filter(None if isnull(v) else v) for v in dataframe[name]], dtype=bool)
+    return dataframe[keep]
+
+
+def _parse_excel_rows(header, rows):
+    """Parse streamed rows the same way `pandas.read_excel` parses them.
+
+    :param header: column names
+    :type header: list
+    :param rows: tuples of row values, see `_iter_excel_column_rows`
+    :type rows: list of tuple
+    :return: dataframe
+    :rtype: pandas.DataFrame
+    """
+    # blank rows are handled while streaming already
+    return TextParser([list(header)] + rows, header=0, skip_blank_lines=False).read()
+
+
+def _get_chunk_types(chunk):
+    """Get types of chunk columns, which tell types of the columns parsed whole, see `_get_common_dtype`.
+
+    :param chunk: dataframe of consecutive rows parsed separately
+    :type chunk: pandas.DataFrame
+    :return: dictionary of column names and tuples of column type, type of non-null values (None if all values are
+        null) and flag whether non-null values are booleans kept as objects
+    :rtype: dict
+    """
+    types = {}
+    for column in chunk.columns:
+        values = chunk[column].dropna()
+        types[column] = (chunk[column].dtype, values.dtype if len(values) else None,
+                         len(values) > 0 and values.dtype.kind == 'O' and all(isinstance(v, bool) for v in values))
+    return types
+
+
+def _get_common_dtype(chunk_types, column):
+    """Get type of column which chunks parsed separately share with the column parsed whole.
+
+    :param chunk_types: types of chunks of consecutive rows, each parsed separately, see `_get_chunk_types`
+    :type chunk_types: list of dict
+    :param column: column name
+    :return: type of the column parsed whole or None if it cannot be told by types of chunks
+    """
+    types = [types[column] for types in chunk_types]
+    # chunks of empty values tell nothing: they are parsed as floats whatever the other values are
+    values_dtypes = [values_dtype for _, values_dtype, _ in types if values_dtype is not None]
+    if not values_dtypes:
+        return types[0][0]
+    # booleans are kept as objects along with empty values, while 'TRUE' and 'FALSE' texts are booleans only when
+    # the whole column parsed contains no other texts
+    if len(values_dtypes) < len(types) and any(dtype.kind == 'b' for dtype in values_dtypes):
+        return None
+    if any(booleans for _, _, booleans in types):
+        return None
+    dtypes = set(values_dtypes)
+    # integers along with empty values or floats of other chunks are parsed as floats when the whole column is parsed
+    if all(dtype.kind in 'iuf' for dtype in dtypes) and \
+            (len(values_dtypes) < len(types) or any(dtype.kind == 'f' for dtype in dtypes)):
+        return numpy_dtype(float64)
+    if len(dtypes) == 1:
+        return dtypes.pop()
+    return None
+
+
+def read_excel_columns(filepath, columns, drop_duplicates=True, row_filters=None, chunk_size=10000):
+    """Read specified columns of the first worksheet in Excel workbook.
+
+    Unlike `pandas.read_excel`, the worksheet is streamed row by row in openpyxl read-only mode and only values of
+    the specified columns are kept; rows not meeting row filters are dropped while reading. Rows are parsed and
+    deduplicated chunk by chunk, so memory usage is bounded by the resulting dataframe and a chunk of rows rather than
+    by the whole worksheet. Otherwise, the result is the same as the one of `pandas.read_excel(filepath,
+    usecols=columns)` followed by `filter_dataframe_rows`: values are converted and parsed the same way, blank rows
+    between data rows are read as empty rows, trailing blank rows are ignored.
+
+    Types of columns are inferred per chunk; chunks of dropped rows are parsed as well, but only their types are kept,
+    so that dropped rows affect the types the same way they do when the whole worksheet is parsed. If chunks of
+    a column get types which the whole column would not get (e.g. numbers in one chunk and text in another), the
+    worksheet is read again and parsed at once.
+
+    :param filepath: path to Excel workbook
+    :param columns: names of columns to read; the first worksheet row contains column names
+    :type columns: list of str
+    :param drop_duplicates: drop duplicate rows
+    :type drop_duplicates: boolean
+    :param row_filters: functions of column values deciding whether rows are kept, see `filter_dataframe_rows`;
+        dropped rows are not deduplicated
+    :type row_filters: dict
+    :param chunk_size: number of rows parsed at once
+    :return: dataframe containing specified columns in the order they appear in the worksheet
+    :rtype: pandas.DataFrame
+    """
+    rows = _iter_excel_column_rows(filepath, columns, row_filters, with_skipped=True)
+    header = next(rows)
+    chunks, chunk_types = [], []
+    kept_rows, skipped_rows = [], []
+    for keep, row in rows:
+        if keep:
+            kept_rows.append(row)
+            if len(kept_rows) == chunk_size:
+                chunks.append(_parse_excel_rows(header, kept_rows))
+                kept_rows = []
+        else:
+            skipped_rows.append(row)
+            if len(skipped_rows) == chunk_size:
+                chunk_types.append(_get_chunk_types(_parse_excel_rows(header, skipped_rows)))
+                skipped_rows = []
+    if kept_rows or not chunks:
+        chunks.append(_parse_excel_rows(header, kept_rows))
+    if skipped_rows:
+        chunk_types.append(_get_chunk_types(_parse_excel_rows(header, skipped_rows)))
+    kept_rows = skipped_rows = None
+    if drop_duplicates:
+        chunks = [chunk.drop_duplicates() for chunk in chunks]
+    if len(chunks) == 1 and not chunk_types:
+        return chunks[0].reset_index(drop=True)
+
+    # an empty chunk is parsed only if no row is kept, then it is the only one
+    chunk_types += [_get_chunk_types(chunk) for chunk in chunks if len(chunk)]
+    dtypes = {column: _get_common_dtype(chunk_types, column) for column in chunks[0].columns}
+    if any(dtype is None for dtype in dtypes.values()):
+        chunks = None
+        rows = _iter_excel_column_rows(filepath, columns, row_filters, with_skipped=True)
+        header = next(rows)
+        rows = list(rows)
+        df = _parse_excel_rows(header, [row for _, row in rows])
+        df = df[array([keep for keep, _ in rows], dtype=bool)].reset_index(drop=True)
+    else:
+        df = concat(chunks, ignore_index=True)
+        chunks = None
+        for column, dtype in dtypes.items():
+            # chunks of empty values turn dates into objects, chunks of integers stay integers
+            if df[column].dtype != dtype:
+                df[column] = df[column].astype(dtype)
+    return df.drop_duplicates(ignore_index=True) if drop_duplicates else df
+
+
+def read_excel_column_chunks(filepath, columns, chunk_size=100000, row_filters=None):
+    """Read specified columns of the first worksheet in Excel workbook in chunks of rows.
+
+    The worksheet is streamed the same way `read_excel_columns` streams it, but rows are parsed and returned chunk by
+    chunk, so memory usage is bounded by the chunk size. Column types are inferred per chunk; duplicate rows are kept.
+
+    :param filepath: path to Excel workbook
+    :param columns: names of columns to read; the first worksheet row contains column names
+    :type columns: list of str
+    :param chunk_size: number of rows per chunk
+    :param row_filters: functions of column values deciding whether rows are kept, see `filter_dataframe_rows`
+    :type row_filters: dict
+    :return: generator yielding dataframes containing specified columns in the order they appear in the worksheet
+    """
+    rows = _iter_excel_column_rows(filepath, columns, row_filters)
+    header = next(rows)
+    while True:
+        data = list(islice(rows, chunk_size))
+        if not data:
+            break
+        yield _parse_excel_rows(header, data)
+
+
+def _get_auto_merged_ranges(rows):
+    """Find ranges of cells to merge automatically.
 
     In case adjacent left-hand cell has the same value then current and adjacent cells get merged horizontally;
     vertically - if adjacent cell above have the same value, None or nan
 
-    :param worksheet: target worksheet
-    :type worksheet: openpyxl.worksheet.worksheet.Worksheet
-    :param min_row: min row index of cells range for merging
-    :param min_col: min column index
-    :param max_row: max row index
-    :param max_col: max column index
-    :return: None
+    :param rows: cell values by rows
+    :type rows: list of list
+    :return: ranges to merge as (min row, min column, max row, max column) tuples of 0-based indexes
+    :rtype: list of tuple
     """
     prev_hor_groups = None
     cells_to_merge = []
     # search for cells to merge horizontally
-    for row_idx, row in enumerate(worksheet.iter_rows(min_row=min_row, max_row=max_row, min_col=min_col,
-                                                      max_col=max_col)):
+    for row_idx, row in enumerate(rows):
         # group top level columns
         if prev_hor_groups is None:
-            group_func = lambda x: (None, x[1].value)
+            group_func = lambda x: (None, x[1])
         # group columns respecting parent header bounds
         else:
-            group_func = lambda x: (prev_hor_groups[x[0]], x[1].value)
+            group_func = lambda x: (prev_hor_groups[x[0]], x[1])
         # create list of dict storing column name, row index, and tuple of column indexes to merge
         group = [{'val': key[1],
                   'row': row_idx,
@@ -131,7 +407,8 @@ def _merge_cells_auto(worksheet, min_row=1, min_col=1, max_row=None, max_col=Non
         prev_hor_groups = hor_groups
         cells_to_merge.append(hor_groups)
     # search for cells to merge vertically
-    for i in range(0, max_col - min_col + 1):
+    merged_ranges = []
+    for i in range(0, len(rows[0]) if rows else 0):
         col = [row[i] for row in cells_to_merge]
         # group by column values, min and max column indexes
         ver_group = [list(group) for key, group in groupby(col, key=lambda x: (x['val'], x['cols']))]
@@ -140,15 +417,38 @@ def _merge_cells_auto(worksheet, min_row=1, min_col=1, max_row=None, max_col=Non
             cols = group[0]['cols']
             # get list of row indexes for merging
             row_idxs = [r['row'] for r in group]
-            rows = (min(row_idxs), max(row_idxs))
-            # merge cells having at least 2 rows or columns to merge
-            if rows[0] != rows[1] or cols[0] != cols[1]:
-                worksheet.merge_cells(start_row=rows[0]+1, start_column=cols[0]+1, end_row=rows[1]+1,
-                                      end_column=cols[1]+1)
-                # if cells get merged horizontally then align merged cell centrally
-                if cols[0] != cols[1]:
-                    cell = worksheet.cell(row=rows[0]+1, column=cols[0]+1)
-                    cell.alignment = Alignment(horizontal='center')
+            rows_range = (min(row_idxs), max(row_idxs))
+            # merge cells having at least 2 rows or columns to merge; horizontally merged range is found for every
+            # column it spans
+            merged_range = (rows_range[0], cols[0], rows_range[1], cols[1])
+            if (rows_range[0] != rows_range[1] or cols[0] != cols[1]) and merged_range not in merged_ranges:
+                merged_ranges.append(merged_range)
+    return merged_ranges
+
+
+def _merge_cells_auto(worksheet, min_row=1, min_col=1, max_row=None, max_col=None):
+    """Merge worksheet cells automatically.
+
+    In case adjacent left-hand cell has the same value then current and adjacent cells get merged horizontally;
+    vertically - if adjacent cell above have the same value, None or nan
+
+    :param worksheet: target worksheet
+    :type worksheet: openpyxl.worksheet.worksheet.Worksheet
+    :param min_row: min row index of cells range for merging
+    :param min_col: min column index
+    :param max_row: max row index
+    :param max_col: max column index
+    :return: None
+    """
+    rows = [[cell.value for cell in row] for row in worksheet.iter_rows(min_row=min_row, max_row=max_row,
+                                                                         min_col=min_col, max_col=max_col)]
+    for start_row, start_col, end_row, end_col in _get_auto_merged_ranges(rows):
+        worksheet.merge_cells(start_row=start_row + min_row, start_column=start_col + min_col,
+                              end_row=end_row + min_row, end_column=end_col + min_col)
+        # if cells get merged horizontally then align merged cell centrally
+        if start_col != end_col:
+            cell = worksheet.cell(row=start_row + min_row, column=start_col + min_col)
+            cell.alignment = Alignment(horizontal='center')
 
 
 def write_dataframe_headers_to_excel(worksheet, dataframe, automerge=True, wrap_text=True):
@@ -205,6 +505,68 @@ def write_dataframe_headers_to_excel(worksheet, dataframe, automerge=True, wrap_
                                 f'{get_column_letter(col_offset + col_count)}{header_levels}'
 
 
+def _get_excel_value(val):
+    """Convert DataFrame value to Excel cell value.
+
+    :param val: DataFrame value
+    :return: cell value
+    """
+    if isinstance(val, Iterable) and not isinstance(val, string_types):
+        return ', '.join([str(v) for v in val])
+    return None if isnull(val) else val
+
+
+def _get_excel_row_values(row_data):
+    """Convert DataFrame row (including index) to Excel cell values.
+
+    :param row_data: DataFrame row as returned by `pandas.DataFrame.itertuples`
+    :type row_data: tuple
+    :return: cell values
+    :rtype: list
+    """
+    values_list = []
+    for val in row_data:
+        # value in dataframe may be a tuple in case of existing multiindex and it cannot be correctly written to
+        # excel worksheet; so convert the tuple into a list and merge it with values list
+        if isinstance(val, tuple):
+            values_list += list(val)
+        else:
+            values_list.append(val)
+    return [_get_excel_value(val) for val in values_list]
+
+
+def _insert_worksheet_rows(worksheet, idx, amount):
+    """Insert empty rows into Excel worksheet.
+
+    Unlike `openpyxl.worksheet.worksheet.Worksheet.insert_rows`, merged ranges, autofilter and frozen panes below
+    the inserted rows are moved down as well; ranges spanning the insertion point are expanded.
+
+    :param worksheet: target Excel worksheet
+    :type worksheet: openpyxl.worksheet.worksheet.Worksheet
+    :param idx: index of the first inserted row
+    :param amount: number of rows to insert
+    :return: None
+    """
+    worksheet.insert_rows(idx, amount=amount)
+    for cell_range in worksheet.merged_cells.ranges:
+        if cell_range.min_row >= idx:
+            cell_range.shift(row_shift=amount)
+        elif cell_range.max_row >= idx:
+            cell_range.expand(down=amount)
+    if worksheet.auto_filter.ref:
+        cell_range = CellRange(worksheet.auto_filter.ref)
+        if cell_range.min_row >= idx:
+            cell_range.shift(row_shift=amount)
+        elif cell_range.max_row >= idx:
+            cell_range.expand(down=amount)
+        worksheet.auto_filter.ref = cell_range.coord
+    if worksheet.freeze_panes:
+        # rows above top left cell of the panes are frozen; rows inserted right below them are not
+        min_col, min_row, _, _ = range_boundaries(worksheet.freeze_panes)
+        if min_row > idx:
+            worksheet.freeze_panes = worksheet.cell(row=min_row + amount, column=min_col)
+
+
 def write_dataframe_values_to_excel(worksheet, dataframe, start_row=None, wrap_text=True):
     """Write DataFrame values to Excel worksheet
 
@@ -212,7 +574,8 @@ def write_dataframe_values_to_excel(worksheet, dataframe, start_row=None, wrap_t
     :type worksheet: openpyxl.worksheet.worksheet.Worksheet
     :param dataframe: source dataframe
     :type dataframe: pandas.DataFrame
-    :param start_row: start row index for writing data
+    :param start_row: start row index for writing data; if specified, the rows are inserted at once before this row,
+        otherwise - appended to the worksheet
     :param wrap_text: wrap text in cell
     :type wrap_text: boolean
     :return: None
@@ -221,35 +584,25 @@ def write_dataframe_values_to_excel(worksheet, dataframe, start_row=None, wrap_t
     border_side = Side(border_style='thin', color='000000')
     border_style = Border(left=border_side, right=border_side, top=border_side, bottom=border_side)
     alignment = Alignment(wrap_text=wrap_text)
+    if start_row is not None and len(dataframe):
+        _insert_worksheet_rows(worksheet, start_row, len(dataframe))
     for row_idx, row_data in enumerate(dataframe.itertuples()):
-        values_list = []
-        row_cells = []
-        for val in row_data:
-            # value in dataframe may be a tuple in case of existing multiindex and it cannot be correctly written to
-            # excel worksheet; so convert the tuple into a list and merge it with values list
-            if isinstance(val, tuple):
-                values_list += list(val)
-            else:
-                values_list.append(val)
-        for col_idx, val in enumerate(values_list):
-            cell = WriteOnlyCell(worksheet)
-            cell.border = border_style
-            if isinstance(val, Iterable) and not isinstance(val, string_types):
-                cell.value = ', '.join([str(v) for v in val])
-            else:
-                cell.value = None if isnull(val) else val
-            cell.alignment = alignment
-            row_cells.append(cell)
+        row_values = _get_excel_row_values(row_data)
         if start_row is None:
+            row_cells = []
+            for val in row_values:
+                cell = WriteOnlyCell(worksheet)
+                cell.border = border_style
+                cell.value = val
+                cell.alignment = alignment
+                row_cells.append(cell)
             worksheet.append(row_cells)
         else:
-            worksheet.insert_rows(start_row, amount=1)
-            for col_idx, cell in enumerate(row_cells):
-                new_cell = worksheet.cell(row=start_row, column=col_idx+1)
-                new_cell.value = cell.value
-                new_cell.border = border_style
-                new_cell.alignment = alignment
-            start_row += 1
+            for col_idx, val in enumerate(row_values):
+                cell = worksheet.cell(row=start_row + row_idx, column=col_idx + 1)
+                cell.value = val
+                cell.border = border_style
+                cell.alignment = alignment
 
 
 def set_excel_col_autowidth(worksheet, min_width=10, max_width=50):
@@ -283,11 +636,217 @@ def set_excel_col_autowidth(worksheet, min_width=10, max_width=50):
                 worksheet.column_dimensions[col_letter].width = current_width
 
 
-def save_dataframes_to_excel(filepath, sheets_dataframes, wb_append=False, wrap_text=True, omit_index=False):
+def _get_dataframe_header_rows(dataframe):
+    """Get DataFrame indexes names and column names laid out by rows of Excel worksheet header.
+
+    :param dataframe: source dataframe
+    :type dataframe: pandas.DataFrame
+    :return: header cell values by rows
+    :rtype: list of list
+    """
+    index_names = list(dataframe.index.names)
+    header_levels = dataframe.columns.nlevels
+    rows = []
+    for row in range(0, header_levels):
+        # index names are written to the top header row only
+        row_values = index_names if row == 0 else [None] * len(index_names)
+        rows.append(row_values + [col if header_levels == 1 else col[row] for col in dataframe.columns])
+    return rows
+
+
+def _get_excel_value_lengths(values, wrap_text):
+    """Get lengths of Excel cell values for given DataFrame values.
+
+    :param values: DataFrame column or index level values
+    :type values: pandas.Series or pandas.Index
+    :param wrap_text: text in cells is wrapped, so the length of the longest line is used
+    :type wrap_text: boolean
+    :return: lengths of values
+    :rtype: pandas.Series
+    """
+    values = Series(values)
+    if values.dtype == object:
+        values = values.map(_get_excel_value)
+    strings = values.astype(str)
+    if wrap_text:
+        lengths = strings.str.split('\n').map(lambda lines: max(len(l) for l in lines))
+    else:
+        lengths = strings.str.len()
+    return lengths.where(values.notnull(), 0)
+
+
+def _get_dataframe_col_widths(dataframe, header_rows, merged_ranges, wrap_text=True, min_width=10, max_width=50):
+    """Compute widths of Excel columns fitting DataFrame header and values.
+
+    Widths are the same as the ones set by `set_excel_col_autowidth` for the worksheet written by
+    `write_dataframe_headers_to_excel` and `write_dataframe_values_to_excel`; though they are computed from
+    the DataFrame column-wise instead of walking worksheet cells.
+
+    :param dataframe: source dataframe
+    :type dataframe: pandas.DataFrame
+    :param header_rows: header cell values by rows, see `_get_dataframe_header_rows`
+    :param merged_ranges: merged header ranges, see `_get_auto_merged_ranges`
+    :param wrap_text: wrap text in cell
+    :type wrap_text: boolean
+    :param min_width: minimum width of columns
+    :param max_width: maximum width of columns
+    :return: widths of columns
+    :rtype: list of float
+    """
+    col_chars = [0] * (len(header_rows[0]) if header_rows else 0)
+    # header cells
+    for row_idx, row in enumerate(header_rows):
+        for col_idx, val in enumerate(row):
+            cell_range = next((r for r in merged_ranges if r[0] <= row_idx <= r[2] and r[1] <= col_idx <= r[3]), None)
+            col_distr = 1
+            cell_wrap_text = wrap_text
+            if cell_range is not None:
+                # only top left cell of merged range keeps its value
+                if (row_idx, col_idx) != (cell_range[0], cell_range[1]):
+                    continue
+                # text of horizontally merged cell gets distributed among the columns and isn't wrapped
+                if cell_range[1] != cell_range[3]:
+                    col_distr = cell_range[3] - cell_range[1] + 1
+                    cell_wrap_text = False
+            if val is None:
+                continue
+            lines = str(val).split('\n') if cell_wrap_text else [str(val)]
+            col_chars[col_idx] = max(col_chars[col_idx], max(len(l) for l in lines) / col_distr)
+    # values
+    index_levels = dataframe.index.nlevels
+    for col_idx in range(0, len(col_chars)):
+        if col_idx < index_levels:
+            values = dataframe.index.get_level_values(col_idx)
+        else:
+            values = dataframe.iloc[:, col_idx - index_levels]
+        if len(values):
+            col_chars[col_idx] = max(col_chars[col_idx], _get_excel_value_lengths(values, wrap_text).max())
+    # 2.5 - approximate width of filter icon
+    return [max(min_width, min(chars * 1.1 + 2.5, max_width)) for chars in col_chars]
+
+
+def _add_named_styles(workbook, wrap_text=True):
+    """Add named styles of DataFrame header and value cells to Excel workbook (unless they already exist).
+
+    :param workbook: target workbook
+    :type workbook: openpyxl.workbook.workbook.Workbook
+    :param wrap_text: wrap text in cell
+    :type wrap_text: boolean
+    :return: names of styles for header cells, horizontally merged header cells and value cells
+    :rtype: dict
+    """
+    border_side = Side(border_style='thin', color='000000')
+    border_style = Border(left=border_side, right=border_side, top=border_side, bottom=border_side)
+    name_suffix = ' Wrapped' if wrap_text else ''
+    styles = {
+        'header': NamedStyle(name=f'DataFrame Header{name_suffix}', font=Font(bold=True), border=border_style,
+                             alignment=Alignment(wrap_text=wrap_text)),
+        'header_merged': NamedStyle(name='DataFrame Header Merged', font=Font(bold=True), border=border_style,
+                                    alignment=Alignment(horizontal='center')),
+        'value': NamedStyle(name=f'DataFrame Value{name_suffix}', border=border_style,
+                            alignment=Alignment(wrap_text=wrap_text)),
+    }
+    for style in styles.values():
+        if style.name not in workbook.named_styles:
+            workbook.add_named_style(style)
+    return {key: style.name for key, style in styles.items()}
+
+
+def write_dataframe_to_write_only_excel(worksheet, dataframe, automerge=True, wrap_text=True, min_width=10,
+                                        max_width=50):
+    """Write DataFrame to write-only Excel worksheet.
+
+    Rows are streamed to the worksheet, cells share named styles. Header, values and column widths are the same as
+    the ones written by `write_dataframe_headers_to_excel`, `write_dataframe_values_to_excel` and
+    `set_excel_col_autowidth` to an ordinary worksheet. Nothing must be written to the worksheet beforehand.
+
+    :param worksheet: target worksheet
+    :type worksheet: openpyxl.worksheet._write_only.WriteOnlyWorksheet
+    :param dataframe: source dataframe
+    :type dataframe: pandas.DataFrame
+    :param automerge: merge header cells automatically
+    :type automerge: boolean
+    :param wrap_text: wrap text in cell
+    :type wrap_text: boolean
+    :param min_width: minimum width of columns
+    :param max_width: maximum width of columns
+    :return: None
+    """
+    styles = _add_named_styles(worksheet.parent, wrap_text=wrap_text)
+    header_rows = _get_dataframe_header_rows(dataframe)
+    header_levels = len(header_rows)
+    col_count = len(header_rows[0])
+    merged_ranges = _get_auto_merged_ranges(header_rows) if automerge else []
+    # column widths and panes have to be set before any row is written
+    col_widths = _get_dataframe_col_widths(dataframe, header_rows, merged_ranges, wrap_text=wrap_text,
+                                           min_width=min_width, max_width=max_width)
+    for col_idx, width in enumerate(col_widths):
+        worksheet.column_dimensions[get_column_letter(col_idx + 1)].width = width
+    # freeze header rows
+    worksheet.freeze_panes = f'A{header_levels + 1}'
+    # set autofilter on the bottom header row
+    worksheet.auto_filter.ref = f'A{header_levels}:{get_column_letter(col_count)}{header_levels}'
+    merged_cells = set()
+    merged_top_left_cells = set()
+    for start_row, start_col, end_row, end_col in merged_ranges:
+        worksheet.merged_cells.add(CellRange(min_row=start_row + 1, min_col=start_col + 1, max_row=end_row + 1,
+                                             max_col=end_col + 1))
+        merged_cells |= {(r, c) for r in range(start_row, end_row + 1) for c in range(start_col, end_col + 1)}
+        if start_col != end_col:
+            merged_top_left_cells.add((start_row, start_col))
+    # header
+    index_levels = dataframe.index.nlevels
+    for row_idx, row in enumerate(header_rows):
+        row_cells = []
+        for col_idx, val in enumerate(row):
+            if row_idx > 0 and col_idx < index_levels and (row_idx, col_idx) not in merged_cells:
+                row_cells.append(None)
+                continue
+            cell = WriteOnlyCell(worksheet, value=val)
+            cell.style = styles['header_merged'] if (row_idx, col_idx) in merged_top_left_cells else styles['header']
+            row_cells.append(cell)
+        worksheet.append(row_cells)
+    # values; rows are written as soon as they are appended, so the same cells are reused for every row
+    row_cells = []
+    for row_data in dataframe.itertuples():
+        row_values = _get_excel_row_values(row_data)
+        while len(row_cells) < len(row_values):
+            cell = WriteOnlyCell(worksheet)
+            cell.style = styles['value']
+            row_cells.append(cell)
+        for cell, val in zip(row_cells, row_values):
+            cell.value = val
+        worksheet.append(row_cells[:len(row_values)])
+
+
+def _iter_dataframe_chunks(data):
+    """Iterate over chunks of sheet data
+
+    :param data: dataframe or iterable of dataframe chunks (e.g. `pandas.read_sql_query` result read in chunks)
+    :return: iterable of dataframes
+    """
+    return [data] if isinstance(data, DataFrame) else data
+
+
+def _collect_dataframe_chunks(data):
+    """Collect chunks of sheet data into single dataframe
+
+    :param data: dataframe or iterable of dataframe chunks
+    :return: dataframe
+    :rtype: pandas.DataFrame
+    """
+    return data if isinstance(data, DataFrame) else concat(list(data), ignore_index=True)
+
+
+def save_dataframes_to_excel(filepath, sheets_dataframes, wb_append=False, wrap_text=True, omit_index=False,
+                             column_separator=None):
     """Save dataframes to Excel workbook
 
+    New workbook is written in write-only mode, rows are streamed to the file. Column widths depend on all the values,
+    so sheets given in chunks are collected in memory first.
+
     :param filepath: target path of Excel workbook
-    :param sheets_dataframes: dataframes to save
+    :param sheets_dataframes: dataframes (or iterables of dataframe chunks) to save
     :type sheets_dataframes: dict, where key = sheet name, value = dataframe
     :param wb_append: append data to workbook if it already exists, otherwise - overwrite it
     :type wb_append: boolean
@@ -295,25 +854,19 @@ def save_dataframes_to_excel(filepath, sheets_dataframes, wb_append=False, wrap_
     :type wrap_text: boolean
     :param omit_index: do not output dataframe index
     :type omit_index: boolean
+    :param column_separator: separator of column levels in flat column names; header of dataframe whose column names
+        all contain it gets a row per level, see `unflatten_dataframe_columns`. By default, column names are kept
+    :type column_separator: str
     :return: None
     """
-    dirpath = path.dirname(filepath)
-    if not path.exists(dirpath):
-        makedirs(dirpath, exist_ok=True)
-    new_wb = True
+    _prepare_result_path(filepath)
+    sheets_dataframes = {sheet_name: _collect_dataframe_chunks(df) for sheet_name, df in sheets_dataframes.items()}
+    if column_separator is not None:
+        sheets_dataframes = {sheet_name: unflatten_dataframe_columns(df, column_separator)
+                             for sheet_name, df in sheets_dataframes.items()}
     if path.exists(filepath) and wb_append:
         wb = load_workbook(filepath)
-        new_wb = False
-    else:
-        wb = Workbook()
-    for i, v in enumerate(sheets_dataframes.items()):
-        sheet_name = v[0]
-        df = v[1]
-        # rename first worksheet if workbook should be overwritten
-        if i == 0 and new_wb:
-            ws = wb.active
-            ws.title = sheet_name
-        else:
+        for sheet_name, df in sheets_dataframes.items():
             sheet_index = None
             try:
                 # delete existing worksheet with the same name
@@ -322,7 +875,128 @@ def save_dataframes_to_excel(filepath, sheets_dataframes, wb_append=False, wrap_
             except ValueError:
                 pass
             ws = wb.create_sheet(sheet_name, sheet_index)
-        write_dataframe_headers_to_excel(worksheet=ws, dataframe=df, wrap_text=wrap_text)
-        write_dataframe_values_to_excel(worksheet=ws, dataframe=df, wrap_text=wrap_text)
-        set_excel_col_autowidth(ws)
+            write_dataframe_headers_to_excel(worksheet=ws, dataframe=df, wrap_text=wrap_text)
+            write_dataframe_values_to_excel(worksheet=ws, dataframe=df, wrap_text=wrap_text)
+            header_rows = _get_dataframe_header_rows(df)
+            col_widths = _get_dataframe_col_widths(df, header_rows, _get_auto_merged_ranges(header_rows),
+                                                   wrap_text=wrap_text)
+            for col_idx, width in enumerate(col_widths):
+                ws.column_dimensions[get_column_letter(col_idx + 1)].width = width
+    else:
+        wb = Workbook(write_only=True)
+        for sheet_name, df in sheets_dataframes.items():
+            ws = wb.create_sheet(sheet_name)
+            write_dataframe_to_write_only_excel(worksheet=ws, dataframe=df, wrap_text=wrap_text)
     wb.save(filename=filepath)
+
+
+def flatten_dataframe_columns(dataframe, separator='.'):
+    """Get DataFrame with flat column names suitable for tabular formats.
+
+    Levels of column MultiIndex are joined with separator, e.g. ('Anchor', 'Company Name') -> 'Anchor.Company Name'.
+    Index is dropped; iterable values are converted to strings the same way they are written to Excel.
+
+    :param dataframe: source dataframe
+    :type dataframe: pandas.DataFrame
+    :param separator: separator of column levels
+    :return: flat dataframe
+    :rtype: pandas.DataFrame
+    """
+    columns = {}
+    for col_idx, col in enumerate(dataframe.columns):
+        name = separator.join(str(level) for level in col) if isinstance(col, tuple) else str(col)
+        values = dataframe.iloc[:, col_idx]
+        if values.dtype == object:
+            values = values.map(_get_excel_value)
+        columns[name] = values.reset_index(drop=True)
+    return DataFrame(columns)
+
+
+def unflatten_dataframe_columns(dataframe, separator='.'):
+    """Get DataFrame with column MultiIndex built from flat column names, reverse of `flatten_dataframe_columns`.
+
+    Names are split at the first separator, e.g. 'Anchor.Company Name' -> ('Anchor', 'Company Name'). Dataframe is
+    returned as is unless all the column names contain separator. Values are not copied.
+
+    :param dataframe: source dataframe
+    :type dataframe: pandas.DataFrame
+    :param separator: separator of column levels
+    :return: dataframe with two column levels
+    :rtype: pandas.DataFrame
+    """
+    if not len(dataframe.columns) or \
+            not all(isinstance(col, str) and separator in col for col in dataframe.columns):
+        return dataframe
+    df = dataframe.copy(deep=False)
+    df.columns = MultiIndex.from_tuples([tuple(col.split(separator, 1)) for col in dataframe.columns])
+    return df
+
+
+def _prepare_result_path(filepath):
+    """Create parent directory of result file if it does not exist
+
+    :param filepath: path of result file
+    :return: None
+    """
+    dirpath = path.dirname(filepath)
+    if dirpath and not path.exists(dirpath):
+        makedirs(dirpath, exist_ok=True)
+
+
+def save_dataframes_to_csv(dirpath, sheets_dataframes, chunk_size=100000):
+    """Save dataframes to CSV files, one file per sheet named <sheet name>.csv
+
+    :param dirpath: target directory
+    :param sheets_dataframes: dataframes to save; a sheet may be given as iterable of dataframe chunks, which are
+        appended to the file one by one
+    :type sheets_dataframes: dict, where key = sheet name, value = dataframe
+    :param chunk_size: number of rows written at once
+    :return: None
+    """
+    makedirs(dirpath, exist_ok=True)
+    for sheet_name, data in sheets_dataframes.items():
+        for chunk_idx, df in enumerate(_iter_dataframe_chunks(data)):
+            flatten_dataframe_columns(df).to_csv(path.join(dirpath, f'{sheet_name}.csv'), index=False,
+                                                 chunksize=chunk_size, mode='w' if chunk_idx == 0 else 'a',
+                                                 header=chunk_idx == 0)
+
+
+def save_dataframes_to_parquet(dirpath, sheets_dataframes):
+    """Save dataframes to Parquet files, one file per sheet named <sheet name>.parquet
+
+    Requires pyarrow (or fastparquet) to be installed.
+
+    :param dirpath: target directory
+    :param sheets_dataframes: dataframes (or iterables of dataframe chunks, which are collected in memory) to save
+    :type sheets_dataframes: dict, where key = sheet name, value = dataframe
+    :return: None
+    """
+    makedirs(dirpath, exist_ok=True)
+    for sheet_name, df in sheets_dataframes.items():
+        df = flatten_dataframe_columns(_collect_dataframe_chunks(df))
+        # object columns may mix strings and numbers, which Parquet column cannot store
+        for col in df.columns[df.dtypes == object]:
+            df[col] = df[col].where(df[col].isnull(), df[col].astype(str))
+        df.to_parquet(path.join(dirpath, f'{sheet_name}.parquet'), index=False)
+
+
+def save_dataframes_to_sqlite(filepath, sheets_dataframes, chunk_size=100000):
+    """Save dataframes to SQLite database, one table per sheet. Existing tables are replaced
+
+    :param filepath: target path of SQLite database
+    :param sheets_dataframes: dataframes to save; a table may be given as iterable of dataframe chunks, which are
+        inserted one by one
+    :type sheets_dataframes: dict, where key = table name, value = dataframe
+    :param chunk_size: number of rows inserted at once
+    :return: None
+    """
+    _prepare_result_path(filepath)
+    connection = sqlite3.connect(filepath)
+    try:
+        for sheet_name, data in sheets_dataframes.items():
+            for chunk_idx, df in enumerate(_iter_dataframe_chunks(data)):
+                flatten_dataframe_columns(df).to_sql(sheet_name, connection, index=False, chunksize=chunk_size,
+                                                     if_exists='replace' if chunk_idx == 0 else 'append')
+        connection.commit()
+    finally:
+        connection.close()
@@ -1,28 +1,331 @@
 import argparse
+from functools import partial
+from importlib import import_module
+from os import cpu_count, path
+
+from libs.metrics import metrics
+from libs.pipeline import Pipeline
+from libs.schema import ANCHOR_COLUMNS, NORTHSTAR_COLUMNS, SALESFORCE_COLUMNS, get_missing_columns
+
+RESULT_FORMATS = ['excel', 'csv', 'parquet', 'sqlite']
+# spawning a worker process and importing pandas in it takes about a second, which is about as long as parsing of
+# 300 KB of workbooks takes, so smaller workbooks are parsed in the current process
+IN_PROCESS_MAX_INPUT_SIZE = 1024 ** 2
+# pandas writes Parquet files with either of them
+PARQUET_ENGINES = ['pyarrow', 'fastparquet']
+
+
+def parse_thresholds(value):
+    """
+    Parse comma separated name match ratio thresholds
+
+    :param value: command line argument, e.g. 75,90
+    :return: sorted list of unique thresholds
+    :raise argparse.ArgumentTypeError: if a threshold is not an integer between 0 and 100
+    """
+    thresholds = set()
+    for item in value.split(','):
+        try:
+            threshold = int(item)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f'{item!r} is not an integer') from None
+        if not 0 <= threshold <= 100:
+            raise argparse.ArgumentTypeError(f'{threshold} is not between 0 and 100')
+        thresholds.add(threshold)
+    return sorted(thresholds)
 
-from libs.data_model import AnchorNorthstarDataframe, SalesForceDataframe, \
-    AnchorSalesforceAccountsDataframe, AnchorSalesforceContactsDataframe
-from libs.utils import save_dataframes_to_excel
 
 parser = argparse.ArgumentParser(description='Reconcile accounts and contacts between Anchor and Salesforce')
 parser.add_argument('-a', '--anchor-file', help='Path to Anchor Excel workbook', required=True)
 parser.add_argument('-n', '--northstar-file', help='Path to Northstar Excel workbook', required=True)
 parser.add_argument('-s', '--salesforce-file', help='Path to Salesforce Excel workbook', required=True)
-parser.add_argument('-t', '--account-name-match-ratio-threshold', type=int,
+parser.add_argument('--preflight', action='store_true',
+                    help='Only check that workbooks have mandatory columns, reading just their header rows, and exit '
+                         'with code 1 if they do not')
+parser.add_argument('-t', '--account-name-match-ratio-threshold', type=parse_thresholds,
                     help='Account names with specified (or above) similarity ratio will be used for joining Anchor and '
-                         'Salesforce account data. Number between 0 and 100.', default=75)
+                         'Salesforce account data. Number between 0 and 100. Comma separated thresholds produce '
+                         'accounts result per threshold from a single name matching pass and summary of matches per '
+                         'threshold', default=[75])
+parser.add_argument('-g', '--account-name-scorer',
+                    help='Account name similarity scorer: ratio - ratio of names, token_sort - ratio of names with '
+                         'sorted tokens or token_set - ratio of common and remaining tokens', default='ratio')
+parser.add_argument('-k', '--contact-name-match-ratio-threshold', type=int,
+                    help='Contacts not matched by e-mail are joined by name with contacts of the matched Salesforce '
+                         'accounts if the names have specified (or above) similarity ratio. Number between 0 and 100. '
+                         'By default, contacts are matched by e-mail only')
+parser.add_argument('-w', '--workers', type=int,
+                    help='Number of worker processes used for account name fuzzy matching', default=1)
+parser.add_argument('-c', '--score-cache',
+                    help='Path to SQLite file caching account name similarity ratios between runs; by default, ratios '
+                         'are not cached')
+parser.add_argument('--score-cache-max-entries', type=int,
+                    help='Maximum number of cached similarity ratios; least recently used ones are evicted')
+parser.add_argument('--snapshot-dir',
+                    help='Directory keeping snapshots of read workbooks; unchanged workbooks are read from snapshots '
+                         'instead of being parsed again. By default, snapshots are not used')
+parser.add_argument('--fuzzy-match-cache',
+                    help='Directory caching account name fuzzy matches between runs; cached account names are matched '
+                         'only against Salesforce account names added since the cached run. The rest of '
+                         'reconciliation is done in full. By default, all the account names are matched from scratch')
 parser.add_argument('-r', '--result-file',
                     help='Path to result Excel workbook. The file will have 2 spreadsheets for accounts and '
-                         'contacts reconciliation', required=True)
+                         'contacts reconciliation. For csv and parquet result formats - path to result directory, '
+                         'for sqlite - path to result database. Mandatory unless --preflight is set')
+parser.add_argument('-m', '--metrics-file',
+                    help='Path to JSON file to save metrics of pipeline stages to: duration, input/output row counts, '
+                         'matched rows, memory usage at stage start and end and lifetime peak memory usage. By '
+                         'default, metrics are not saved')
+parser.add_argument('--profile-fuzzy-match',
+                    help='Path to file to save cProfile stats of account name fuzzy match stage to. By default, '
+                         'the stage is not profiled')
+parser.add_argument('-f', '--result-format', choices=RESULT_FORMATS,
+                    help='Format of result: Excel workbook; directory of CSV or Parquet files, one per spreadsheet; '
+                         'SQLite database, one table per spreadsheet. Columns of non-Excel formats are named as '
+                         '<Anchor|Salesforce|Matches>.<column name>', default='excel')
+parser.add_argument('-e', '--engine', choices=['pandas', 'sqlite'],
+                    help='Reconciliation engine: in-memory dataframes or out-of-core SQLite working database, which '
+                         'suits data larger than memory', default='pandas')
+parser.add_argument('--work-db',
+                    help='Path to SQLite working database of sqlite engine, kept after the run. By default, temporary '
+                         'database is used')
+
+
+def match_account_names(args, reconcile):
+    """
+    Run accounts reconciliation, use and update score cache and fuzzy match cache if they are set
+
+    :param args: parsed command line arguments
+    :param reconcile: function getting score cache and previous name fuzzy matches and returning reconciler, which
+        has `fuzzy_matches` of the run
+    :return: reconciler
+    """
+    from libs.name_matching import MatchSet, SCORERS
+    from libs.score_cache import ScoreCache
+
+    # SQLite connection may only be used in the thread which has opened it
+    max_entries = ScoreCache.DEFAULT_MAX_ENTRIES if args.score_cache_max_entries is None else \
+        args.score_cache_max_entries
+    score_cache = ScoreCache(args.score_cache, max_entries, args.account_name_scorer) if args.score_cache else None
+    fuzzy_matches_filepath = path.join(args.fuzzy_match_cache, 'fuzzy_matches.pkl') if args.fuzzy_match_cache else None
+    previous_fuzzy_matches = MatchSet.load(fuzzy_matches_filepath, SCORERS[args.account_name_scorer].version) \
+        if fuzzy_matches_filepath else None
+    reconciler = reconcile(score_cache, previous_fuzzy_matches)
+    if score_cache is not None:
+        score_cache.close()
+    if fuzzy_matches_filepath:
+        reconciler.fuzzy_matches.save(fuzzy_matches_filepath)
+    return reconciler
+
+
+def reconcile_accounts(args, anchor_ns, salesforce):
+    """
+    Join Anchor and Salesforce accounts
+
+    :param args: parsed command line arguments
+    :param anchor_ns: Anchor/Northstar dataframe object
+    :param salesforce: Salesforce dataframe object
+    :return: Anchor/Salesforce accounts dataframe object
+    """
+    from libs.data_model import AnchorSalesforceAccountsDataframe
+
+    return match_account_names(args, lambda score_cache, previous_fuzzy_matches: AnchorSalesforceAccountsDataframe(
+        anchor_ns, salesforce, args.account_name_match_ratio_threshold[0], args.workers, score_cache,
+        previous_fuzzy_matches, args.account_name_scorer))
+
+
+def reconcile_contacts(args, anchor_ns, salesforce, accounts):
+    """
+    Join Anchor and Salesforce contacts by e-mail, then by name within matched accounts
+
+    :param args: parsed command line arguments
+    :param anchor_ns: Anchor/Northstar dataframe object
+    :param salesforce: Salesforce dataframe object
+    :param accounts: Anchor/Salesforce accounts dataframe object
+    :return: Anchor/Salesforce contacts dataframe object
+    """
+    from libs.data_model import AnchorSalesforceContactsDataframe
+
+    return AnchorSalesforceContactsDataframe(anchor_ns, salesforce, accounts, args.contact_name_match_ratio_threshold)
+
+
+def reconcile_out_of_core(args):
+    """
+    Reconcile accounts and contacts in SQLite working database
+
+    :param args: parsed command line arguments
+    :return: SQLite reconciler holding the result; it has to be closed after the result is written
+    """
+    from libs.sqlite_engine import SqliteReconciler
+
+    reconciler = SqliteReconciler(args.work_db)
+    try:
+        reconciler.load(args.anchor_file, args.northstar_file, args.salesforce_file)
+
+        def reconcile(score_cache, previous_fuzzy_matches):
+            reconciler.reconcile_accounts(args.account_name_match_ratio_threshold[0], args.workers, score_cache,
+                                          previous_fuzzy_matches, args.account_name_scorer)
+            return reconciler
+
+        match_account_names(args, reconcile)
+        reconciler.reconcile_contacts()
+    except Exception:
+        reconciler.close()
+        raise
+    return reconciler
+
+
+def get_process_workers(args):
+    """
+    Get number of worker processes parsing workbooks: one per workbook, but no more than CPUs
+
+    :param args: parsed command line arguments
+    :return: number of worker processes; 0 if there is a single CPU or the workbooks are small, so that they are
+        parsed in the current process
+    """
+    workers = min(3, cpu_count() or 1)
+    input_size = sum(path.getsize(f) for f in (args.anchor_file, args.northstar_file, args.salesforce_file))
+    return 0 if workers == 1 or input_size < IN_PROCESS_MAX_INPUT_SIZE else workers
+
+
+def reconcile_in_memory(args):
+    """
+    Reconcile accounts and contacts in memory; workbooks are parsed in parallel worker processes (see
+    `get_process_workers`), accounts and contacts get reconciled concurrently
+
+    :param args: parsed command line arguments
+    :return: dictionary of result sheet names and dataframes
+    """
+    from pandas import DataFrame
+    from libs.data_model import AnchorDataframe, NorthStarDataframe, AnchorNorthstarDataframe, SalesForceDataframe, \
+        AnchorSalesforceContactsDataframe
+
+    pipeline = Pipeline(process_workers=get_process_workers(args))
+    pipeline.add_stage('anchor', partial(AnchorDataframe, args.anchor_file, args.snapshot_dir), in_subprocess=True)
+    pipeline.add_stage('northstar', partial(NorthStarDataframe, args.northstar_file, args.snapshot_dir),
+                       in_subprocess=True)
+    pipeline.add_stage('salesforce', partial(SalesForceDataframe, args.salesforce_file, args.snapshot_dir),
+                       in_subprocess=True)
+    pipeline.add_stage('anchor_ns', AnchorNorthstarDataframe, ['anchor', 'northstar'])
+    pipeline.add_stage('accounts', partial(reconcile_accounts, args), ['anchor_ns', 'salesforce'])
+    if args.contact_name_match_ratio_threshold is None:
+        pipeline.add_stage('contacts', AnchorSalesforceContactsDataframe, ['anchor_ns', 'salesforce'])
+    else:
+        # contacts are matched by name within matched accounts, so they wait for accounts reconciliation
+        pipeline.add_stage('contacts', partial(reconcile_contacts, args), ['anchor_ns', 'salesforce', 'accounts'])
+    results = pipeline.run()
+    if len(args.account_name_match_ratio_threshold) == 1:
+        return {'Accounts': results['accounts'].df, 'Contacts': results['contacts'].df}
+
+    # names are matched with the lowest threshold, results of higher ones are derived from its result
+    sheets_dataframes, summary = {}, []
+    for threshold in args.account_name_match_ratio_threshold:
+        sheets_dataframes[f'Accounts {threshold}'], matches = results['accounts'].get_threshold_result(threshold)
+        summary.append({'Threshold': threshold, 'Matched by Salesforce ID': matches['salesforce_id'],
+                        'Matched by license key': matches['license_key'],
+                        'Matched by normalized name': matches['normalized_name'], 'Matched by name': matches['name'],
+                        'Unmatched': matches['unmatched']})
+    sheets_dataframes['Contacts'] = results['contacts'].df
+    sheets_dataframes['Thresholds'] = DataFrame(summary)
+    return sheets_dataframes
+
+
+def save_result(args, sheets_dataframes):
+    """
+    Save result in the format set by arguments
+
+    :param args: parsed command line arguments
+    :param sheets_dataframes: dictionary of sheet names and dataframes (or iterables of dataframe chunks)
+    :return: None
+    """
+    from libs.data_model import COLUMN_LEVEL_SEPARATOR
+    from libs.utils import save_dataframes_to_excel, save_dataframes_to_csv, save_dataframes_to_parquet, \
+        save_dataframes_to_sqlite
+
+    result_writers = {
+        'excel': partial(save_dataframes_to_excel, wrap_text=False, column_separator=COLUMN_LEVEL_SEPARATOR),
+        'csv': save_dataframes_to_csv,
+        'parquet': save_dataframes_to_parquet,
+        'sqlite': save_dataframes_to_sqlite,
+    }
+    result_writers[args.result_format](args.result_file, sheets_dataframes)
+
+
+def get_parquet_engine():
+    """
+    :return: name of the first of `PARQUET_ENGINES` that imports or None if none of them is installed
+    """
+    for engine in PARQUET_ENGINES:
+        try:
+            import_module(engine)
+        except ImportError:
+            continue
+        return engine
+    return None
+
+
+def preflight(args):
+    """
+    Check headers of the workbooks against mandatory columns of the dataframes read from them
+
+    :param args: parsed command line arguments
+    :return: list of problems found
+    """
+    problems = []
+    for filepath, columns in ((args.anchor_file, ANCHOR_COLUMNS), (args.northstar_file, NORTHSTAR_COLUMNS),
+                              (args.salesforce_file, SALESFORCE_COLUMNS)):
+        try:
+            missing_columns = get_missing_columns(filepath, columns.values())
+        except Exception as e:
+            problems.append(f'{filepath} cannot be read: {e!r}')
+            continue
+        if missing_columns:
+            problems.append(f'{filepath} lacks mandatory columns: {", ".join(missing_columns)}')
+    return problems
 
-args = parser.parse_args()
 
-anchor_ns = AnchorNorthstarDataframe(args.anchor_file, args.northstar_file)
-salesforce = SalesForceDataframe(args.salesforce_file)
+if __name__ == '__main__':
+    args = parser.parse_args()
+    for filepath in (args.anchor_file, args.northstar_file, args.salesforce_file):
+        if not path.isfile(filepath):
+            parser.error(f'{filepath} does not exist')
+    if args.preflight:
+        problems = preflight(args)
+        print('\n'.join(problems) or 'Workbooks have all the mandatory columns')
+        raise SystemExit(1 if problems else 0)
+    if not args.result_file:
+        parser.error('the following arguments are required: -r/--result-file')
+    if args.engine == 'sqlite' and (args.snapshot_dir or args.contact_name_match_ratio_threshold is not None):
+        parser.error('--snapshot-dir and --contact-name-match-ratio-threshold are not supported by sqlite engine')
+    if len(args.account_name_match_ratio_threshold) > 1 and \
+            (args.engine == 'sqlite' or args.contact_name_match_ratio_threshold is not None):
+        parser.error('several account name match ratio thresholds are not supported by sqlite engine and with '
+                     '--contact-name-match-ratio-threshold')
+    if args.result_format == 'parquet' and get_parquet_engine() is None:
+        parser.error(f'parquet result format requires one of {", ".join(PARQUET_ENGINES)} to be installed')
 
-anchor_sf_accounts = AnchorSalesforceAccountsDataframe(anchor_ns, salesforce, args.account_name_match_ratio_threshold)
-anchor_sf_contacts = AnchorSalesforceContactsDataframe(anchor_ns, salesforce)
+    # modules using pandas, openpyxl and fuzzywuzzy take seconds to import, so they are imported (here and by the
+    # functions above) once arguments are checked
+    from libs.name_matching import SCORERS
 
-save_dataframes_to_excel(args.result_file, {'Accounts': anchor_sf_accounts.df, 'Contacts': anchor_sf_contacts.df},
-                         wrap_text=False)
+    if args.account_name_scorer not in SCORERS:
+        parser.error(f'unknown account name scorer {args.account_name_scorer}, choose from {", ".join(SCORERS)}')
+    if args.profile_fuzzy_match:
+        metrics.profiled_stages['fuzzy_join'] = args.profile_fuzzy_match
 
+    if args.engine == 'sqlite':
+        reconciler = reconcile_out_of_core(args)
+        try:
+            # result rows are streamed from the working database to the writer
+            with metrics.span('export') as span:
+                span.rows_in = reconciler.get_row_count()
+                save_result(args, reconciler.get_results())
+        finally:
+            reconciler.close()
+    else:
+        sheets_dataframes = reconcile_in_memory(args)
+        with metrics.span('export') as span:
+            span.rows_in = sum(len(df) for df in sheets_dataframes.values())
+            save_result(args, sheets_dataframes)
+    if args.metrics_file:
+        metrics.save(args.metrics_file)
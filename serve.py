@@ -0,0 +1,36 @@
+import argparse
+
+from libs.name_matching import SCORERS
+from libs.score_cache import ScoreCache
+from libs.service import ReconciliationService, serve
+
+parser = argparse.ArgumentParser(description='Serve reconciliation of Anchor workbooks against Salesforce data kept '
+                                             'loaded between requests')
+parser.add_argument('-s', '--salesforce-file', help='Path to Salesforce Excel workbook; it is read again whenever it '
+                                                    'changes', required=True)
+parser.add_argument('--host', help='Host name or address to listen on', default='127.0.0.1')
+parser.add_argument('--port', type=int, help='Port to listen on', default=8765)
+parser.add_argument('-t', '--account-name-match-ratio-threshold', type=int,
+                    help='Default account name similarity ratio threshold. Number between 0 and 100.', default=75)
+parser.add_argument('-g', '--account-name-scorer', choices=SCORERS.keys(),
+                    help='Default account name similarity scorer', default='ratio')
+parser.add_argument('-k', '--contact-name-match-ratio-threshold', type=int,
+                    help='Default contact name similarity ratio threshold. By default, contacts are matched by '
+                         'e-mail only')
+parser.add_argument('-w', '--workers', type=int,
+                    help='Number of worker processes used for account name fuzzy matching', default=1)
+parser.add_argument('-c', '--score-cache',
+                    help='Path to SQLite file caching account name similarity ratios; by default, ratios are not '
+                         'cached')
+parser.add_argument('--score-cache-max-entries', type=int,
+                    help='Maximum number of cached similarity ratios; least recently used ones are evicted',
+                    default=ScoreCache.DEFAULT_MAX_ENTRIES)
+parser.add_argument('--snapshot-dir',
+                    help='Directory keeping snapshots of read workbooks. By default, snapshots are not used')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    serve(ReconciliationService(args.salesforce_file, args.account_name_match_ratio_threshold,
+                                args.account_name_scorer, args.contact_name_match_ratio_threshold, args.workers,
+                                args.score_cache, args.score_cache_max_entries, args.snapshot_dir),
+          args.host, args.port)
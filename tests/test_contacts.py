@@ -0,0 +1,76 @@
+import pytest
+from fuzzywuzzy import fuzz
+from openpyxl import Workbook
+
+from libs.data_model import AnchorNorthstarDataframe, AnchorSalesforceAccountsDataframe, \
+    AnchorSalesforceContactsDataframe, SalesForceDataframe
+from libs.schema import ANCHOR_COLUMNS, NORTHSTAR_COLUMNS, SALESFORCE_COLUMNS
+
+# contacts of Anchor account SF1 not matched by e-mail; Mary Majors has a namesake only in Salesforce account SF2
+ANCHOR_ROWS = [['SF1', 'Acme', 'John Smith', 'john@acme.com', 'L1', 'Active'],
+               ['SF1', 'Acme', 'Jon Smyth', 'jon@home.com', 'L2', 'Active'],
+               ['SF1', 'Acme', 'Zed Unknown', 'zed@home.com', 'L3', 'Active'],
+               ['SF1', 'Acme', 'Mary Majors', 'mary@home.com', 'L4', 'Active']]
+# the best match of Jon Smyth is not the first contact of the account
+SALESFORCE_ROWS = [['SF1', 'Acme', 'US', 'B1', 'Anchor', 'Jonathan', 'Smithers', 'jonathan@acme.com', None],
+                   ['SF1', 'Acme', 'US', 'B1', 'Anchor', 'John', 'Smith', 'john@acme.com', None],
+                   ['SF2', 'Globex', 'US', 'B2', 'Anchor', 'Mary', 'Major', 'mary@globex.com', None]]
+JON_SMYTH_RATIO = fuzz.ratio('jon smyth', 'john smith')
+
+
+def save_workbook(filepath, header, rows):
+    workbook = Workbook()
+    workbook.active.append(list(header))
+    for row in rows:
+        workbook.active.append(row)
+    workbook.save(filepath)
+    return str(filepath)
+
+
+@pytest.fixture(scope='module')
+def dataframes(tmp_path_factory):
+    dirpath = tmp_path_factory.mktemp('data')
+    anchor_ns = AnchorNorthstarDataframe(
+        save_workbook(dirpath / 'anchor.xlsx', ANCHOR_COLUMNS.values(), ANCHOR_ROWS),
+        save_workbook(dirpath / 'northstar.xlsx', NORTHSTAR_COLUMNS.values(),
+                      [[row[4], 'Administrator'] for row in ANCHOR_ROWS]))
+    salesforce = SalesForceDataframe(save_workbook(dirpath / 'salesforce.xlsx', SALESFORCE_COLUMNS.values(),
+                                                   SALESFORCE_ROWS))
+    return anchor_ns, salesforce, AnchorSalesforceAccountsDataframe(anchor_ns, salesforce)
+
+
+def get_matches(contacts):
+    """
+    :return: dictionary of Anchor contact names and pairs of matched Salesforce contact name and name ratio
+    """
+    df = contacts.df.set_index(contacts.anchor_contact_name.name)
+    ratios = df[contacts.match_name_fuzzy_ratio.name] if contacts.match_name_fuzzy_ratio.name in df else None
+    return {name: (f'{row[contacts.sf_contact_first_name.name]} {row[contacts.sf_contact_last_name.name]}'
+                   if isinstance(row[contacts.sf_contact_email.name], str) else None,
+                   None if ratios is None or ratios.isnull()[name] else ratios[name])
+            for name, row in df.iterrows()}
+
+
+def test_contacts_matched_by_email_only(dataframes):
+    anchor_ns, salesforce, accounts = dataframes
+    for contacts in [AnchorSalesforceContactsDataframe(anchor_ns, salesforce),
+                     AnchorSalesforceContactsDataframe(anchor_ns, salesforce, accounts)]:
+        assert contacts.match_name_fuzzy_ratio.name not in contacts.df
+        assert list(contacts.df.columns) == [c.name for c in contacts.get_result_columns().values()]
+        assert get_matches(contacts) == {'John Smith': ('John Smith', None), 'Jon Smyth': (None, None),
+                                         'Zed Unknown': (None, None), 'Mary Majors': (None, None)}
+
+
+def test_contacts_matched_by_name(dataframes):
+    contacts = AnchorSalesforceContactsDataframe(*dataframes, name_fuzzy_match_ratio_threshold=50)
+    assert list(contacts.df.columns) == [c.name for c in contacts.get_result_columns(name_matched=True).values()]
+    # contacts matched by e-mail have no ratio; Mary Majors is compared only with contacts of the matched account
+    assert get_matches(contacts) == {'John Smith': ('John Smith', None), 'Jon Smyth': ('John Smith', JON_SMYTH_RATIO),
+                                     'Zed Unknown': (None, None), 'Mary Majors': (None, None)}
+    assert fuzz.ratio('mary majors', 'mary major') >= 50
+
+
+@pytest.mark.parametrize('threshold, matched', [(JON_SMYTH_RATIO, True), (JON_SMYTH_RATIO + 1, False)])
+def test_contact_name_match_threshold(dataframes, threshold, matched):
+    contacts = AnchorSalesforceContactsDataframe(*dataframes, name_fuzzy_match_ratio_threshold=threshold)
+    assert get_matches(contacts)['Jon Smyth'] == (('John Smith', JON_SMYTH_RATIO) if matched else (None, None))
@@ -0,0 +1,30 @@
+import subprocess
+import sys
+from os import listdir, path
+
+import pytest
+
+from benchmarks.synthetic_data import SyntheticDataGenerator
+
+ROOT_DIRPATH = path.dirname(path.dirname(path.abspath(__file__)))
+
+
+def run_reconciliation(filepaths, result_dirpath, engine):
+    subprocess.run([sys.executable, path.join(ROOT_DIRPATH, 'run.py'), '--anchor-file', filepaths['anchor'],
+                    '--northstar-file', filepaths['northstar'], '--salesforce-file', filepaths['salesforce'],
+                    '--result-format', 'csv', '--result-file', result_dirpath, '--engine', engine],
+                   check=True, capture_output=True, cwd=ROOT_DIRPATH)
+    results = {}
+    for filename in sorted(listdir(result_dirpath)):
+        with open(path.join(result_dirpath, filename), 'rb') as f:
+            results[filename] = f.read()
+    return results
+
+
+@pytest.mark.parametrize('rows, seed', [(500, 0), (2000, 1)])
+def test_sqlite_engine_result_is_the_same_as_pandas_engine_one(tmp_path, rows, seed):
+    filepaths = SyntheticDataGenerator(rows, name_noise=0.5, seed=seed).generate(str(tmp_path / 'data'))
+    pandas_results = run_reconciliation(filepaths, str(tmp_path / 'pandas'), 'pandas')
+    sqlite_results = run_reconciliation(filepaths, str(tmp_path / 'sqlite'), 'sqlite')
+    assert list(pandas_results) == ['Accounts.csv', 'Contacts.csv']
+    assert sqlite_results == pandas_results
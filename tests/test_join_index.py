@@ -0,0 +1,46 @@
+import pytest
+from numpy import nan
+from pandas import DataFrame, merge
+from pandas.testing import assert_frame_equal
+
+from libs.join_index import JoinIndex
+
+LEFT = DataFrame({'id': range(9), 'key': ['b', 'a', None, 'x', 'A', 'b', nan, 'c', 'a']},
+                 index=[10, 3, 5, 7, 1, 2, 8, 0, 4])
+TABLE = DataFrame({'table_key': ['a', 'b', 'a', None, 'c', 'B', 'a', nan, 'd'],
+                   'value': [1, 2, 3, 4, 5, 6, 7, 8, 9],
+                   'label': ['a1', 'b1', 'a2', 'null1', 'c1', 'B1', 'a3', 'null2', 'd1']},
+                  index=[4, 6, 1, 2, 0, 8, 3, 5, 7])
+RIGHT_COLUMNS = {'value': 'Table value', 'label': 'Table label'}
+
+
+def merge_with_pandas(left, table, left_key='key', table_key='table_key'):
+    """
+    Reference result: `pandas.merge(how='left')` of left rows and the table columns
+    """
+    right = table[[table_key] + list(RIGHT_COLUMNS)].rename(columns=RIGHT_COLUMNS)
+    result = merge(left, right, how='left', left_on=left_key, right_on=table_key)
+    return result[list(left.columns) + list(RIGHT_COLUMNS.values())]
+
+
+@pytest.mark.parametrize('table', [TABLE, TABLE.iloc[::-1], TABLE.iloc[:0], TABLE.dropna()])
+def test_left_join_is_the_same_as_pandas_merge(table):
+    result = JoinIndex(table, 'table_key').left_join(LEFT, 'key', RIGHT_COLUMNS)
+    assert_frame_equal(result, merge_with_pandas(LEFT, table))
+
+
+def test_left_join_without_matching_nulls():
+    result = JoinIndex(TABLE, 'table_key', match_nulls=False).left_join(LEFT, 'key', RIGHT_COLUMNS)
+    # null keys are replaced by a key which is not in the table, then restored by unique ids of left rows
+    expected = merge_with_pandas(LEFT.assign(key=LEFT['key'].fillna('no match')), TABLE)
+    expected['key'] = LEFT.set_index('id')['key'].reindex(expected['id']).values
+    assert_frame_equal(result, expected)
+
+
+def test_left_join_of_normalized_keys():
+    result = JoinIndex(TABLE, 'table_key', normalize=lambda keys: keys.str.lower()).left_join(
+        LEFT, 'key', RIGHT_COLUMNS)
+    left = LEFT.assign(normalized_key=LEFT['key'].str.lower())
+    expected = merge_with_pandas(left, TABLE.assign(normalized_key=TABLE['table_key'].str.lower()),
+                                 'normalized_key', 'normalized_key')
+    assert_frame_equal(result, expected.drop(columns='normalized_key'))
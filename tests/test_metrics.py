@@ -0,0 +1,35 @@
+from types import SimpleNamespace
+
+import pytest
+
+from libs import metrics as metrics_module
+from libs.metrics import Metrics, get_peak_rss_mb, get_rss_mb
+
+
+@pytest.mark.parametrize('platform, ru_maxrss', [('linux', 3 * 1024), ('darwin', 3 * 1024 ** 2)])
+def test_peak_rss_is_in_megabytes(monkeypatch, platform, ru_maxrss):
+    monkeypatch.setattr(metrics_module.sys, 'platform', platform)
+    monkeypatch.setattr(metrics_module, 'getrusage', lambda who: SimpleNamespace(ru_maxrss=ru_maxrss))
+    assert get_peak_rss_mb(rss_mb=1) == 3
+
+
+@pytest.mark.skipif(get_rss_mb() is None, reason='RSS cannot be measured on this platform')
+def test_span_has_rss_at_start_and_end():
+    metrics = Metrics()
+    with metrics.span('stage'):
+        data = bytearray(64 * 1024 ** 2)
+        data[::4096] = b'x' * len(data[::4096])
+    span, = metrics.pop_spans()
+    assert span.rss_end_mb - span.rss_start_mb >= 50
+    assert span.lifetime_peak_rss_mb >= max(span.rss_start_mb, span.rss_end_mb)
+    assert set(span.to_dict()) >= {'rss_start_mb', 'rss_end_mb', 'lifetime_peak_rss_mb'}
+
+
+@pytest.mark.parametrize('rss_mb, expected', [(5.5, 5.5), (2, 3), (None, 3)])
+def test_peak_rss_is_never_below_current_rss(monkeypatch, rss_mb, expected):
+    monkeypatch.setattr(metrics_module.sys, 'platform', 'linux')
+    monkeypatch.setattr(metrics_module, 'getrusage', lambda who: SimpleNamespace(ru_maxrss=3 * 1024))
+    monkeypatch.setattr(metrics_module, 'get_rss_mb', lambda: rss_mb)
+    assert get_peak_rss_mb() == expected
+    if rss_mb is not None:
+        assert get_peak_rss_mb(rss_mb) == expected
@@ -0,0 +1,107 @@
+import pytest
+from fuzzywuzzy import fuzz, process
+from openpyxl import Workbook
+
+from libs.data_model import AnchorNorthstarDataframe, AnchorSalesforceAccountsDataframe, SalesForceDataframe
+from libs.name_matching import CachedScorer, NameMatchIndex, SCORERS, extract_many, normalize_name
+from libs.schema import ANCHOR_COLUMNS, NORTHSTAR_COLUMNS, SALESFORCE_COLUMNS
+
+FUZZ_FUNCTIONS = {'ratio': fuzz.ratio, 'token_sort': fuzz.token_sort_ratio, 'token_set': fuzz.token_set_ratio}
+THRESHOLDS = [0, 1, 50, 75, 90, 100]
+
+NAMES = ['Acme Inc', 'ACME, Inc.', 'Acme Corp', 'Acme', 'acme ltd', 'Acme Inc', 'Inc Acme', 'Acme Acme Corp',
+         'Globex', 'Globex Corporation', 'Initech', 'Umbrella', 'Umbrella Corp', 'Wayne Enterprises', 'Wayne',
+         'Müller GmbH', 'Mueller GmbH', 'Société Générale', 'Societe Generale', '日本電気', 'Σίγμα Sigma',
+         'a', 'A', 'b', 'ab', 'ba', '', ' ', '!!!', '123', '1234 Main']
+QUERIES = ['Acme Inc', 'acme', 'Corp Acme', 'Globex Corp', 'Umbrela', 'Muller', 'Société', 'Sigma', '日本',
+           'a', 'z', '', '!!!', '12', 'Wayne Ent']
+
+
+def extract_with_fuzzywuzzy(query, scorer_name, threshold, limit):
+    """
+    Reference result: `process.extract` over all names filtered by threshold
+    """
+    matches = process.extract(query, NAMES, scorer=FUZZ_FUNCTIONS[scorer_name], limit=len(NAMES))
+    return [(name, score) for name, score in matches if score >= threshold][:limit]
+
+
+@pytest.mark.parametrize('scorer_name', list(SCORERS))
+@pytest.mark.parametrize('threshold', THRESHOLDS)
+@pytest.mark.parametrize('limit', [10, len(NAMES)])
+def test_extract_is_the_same_as_fuzzywuzzy(scorer_name, threshold, limit):
+    index = NameMatchIndex(NAMES, SCORERS[scorer_name])
+    for query in QUERIES:
+        expected = extract_with_fuzzywuzzy(query, scorer_name, threshold, limit)
+        assert index.extract(query, threshold, limit) == expected, query
+
+
+@pytest.mark.parametrize('scorer_name', list(SCORERS))
+def test_null_names_are_never_matched(scorer_name):
+    index = NameMatchIndex([None, 'Acme', float('nan'), 'Acme Inc'], SCORERS[scorer_name])
+    assert [name for name, _ in index.extract('Acme', 0)] == ['Acme', 'Acme Inc']
+
+
+def test_extract_many_in_worker_processes_is_the_same_as_in_current_process():
+    scorer = CachedScorer(SCORERS['token_sort'])
+    expected, expected_match_set = extract_many(NAMES, QUERIES, 50, scorer=SCORERS['token_sort'])
+    result, match_set = extract_many(NAMES, QUERIES, 50, workers=2, scorer=scorer)
+    assert result == expected
+    assert match_set.matches == expected_match_set.matches
+    # scores computed by workers are collected by the scorer of the current process
+    assert scorer.new_scores
+
+
+@pytest.mark.parametrize('names, expected', [
+    (['Acme, Inc.', 'ACME LLC', 'acme', 'Acme Co. Ltd.', 'Acme Company Inc', ' ACME  corp. '], 'acme'),
+    (['A.B.C. Corp', 'ABC'], 'abc'),
+    (['Müller GmbH', 'MÜLLER'], 'müller'),
+    # only trailing suffixes are stripped
+    (['Inc Acme'], 'incacme'),
+    (['Acme Inc Holdings'], 'acmeincholdings'),
+    # names consisting of suffixes only keep the first one, so they are neither empty nor matched with every name
+    (['Inc.', 'INC'], 'inc'),
+    (['Co. Ltd.', 'Co'], 'co'),
+    (['S.A.'], 'sa'),
+    ([None, float('nan'), '', ' ', '!!!', '.'], None),
+])
+def test_normalize_name(names, expected):
+    assert [normalize_name(name) for name in names] == [expected] * len(names)
+
+
+def save_workbook(filepath, header, rows):
+    workbook = Workbook()
+    workbook.active.append(list(header))
+    for row in rows:
+        workbook.active.append(row)
+    workbook.save(filepath)
+    return str(filepath)
+
+
+def test_match_stages(tmp_path):
+    # Anchor company names by the stage their accounts are expected to be matched at
+    anchor_rows = [['SF1', 'Acme', 'John Smith', 'john@acme.com', 'L1', 'Active'],
+                   ['X2', 'Hooli', 'Jane Doe', 'jane@hooli.com', 'L2', 'Active'],
+                   ['X3', 'Globex, Inc.', 'Hank Scorpio', 'hank@globex.com', 'L3', 'Active'],
+                   ['X4', 'Initech Systems', 'Bill Lumbergh', 'bill@initech.com', 'L4', 'Active'],
+                   ['X5', 'Umbrella', 'Albert Wesker', 'albert@umbrella.com', 'L5', 'Active']]
+    salesforce_rows = [['SF1', 'Acme Corporation', 'US', 'B1', 'Anchor', 'John', 'Smith', 'john@acme.com', None],
+                       ['SF2', 'Hooli XYZ', 'US', 'B2', 'Anchor', 'Jane', 'Doe', 'jane@hooli.com', 'L2'],
+                       ['SF3', 'GLOBEX LLC', 'US', 'B3', 'Anchor', 'Hank', 'Scorpio', 'hank@globex.com', None],
+                       ['SF4', 'Initech System', 'US', 'B4', 'Anchor', 'Bill', 'Lumbergh', 'bill@initech.com', None]]
+    anchor_ns = AnchorNorthstarDataframe(
+        save_workbook(tmp_path / 'anchor.xlsx', ANCHOR_COLUMNS.values(), anchor_rows),
+        save_workbook(tmp_path / 'northstar.xlsx', NORTHSTAR_COLUMNS.values(),
+                      [[row[4], 'Administrator'] for row in anchor_rows]))
+    salesforce = SalesForceDataframe(save_workbook(tmp_path / 'salesforce.xlsx', SALESFORCE_COLUMNS.values(),
+                                                   salesforce_rows))
+    accounts = AnchorSalesforceAccountsDataframe(anchor_ns, salesforce, 90)
+    # unmatched rows have nulls in Salesforce and match columns
+    df = accounts.df.set_index(accounts.anchor_company_name.name).astype(object)
+    df = df.where(df.notnull(), None)
+    assert df[accounts.match_stage.name].to_dict() == {
+        'Acme': accounts.MATCH_STAGE_SALESFORCE_ID, 'Hooli': accounts.MATCH_STAGE_LICENSE_KEY,
+        'Globex, Inc.': accounts.MATCH_STAGE_NORMALIZED_NAME, 'Initech Systems': accounts.MATCH_STAGE_FUZZY_NAME,
+        'Umbrella': None}
+    assert df[accounts.sf_company_name.name].to_dict() == {
+        'Acme': 'Acme Corporation', 'Hooli': 'Hooli XYZ', 'Globex, Inc.': 'GLOBEX LLC',
+        'Initech Systems': 'Initech System', 'Umbrella': None}
@@ -0,0 +1,17 @@
+from os import getpid
+
+import pytest
+
+from libs.pipeline import Pipeline
+
+
+@pytest.mark.parametrize('process_workers', [0, 2])
+def test_pipeline_runs_subprocess_stages_in_workers_unless_there_are_none(process_workers):
+    pipeline = Pipeline(process_workers=process_workers)
+    pipeline.add_stage('first', getpid, in_subprocess=True)
+    pipeline.add_stage('second', getpid, in_subprocess=True)
+    pipeline.add_stage('sum', lambda first, second: first + second, ['first', 'second'])
+    results = pipeline.run()
+    assert results['sum'] == results['first'] + results['second']
+    assert (results['first'] == getpid()) == (process_workers == 0)
+    assert (results['second'] == getpid()) == (process_workers == 0)
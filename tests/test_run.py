@@ -0,0 +1,47 @@
+import argparse
+import sys
+from types import ModuleType
+
+import pytest
+
+import run
+
+
+@pytest.mark.parametrize('cpus, size, expected', [(8, 2 * run.IN_PROCESS_MAX_INPUT_SIZE, 3),
+                                                  (2, 2 * run.IN_PROCESS_MAX_INPUT_SIZE, 2),
+                                                  (1, 2 * run.IN_PROCESS_MAX_INPUT_SIZE, 0),
+                                                  (None, 2 * run.IN_PROCESS_MAX_INPUT_SIZE, 0),
+                                                  (8, run.IN_PROCESS_MAX_INPUT_SIZE - 3, 0)])
+def test_process_workers(tmp_path, monkeypatch, cpus, size, expected):
+    filepaths = []
+    for name in ('anchor', 'northstar', 'salesforce'):
+        filepaths.append(str(tmp_path / f'{name}.xlsx'))
+        with open(filepaths[-1], 'wb') as f:
+            f.write(b'0' * (size // 3))
+    monkeypatch.setattr(run, 'cpu_count', lambda: cpus)
+    args = run.parser.parse_args(['-a', filepaths[0], '-n', filepaths[1], '-s', filepaths[2]])
+    assert run.get_process_workers(args) == expected
+
+
+@pytest.mark.parametrize('installed, expected', [(['pyarrow', 'fastparquet'], 'pyarrow'),
+                                                 (['fastparquet'], 'fastparquet'), ([], None)])
+def test_parquet_engine(monkeypatch, installed, expected):
+    for engine in run.PARQUET_ENGINES:
+        # modules set to None in sys.modules raise ImportError on import
+        monkeypatch.setitem(sys.modules, engine, ModuleType(engine) if engine in installed else None)
+    assert run.get_parquet_engine() == expected
+
+
+@pytest.mark.parametrize('value, expected', [('75', [75]), ('90,50,90', [50, 90]), ('0,100', [0, 100])])
+def test_thresholds(value, expected):
+    assert run.parse_thresholds(value) == expected
+
+
+@pytest.mark.parametrize('value', ['150,-5', '101', '-1', '75.5', '75,', 'high'])
+def test_invalid_thresholds(value, capsys):
+    with pytest.raises(argparse.ArgumentTypeError):
+        run.parse_thresholds(value)
+    with pytest.raises(SystemExit) as exc_info:
+        run.parser.parse_args(['-a', 'a.xlsx', '-n', 'n.xlsx', '-s', 's.xlsx', '-t', value])
+    assert exc_info.value.code == 2
+    assert 'account-name-match-ratio-threshold' in capsys.readouterr().err
@@ -0,0 +1,78 @@
+import re
+from zipfile import ZipFile
+
+import pytest
+from openpyxl import Workbook, load_workbook
+
+from libs.data_model import AnchorDataframe, NorthStarDataframe, SalesForceDataframe
+from libs.schema import ANCHOR_COLUMNS, NORTHSTAR_COLUMNS, SALESFORCE_COLUMNS, get_missing_columns, \
+    read_excel_header
+
+HEADERS = [['Name', 'Email', 'Status'],
+           ['Name', None, 'Status', None, 'Email'],
+           ['x005F_Name', 'Name & <Email>', ' ', 'Név', '名前'],
+           [1, 2.5, True, False, 'Name', '#N/A'],
+           []]
+
+
+def read_header_with_openpyxl(filepath):
+    """
+    Reference result: the first row read in openpyxl read-only mode
+    """
+    workbook = load_workbook(filepath, read_only=True, data_only=True, keep_links=False)
+    worksheet = workbook.worksheets[0]
+    worksheet.reset_dimensions()
+    header = list(next(worksheet.iter_rows(max_row=1, values_only=True), ()))
+    workbook.close()
+    return header
+
+
+def save_workbook(filepath, header, write_only=False, rows=10):
+    workbook = Workbook(write_only=write_only)
+    worksheet = workbook.create_sheet() if write_only else workbook.active
+    worksheet.append(header)
+    for row in range(rows):
+        worksheet.append([f'value {row}'] * 3)
+    workbook.save(filepath)
+    return str(filepath)
+
+
+@pytest.mark.parametrize('header', HEADERS)
+@pytest.mark.parametrize('write_only', [False, True])
+def test_read_excel_header_is_the_same_as_openpyxl(tmp_path, header, write_only):
+    filepath = save_workbook(tmp_path / 'book.xlsx', header, write_only)
+    assert read_excel_header(filepath) == read_header_with_openpyxl(filepath)
+
+
+def test_read_excel_header_reads_only_the_first_row(tmp_path):
+    filepath = save_workbook(tmp_path / 'book.xlsx', ['Name', 'Email'], write_only=True)
+    # write-only worksheets have no dimension element, the rest of the worksheet is made unreadable
+    broken_filepath = str(tmp_path / 'broken.xlsx')
+    with ZipFile(filepath) as source, ZipFile(broken_filepath, 'w') as target:
+        for item in source.infolist():
+            data = source.read(item.filename)
+            if item.filename == 'xl/worksheets/sheet1.xml':
+                assert b'<dimension' not in data
+                data = re.sub(rb'(</row>).*', rb'\1<row r="2"><c r="A2" t="s"><v>not closed', data, flags=re.DOTALL)
+            target.writestr(item, data)
+    assert read_excel_header(broken_filepath) == ['Name', 'Email']
+
+
+def test_read_excel_header_of_empty_first_row(tmp_path):
+    workbook = Workbook()
+    workbook.active['B2'] = 'Name'
+    workbook.save(tmp_path / 'book.xlsx')
+    assert read_excel_header(str(tmp_path / 'book.xlsx')) == []
+
+
+def test_get_missing_columns(tmp_path):
+    filepath = save_workbook(tmp_path / 'book.xlsx', ['Email', 'name', 'Status'])
+    assert get_missing_columns(filepath, ['Name', 'Email', 'Phone']) == ['Name', 'Phone']
+
+
+@pytest.mark.parametrize('columns, dataframe_class', [(ANCHOR_COLUMNS, AnchorDataframe),
+                                                      (NORTHSTAR_COLUMNS, NorthStarDataframe),
+                                                      (SALESFORCE_COLUMNS, SalesForceDataframe)])
+def test_mandatory_columns_are_source_columns_of_dataframes(columns, dataframe_class):
+    # every column read from source workbook is declared by schema, so that preflight checks it
+    assert columns == {attr: c.src_name for attr, c in dataframe_class._get_columns().items() if c.src_name is not None}
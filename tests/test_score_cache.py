@@ -0,0 +1,83 @@
+import pytest
+
+from libs import score_cache as score_cache_module
+from libs.name_matching import SCORERS
+from libs.score_cache import ScoreCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Time of the cache set by tests, so that entries are used in a known order
+    """
+    now = [0]
+    monkeypatch.setattr(score_cache_module, 'time', lambda: now[0])
+    return now
+
+
+def load_scores(filepath, names, **kwargs):
+    cache = ScoreCache(filepath, **kwargs)
+    cache.load(names)
+    scores = dict(cache.scorer.scores)
+    cache.close()
+    return scores
+
+
+def test_scores_persist_across_instances(tmp_path):
+    filepath = str(tmp_path / 'scores.db')
+    cache = ScoreCache(filepath)
+    score = cache.scorer('acme', 'acme inc')
+    cache.close()
+
+    cache = ScoreCache(filepath)
+    cache.load(['acme', 'globex'])
+    assert cache.scorer.scores == {('acme', 'acme inc'): score}
+    # the loaded score is not computed again, so there is nothing new to store
+    assert cache.scorer('acme', 'acme inc') == score == SCORERS['ratio']('acme', 'acme inc')
+    assert cache.scorer.pop_new_scores() == {}
+    cache.close()
+    # scores of other scorers are kept apart
+    assert load_scores(filepath, ['acme'], scorer='token_set') == {}
+
+
+def test_pairs_are_keyed_in_order(tmp_path):
+    filepath = str(tmp_path / 'scores.db')
+    cache = ScoreCache(filepath)
+    cache.scorer('acme', 'globex')
+    cache.close()
+    # scores are loaded by the first name of pairs, so the reversed pair does not share the entry
+    assert load_scores(filepath, ['acme']) == {('acme', 'globex'): SCORERS['ratio']('acme', 'globex')}
+    assert load_scores(filepath, ['globex']) == {}
+
+    cache = ScoreCache(filepath)
+    cache.load(['globex'])
+    cache.scorer('globex', 'acme')
+    assert list(cache.scorer.new_scores) == [('globex', 'acme')]
+    cache.close()
+    assert set(load_scores(filepath, ['acme', 'globex'])) == {('acme', 'globex'), ('globex', 'acme')}
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    filepath = str(tmp_path / 'scores.db')
+    cache = ScoreCache(filepath, max_entries=2)
+    cache.scorer('acme', 'x')
+    cache.scorer('globex', 'x')
+    cache.close()
+
+    clock[0] = 1
+    cache = ScoreCache(filepath, max_entries=2)
+    # loading marks scores of acme as used, so globex becomes the least recently used one
+    cache.load(['acme'])
+    cache.scorer('initech', 'x')
+    cache.close()
+    assert set(load_scores(filepath, ['acme', 'globex', 'initech'])) == {('acme', 'x'), ('initech', 'x')}
+
+
+def test_cache_within_max_entries_is_not_evicted(tmp_path):
+    filepath = str(tmp_path / 'scores.db')
+    cache = ScoreCache(filepath, max_entries=3)
+    for name in ('acme', 'globex', 'initech'):
+        cache.scorer(name, 'x')
+    cache.close()
+    assert set(load_scores(filepath, ['acme', 'globex', 'initech'])) == {('acme', 'x'), ('globex', 'x'),
+                                                                          ('initech', 'x')}
@@ -0,0 +1,83 @@
+import json
+from http.client import HTTPConnection
+from http.server import HTTPServer
+from threading import Thread
+
+import pytest
+from openpyxl import Workbook
+
+from libs.data_model import AnchorDataframe, NorthStarDataframe
+from libs.service import ReconciliationRequestHandler, get_reconcile_params
+
+
+def save_header_workbook(filepath, dataframe_class):
+    workbook = Workbook()
+    workbook.active.append([c.src_name for c in dataframe_class._get_columns().values() if c.src_name is not None])
+    workbook.save(filepath)
+    return str(filepath)
+
+
+@pytest.fixture
+def filepaths(tmp_path):
+    return {'anchor_file': save_header_workbook(tmp_path / 'anchor.xlsx', AnchorDataframe),
+            'northstar_file': save_header_workbook(tmp_path / 'northstar.xlsx', NorthStarDataframe)}
+
+
+class FailingService:
+    def reconcile(self, **kwargs):
+        raise ValueError('internal error')
+
+
+@pytest.fixture
+def server():
+    server = HTTPServer(('127.0.0.1', 0), ReconciliationRequestHandler)
+    server.service = FailingService()
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def post(server, body):
+    connection = HTTPConnection('127.0.0.1', server.server_port)
+    connection.request('POST', '/reconcile', body=body)
+    response = connection.getresponse()
+    status, content = response.status, json.loads(response.read())
+    connection.close()
+    return status, content
+
+
+def test_reconcile_params(filepaths):
+    params = dict(filepaths, threshold=80, name_scorer='token_set', contact_threshold=0)
+    assert get_reconcile_params(params) == {
+        'anchor_filepath': filepaths['anchor_file'], 'northstar_filepath': filepaths['northstar_file'],
+        'threshold': 80, 'name_scorer': 'token_set', 'contact_threshold': 0}
+    assert get_reconcile_params(filepaths)['threshold'] is None
+
+
+@pytest.mark.parametrize('params', [
+    [], {'anchor_file': 'anchor.xlsx'}, {'anchor_file': 1}, {'northstar_file': ['northstar.xlsx']},
+    {'anchor_file': 'missing.xlsx'}, {'northstar_file': 'anchor_file'},
+    {'threshold': '80'}, {'threshold': 80.5}, {'threshold': True}, {'threshold': -1}, {'contact_threshold': 101},
+    {'name_scorer': 'partial'}, {'name_scorer': 1},
+])
+def test_invalid_reconcile_params(filepaths, params):
+    if isinstance(params, dict):
+        params = dict(filepaths, **{name: filepaths.get(value, value) if isinstance(value, str) else value
+                                    for name, value in params.items()})
+    with pytest.raises(ValueError):
+        get_reconcile_params(params)
+
+
+def test_invalid_request_is_bad_request(server, filepaths):
+    assert post(server, b'not json')[0] == 400
+    status, content = post(server, json.dumps(dict(filepaths, threshold=200)))
+    assert status == 400
+    assert 'threshold' in content['error']
+
+
+def test_reconciliation_failure_is_server_error(server, filepaths):
+    status, content = post(server, json.dumps(filepaths))
+    assert status == 500
+    assert 'internal error' in content['error']
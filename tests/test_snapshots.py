@@ -0,0 +1,81 @@
+from os import listdir
+
+import pytest
+from openpyxl import Workbook
+
+from libs.data_model import DataframeColumn, NorthStarDataframe, RowFilter
+from libs.schema import NORTHSTAR_COLUMNS
+
+ROWS = [['L1', 'Administrator'], ['L2', 'Regular User'], ['L3', None]]
+
+
+def save_workbook(filepath, rows):
+    workbook = Workbook()
+    workbook.active.append(list(NORTHSTAR_COLUMNS.values()))
+    for row in rows:
+        workbook.active.append(row)
+    workbook.save(filepath)
+    return str(filepath)
+
+
+@pytest.fixture
+def parsed_workbooks(monkeypatch):
+    """
+    Paths of workbooks parsed instead of being read from snapshots
+    """
+    filepaths = []
+    read_excel = NorthStarDataframe._read_excel
+
+    def read_excel_spy(src_filepath, *args):
+        filepaths.append(src_filepath)
+        return read_excel(src_filepath, *args)
+
+    monkeypatch.setattr(NorthStarDataframe, '_read_excel', staticmethod(read_excel_spy))
+    return filepaths
+
+
+def change_file(monkeypatch, filepath):
+    save_workbook(filepath, ROWS + [['L4', 'Owner']])
+    return ['L1', 'L4']
+
+
+def change_column_storage(monkeypatch, filepath):
+    monkeypatch.setattr(NorthStarDataframe.license_key, 'storage', DataframeColumn.STORAGE_CATEGORY)
+    return ['L1']
+
+
+def change_column_name(monkeypatch, filepath):
+    monkeypatch.setattr(NorthStarDataframe.license_key, 'name', 'Northstar License Key')
+    return ['L1']
+
+
+def change_row_filters(monkeypatch, filepath):
+    row_filter = RowFilter(NorthStarDataframe.user_role, exclude_values=[NorthStarDataframe.USER_ROLE_REGULAR_USER])
+    monkeypatch.setattr(NorthStarDataframe, 'row_filters', [row_filter])
+    return ['L1', 'L3']
+
+
+def test_unchanged_workbook_is_read_from_snapshot(tmp_path, parsed_workbooks):
+    filepath = save_workbook(tmp_path / 'northstar.xlsx', ROWS)
+    df = NorthStarDataframe(filepath, str(tmp_path / 'snapshots')).df
+    assert parsed_workbooks == [filepath]
+    assert NorthStarDataframe(filepath, str(tmp_path / 'snapshots')).df.equals(df)
+    assert parsed_workbooks == [filepath]
+
+
+@pytest.mark.parametrize('change', [change_file, change_column_storage, change_column_name, change_row_filters])
+def test_snapshot_is_invalidated(tmp_path, monkeypatch, parsed_workbooks, change):
+    filepath = save_workbook(tmp_path / 'northstar.xlsx', ROWS)
+    snapshot_dir = str(tmp_path / 'snapshots')
+    NorthStarDataframe(filepath, snapshot_dir)
+    NorthStarDataframe(filepath, snapshot_dir)
+    assert parsed_workbooks == [filepath]
+
+    license_keys = change(monkeypatch, filepath)
+    df = NorthStarDataframe(filepath, snapshot_dir).df
+    assert parsed_workbooks == [filepath, filepath]
+    assert df[NorthStarDataframe.license_key.name].to_list() == license_keys
+    # the new snapshot replaces the outdated one and is used by the next read
+    assert len(listdir(snapshot_dir)) == 1
+    assert NorthStarDataframe(filepath, snapshot_dir).df.equals(df)
+    assert parsed_workbooks == [filepath, filepath]
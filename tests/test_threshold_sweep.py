@@ -0,0 +1,35 @@
+import pytest
+from pandas.testing import assert_frame_equal
+
+from benchmarks.synthetic_data import SyntheticDataGenerator
+from libs.data_model import AnchorNorthstarDataframe, AnchorSalesforceAccountsDataframe, SalesForceDataframe
+
+THRESHOLDS = [50, 60, 75, 90, 100]
+
+
+@pytest.fixture(scope='module')
+def dataframes(tmp_path_factory):
+    filepaths = SyntheticDataGenerator(300, name_noise=0.6, seed=1).generate(str(tmp_path_factory.mktemp('data')))
+    return AnchorNorthstarDataframe(filepaths['anchor'], filepaths['northstar']), \
+        SalesForceDataframe(filepaths['salesforce'])
+
+
+@pytest.mark.parametrize('name_scorer', ['ratio', 'token_set'])
+def test_threshold_result_is_the_same_as_reconciliation_with_the_threshold(dataframes, name_scorer):
+    anchor_ns, salesforce = dataframes
+    sweep = AnchorSalesforceAccountsDataframe(anchor_ns, salesforce, THRESHOLDS[0], name_scorer=name_scorer)
+    name_matches = []
+    for threshold in THRESHOLDS:
+        df, matches = sweep.get_threshold_result(threshold)
+        accounts = AnchorSalesforceAccountsDataframe(anchor_ns, salesforce, threshold, name_scorer=name_scorer)
+        assert_frame_equal(df, accounts.df)
+        assert matches == accounts.get_threshold_result(threshold)[1]
+        name_matches.append(matches['name'])
+    # thresholds do make a difference, so the sweep is actually tested
+    assert name_matches[0] > name_matches[-1]
+
+
+def test_threshold_result_below_reconciliation_threshold(dataframes):
+    accounts = AnchorSalesforceAccountsDataframe(*dataframes, 75)
+    with pytest.raises(ValueError):
+        accounts.get_threshold_result(70)
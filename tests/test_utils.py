@@ -0,0 +1,101 @@
+from datetime import datetime
+
+import pytest
+from openpyxl import Workbook, load_workbook
+from pandas import read_excel
+from pandas.testing import assert_frame_equal
+
+from libs.utils import _insert_worksheet_rows, read_excel_columns
+
+COLUMNS = ['Name', 'Value', 'Flag', 'Date']
+ROWS = [['Acme', 1, True, datetime(2020, 1, 2)],
+        ['Acme', 1, True, datetime(2020, 1, 2)],
+        ['Globex', 2.5, None, None],
+        [None, None, None, None],
+        ['Initech', '12', 'FALSE', datetime(2021, 3, 4)],
+        ['Umbrella', 3, False, None],
+        ['Acme', 1, True, datetime(2020, 1, 2)],
+        ['NA', 'text', 'TRUE', 'not a date'],
+        ['Wayne', 4, None, datetime(2022, 5, 6)]]
+
+
+def save_workbook(filepath, rows):
+    workbook = Workbook()
+    worksheet = workbook.active
+    worksheet.append(COLUMNS + ['Other'])
+    for row in rows:
+        worksheet.append(row + ['ignored'])
+    workbook.save(filepath)
+    return filepath
+
+
+@pytest.mark.parametrize('rows', [ROWS, ROWS[:4], ROWS[4:], [row[:1] + [None] * 3 for row in ROWS]])
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 100000])
+@pytest.mark.parametrize('drop_duplicates', [True, False])
+def test_read_excel_columns_is_the_same_as_pandas(tmp_path, rows, chunk_size, drop_duplicates):
+    filepath = save_workbook(tmp_path / 'book.xlsx', rows)
+    expected = read_excel(filepath, usecols=COLUMNS)
+    if drop_duplicates:
+        expected = expected.drop_duplicates(ignore_index=True)
+    result = read_excel_columns(filepath, COLUMNS, drop_duplicates=drop_duplicates, chunk_size=chunk_size)
+    assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 100000])
+@pytest.mark.parametrize('rows, kept_values', [
+    # text of dropped rows keeps numeric texts of kept rows as they are
+    ([['00123', 'Administrator'], ['ABC-1', 'Regular User'], ['456', 'Administrator']], ['00123', '456']),
+    # empty values and floats of dropped rows turn integers of kept rows into floats
+    ([[1, 'Administrator'], [None, 'Regular User'], [2, None]], [1.0, 2.0]),
+    ([[1, 'Administrator'], [2.5, 'Regular User'], [2, None]], [1.0, 2.0]),
+    ([[True, 'Administrator'], ['text', 'Regular User'], ['FALSE', 3]], [True, 'FALSE']),
+])
+def test_read_excel_columns_infers_types_from_dropped_rows(tmp_path, chunk_size, rows, kept_values):
+    workbook = Workbook()
+    workbook.active.append(['Key', 'Role'])
+    for row in rows:
+        workbook.active.append(row)
+    workbook.save(tmp_path / 'book.xlsx')
+    row_filters = {'Role': lambda value: value != 'Regular User'}
+    expected = read_excel(tmp_path / 'book.xlsx', usecols=['Key'])
+    expected = expected[[row[1] != 'Regular User' for row in rows]].reset_index(drop=True)
+    result = read_excel_columns(tmp_path / 'book.xlsx', ['Key'], row_filters=row_filters, chunk_size=chunk_size)
+    assert_frame_equal(result, expected)
+    assert result['Key'].tolist() == kept_values
+
+
+def create_worksheet():
+    worksheet = Workbook().active
+    for row in range(1, 11):
+        worksheet.append(['%s%d' % (column, row) for column in 'ABCDE'])
+    worksheet.merge_cells('A1:B1')
+    worksheet.merge_cells('C2:D5')
+    worksheet.merge_cells('A7:B8')
+    worksheet.auto_filter.ref = 'A2:D9'
+    worksheet.freeze_panes = 'B3'
+    return worksheet
+
+
+@pytest.mark.parametrize('idx, merged_ranges, auto_filter, freeze_panes', [
+    (1, ['A4:B4', 'C5:D8', 'A10:B11'], 'A5:D12', 'B6'),
+    (2, ['A1:B1', 'C5:D8', 'A10:B11'], 'A5:D12', 'B6'),
+    (3, ['A1:B1', 'C2:D8', 'A10:B11'], 'A2:D12', 'B3'),
+    (6, ['A1:B1', 'C2:D5', 'A10:B11'], 'A2:D12', 'B3'),
+    (8, ['A1:B1', 'C2:D5', 'A7:B11'], 'A2:D12', 'B3'),
+    (11, ['A1:B1', 'C2:D5', 'A7:B8'], 'A2:D9', 'B3'),
+])
+def test_insert_worksheet_rows_moves_ranges(tmp_path, idx, merged_ranges, auto_filter, freeze_panes):
+    worksheet = create_worksheet()
+    _insert_worksheet_rows(worksheet, idx, 3)
+    assert sorted(cell_range.coord for cell_range in worksheet.merged_cells.ranges) == sorted(merged_ranges)
+    assert worksheet.auto_filter.ref == auto_filter
+    assert worksheet.freeze_panes == freeze_panes
+    assert all(worksheet.cell(row=row, column=5).value is None for row in range(idx, idx + 3))
+    assert worksheet.cell(row=idx + 3, column=5).value == ('E%d' % idx if idx <= 10 else None)
+
+    # moved ranges are consistent with cells, so the workbook is saved and read as is
+    worksheet.parent.save(tmp_path / 'book.xlsx')
+    saved_worksheet = load_workbook(tmp_path / 'book.xlsx').active
+    assert sorted(cell_range.coord for cell_range in saved_worksheet.merged_cells.ranges) == sorted(merged_ranges)
+    assert saved_worksheet.auto_filter.ref == auto_filter
+    assert saved_worksheet.freeze_panes == freeze_panes